@@ -0,0 +1,655 @@
+"""LLM plumbing shared by the email generation routes.
+
+Nothing here imports FastAPI or the emergentintegrations client; server.py
+wires those in. LlmResponseCache can persist to a Motor collection it is
+handed, and works in memory alone without one.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import math
+import random
+import string
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Limiter priorities: lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English prose)"""
+    return math.ceil(len(text) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` at a word boundary so it fits in roughly `max_tokens`"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 1:
+        return ""
+    cut = text[:max_chars - 1]
+    if " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip() + "…"
+
+
+async def retry_with_backoff(
+    operation: Callable[[], Awaitable[T]],
+    attempts: int = 3,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    sleep=asyncio.sleep,
+    rng: random.Random = random,
+) -> T:
+    """Await `operation()`, retrying failures with full-jitter exponential backoff"""
+    for attempt in range(attempts):
+        try:
+            return await operation()
+        except Exception as e:
+            if attempt == attempts - 1:
+                raise
+            delay = rng.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning(f"LLM call failed ({e}), retrying in {delay:.2f}s")
+            await sleep(delay)
+
+
+class LlmResponseCache:
+    """Content-addressed cache for LLM completions.
+
+    Entries are keyed on a hash of the model and the fully rendered prompt,
+    held in an in-memory LRU with a TTL, and optionally persisted to a Mongo
+    collection (with a TTL index on `expires_at`) so they survive restarts and
+    are shared between workers. Concurrent requests for the same key share a
+    single in-flight completion.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, collection=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+        self.clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.metrics = {"hits": 0, "persisted_hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    @staticmethod
+    def key(model: str, system_message: str, prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, system_message, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_local(self, key: str, value: str):
+        self._entries[key] = (value, self.clock() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """Return the cached completion for `key` without generating one"""
+        value = self._get_local(key)
+        if value is not None:
+            self.metrics["hits"] += 1
+            return value
+        if self.collection is not None:
+            doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+            if doc:
+                self.metrics["persisted_hits"] += 1
+                self._put_local(key, doc["response"])
+                return doc["response"]
+        return None
+
+    async def store(self, key: str, model: str, value: str):
+        """Cache a completion produced outside get_or_generate (e.g. streamed)"""
+        self._put_local(key, value)
+        if self.collection is not None:
+            now = datetime.utcnow()
+            try:
+                await self.collection.replace_one(
+                    {"_id": key},
+                    {"_id": key, "model": model, "response": value, "created_at": now,
+                     "expires_at": now + timedelta(seconds=self.ttl_seconds)},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"Could not persist LLM cache entry: {e}")
+
+    async def _load(self, key: str, model: str, generate: Callable[[], Awaitable[str]]) -> str:
+        if self.collection is not None:
+            doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+            if doc:
+                self.metrics["persisted_hits"] += 1
+                self._put_local(key, doc["response"])
+                return doc["response"]
+
+        self.metrics["misses"] += 1
+        try:
+            value = await generate()
+        except Exception:
+            self.metrics["errors"] += 1
+            raise
+        await self.store(key, model, value)
+        return value
+
+    def inflight(self, key: str) -> Optional[Awaitable[str]]:
+        """The completion another caller is producing for `key`, if any, to await"""
+        task = self._inflight.get(key)
+        if task is None:
+            return None
+        self.metrics["coalesced"] += 1
+        return asyncio.shield(task)
+
+    def begin(self, key: str) -> asyncio.Future:
+        """Mark `key` in flight for a completion produced outside get_or_generate (e.g. streamed).
+
+        Concurrent callers for the key wait on the returned future, which the
+        producer resolves with the completion or fails; it leaves the
+        in-flight table once done.
+        """
+        future = asyncio.get_running_loop().create_future()
+
+        def finished(done: asyncio.Future):
+            self._inflight.pop(key, None)
+            if not done.cancelled():
+                done.exception()  # a failure nobody waited on is not an error here
+
+        self._inflight[key] = future
+        future.add_done_callback(finished)
+        return future
+
+    async def get_or_generate(self, key: str, model: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """Return the cached completion for `key`, calling `generate()` at most once"""
+        value = self._get_local(key)
+        if value is not None:
+            self.metrics["hits"] += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            # Run the completion in its own task so a disconnecting caller
+            # does not cancel it for everyone else waiting on the same key
+            task = asyncio.ensure_future(self._load(key, model, generate))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.metrics["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "persisted": self.collection is not None,
+        }
+
+
+class FakeUserMessage:
+    """Offline stand-in for emergentintegrations' UserMessage"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeLlmChat:
+    """Offline stand-in for emergentintegrations' LlmChat.
+
+    Enabled with LLM_FAKE=true. Answers every message with a well-formed email
+    JSON document after `latency` seconds, and fails a `failure_rate` fraction
+    of calls, so batch generation, retries and caching can be exercised
+    without a provider.
+    """
+
+    def __init__(self, api_key: str = "", session_id: str = "", system_message: str = "",
+                 latency: float = 0.0, failure_rate: float = 0.0, rng: random.Random = random):
+        self.session_id = session_id
+        self.system_message = system_message
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng
+        self.model = None
+
+    def with_model(self, provider: str, model: str) -> "FakeLlmChat":
+        self.model = f"{provider}/{model}"
+        return self
+
+    def with_max_tokens(self, max_tokens: int) -> "FakeLlmChat":
+        return self
+
+    def _completion(self, message: FakeUserMessage) -> str:
+        digest = hashlib.sha256(message.text.encode("utf-8")).hexdigest()[:8]
+        return json.dumps({
+            "subject": f"Draft {digest}",
+            "body": f"Hello,\n\nThis is an offline draft generated by FakeLlmChat ({digest}).\n\nBest regards",
+            "personalization_notes": [f"fake completion for session {self.session_id}"],
+        })
+
+    async def send_message(self, message: FakeUserMessage) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise RuntimeError("simulated provider failure")
+        return self._completion(message)
+
+    async def stream_message(self, message: FakeUserMessage, chunk_size: int = 8) -> AsyncIterator[str]:
+        """Yield the completion in small chunks, spreading `latency` across them"""
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise RuntimeError("simulated provider failure")
+        completion = self._completion(message)
+        chunks = [completion[i:i + chunk_size] for i in range(0, len(completion), chunk_size)]
+        for chunk in chunks:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(chunks))
+            yield chunk
+
+
+async def stream_chat(chat, message, litellm_params: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """Yield a chat completion as it is produced.
+
+    Uses the client's `stream_message` when it has one; otherwise streams
+    `litellm_params` straight through litellm (which emergentintegrations
+    wraps), and as a last resort yields the whole completion as one chunk.
+    """
+    if hasattr(chat, "stream_message"):
+        async for chunk in chat.stream_message(message):
+            yield chunk
+        return
+    try:
+        import litellm
+    except ImportError:
+        litellm = None
+    if litellm is None or litellm_params is None:
+        yield await chat.send_message(message)
+        return
+    response = await litellm.acompletion(**litellm_params, stream=True)
+    async for chunk in response:
+        text = chunk.choices[0].delta.content
+        if text:
+            yield text
+
+
+_JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class IncrementalEmailParser:
+    """Streaming parser for the email JSON the generation prompt asks for.
+
+    Accepts the completion in arbitrary chunks and returns, for each chunk,
+    the text appended to each top-level string field (subject, body, ...).
+    Lists of strings (personalization_notes) are collected as they close.
+    Prose or code fences before the opening brace are skipped, and a
+    truncated document still yields everything received so far.
+    """
+
+    def __init__(self):
+        self.text: List[str] = []
+        self.fields: Dict[str, Any] = {}
+        self.started = False
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._string_is_key = False
+        self._expect_key = False
+        self._escape: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+        self._key: List[str] = []
+        self._current_key: Optional[str] = None
+        self._array_key: Optional[str] = None
+
+    def feed(self, chunk: str) -> Dict[str, str]:
+        self.text.append(chunk)
+        deltas: Dict[str, str] = {}
+        for ch in chunk:
+            if self.done:
+                break
+            if not self.started:
+                if ch == "{":
+                    self.started, self._depth, self._expect_key = True, 1, True
+                continue
+            if self._in_string:
+                self._string_char(ch, deltas)
+            else:
+                self._structural_char(ch)
+        return deltas
+
+    def _structural_char(self, ch: str):
+        if ch == '"':
+            self._in_string = True
+            self._string_is_key = self._depth == 1 and self._expect_key
+            if self._string_is_key:
+                self._key = []
+            elif self._depth == 1 and self._current_key is not None:
+                self.fields[self._current_key] = ""
+            elif self._depth == 2 and self._array_key is not None:
+                self.fields[self._array_key].append("")
+        elif ch == "[":
+            self._depth += 1
+            if self._depth == 2 and self._current_key is not None:
+                self._array_key = self._current_key
+                self.fields[self._array_key] = []
+        elif ch == "]":
+            self._depth -= 1
+            self._array_key = None
+        elif ch == "{":
+            self._depth += 1
+        elif ch == "}":
+            self._depth -= 1
+            self.done = self._depth == 0
+        elif ch == "," and self._depth == 1:
+            self._expect_key = True
+
+    def _string_char(self, ch: str, deltas: Dict[str, str]):
+        if self._escape is not None:
+            if self._escape == "":
+                if ch == "u":
+                    self._escape = "u"
+                    return
+                self._escape = None
+                self._emit(_JSON_ESCAPES.get(ch, ch), deltas)
+                return
+            self._escape += ch
+            if len(self._escape) < 5:
+                return
+            code = int(self._escape[1:], 16) if all(c in "0123456789abcdefABCDEF" for c in self._escape[1:]) else 0xFFFD
+            self._escape = None
+            if 0xD800 <= code < 0xDC00:
+                self._high_surrogate = code
+                return
+            if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+                code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self._high_surrogate = None
+            self._emit(chr(code) if not 0xD800 <= code < 0xE000 else "\ufffd", deltas)
+            return
+        if ch == "\\":
+            self._escape = ""
+        elif ch == '"':
+            self._in_string = False
+            if self._string_is_key:
+                self._current_key = "".join(self._key)
+                self._expect_key = False
+        else:
+            self._emit(ch, deltas)
+
+    def _emit(self, text: str, deltas: Dict[str, str]):
+        if self._string_is_key:
+            self._key.append(text)
+        elif self._depth == 1 and self._current_key is not None:
+            self.fields[self._current_key] += text
+            deltas[self._current_key] = deltas.get(self._current_key, "") + text
+        elif self._depth == 2 and self._array_key is not None:
+            self.fields[self._array_key][-1] += text
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Fields parsed so far, or None if the completion contained no JSON object"""
+        return dict(self.fields) if self.started else None
+
+    def full_text(self) -> str:
+        return "".join(self.text)
+
+
+class LlmClientPool:
+    """Process-wide LLM client layer.
+
+    Owns one keep-alive HTTP connection pool that every completion goes
+    through: it is installed as litellm's async session, which is what
+    emergentintegrations' LlmChat calls into, so chats built per request
+    reuse warm connections instead of opening new ones. When httpx/litellm
+    are not importable (offline, fake client) the pool only builds chats.
+    """
+
+    def __init__(self, chat_factory: Callable[[str, str], Any], max_connections: int = 20,
+                 max_keepalive_connections: int = 10, keepalive_expiry: float = 60.0, timeout: float = 120.0):
+        self.chat_factory = chat_factory
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.http_client = None
+        self.chats_created = 0
+
+    def start(self):
+        try:
+            import httpx
+            import litellm
+        except ImportError:
+            return
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=self.timeout,
+        )
+        litellm.aclient_session = self.http_client
+
+    def chat(self, session_id: str, system_message: str):
+        self.chats_created += 1
+        return self.chat_factory(session_id, system_message)
+
+    async def close(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"shared_http_client": self.http_client is not None, "chats_created": self.chats_created}
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "wakeup")
+
+    def __init__(self, priority: int, seq: int, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.wakeup: Optional[asyncio.Future] = None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LlmRateLimiter:
+    """Shared token-bucket limiter for provider requests/min and tokens/min.
+
+    Callers wait in a priority queue: only the highest-priority (then oldest)
+    waiter may draw from the buckets, so interactive requests overtake queued
+    bulk work. The clock and sleep functions are injectable so tests can run
+    the limiter on a simulated clock.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, clock=time.monotonic, sleep=asyncio.sleep):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = clock()
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self.metrics: Dict[int, Dict[str, float]] = {}
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _delay_for(self, tokens: int) -> float:
+        request_delay = (1 - self._requests) * 60 / self.requests_per_minute
+        token_delay = (tokens - self._tokens) * 60 / self.tokens_per_minute
+        return max(request_delay, token_delay, 0)
+
+    def _wake_head(self):
+        if self._waiters:
+            wakeup = self._waiters[0].wakeup
+            if wakeup is not None and not wakeup.done():
+                wakeup.set_result(None)
+
+    def _record_wait(self, priority: int, waited: float):
+        stats = self.metrics.setdefault(priority, {"granted": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0})
+        stats["granted"] += 1
+        stats["wait_seconds_total"] += waited
+        stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+
+    async def acquire(self, tokens: int = 0, priority: int = PRIORITY_INTERACTIVE):
+        """Wait until one request and `tokens` tokens may be spent"""
+        # A single oversized request would otherwise never fit the bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        entry = _Waiter(priority, next(self._seq), tokens)
+        heapq.heappush(self._waiters, entry)
+        enqueued = self.clock()
+        try:
+            while True:
+                if self._waiters[0] is entry:
+                    self._refill()
+                    delay = self._delay_for(tokens)
+                    if delay <= 0:
+                        heapq.heappop(self._waiters)
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        self._record_wait(priority, self.clock() - enqueued)
+                        self._wake_head()
+                        return
+                    await self.sleep(delay)
+                else:
+                    entry.wakeup = asyncio.get_running_loop().create_future()
+                    await entry.wakeup
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._wake_head()
+            raise
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once a call's real size is known"""
+        self._tokens -= actual_tokens - estimated_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "queue_depth": len(self._waiters),
+            "wait_by_priority": {
+                str(priority): {
+                    **stats,
+                    "wait_seconds_avg": stats["wait_seconds_total"] / stats["granted"] if stats["granted"] else 0.0,
+                }
+                for priority, stats in self.metrics.items()
+            },
+        }
+
+
+class RenderedPrompt(NamedTuple):
+    text: str
+    tokens: int
+    trimmed: List[str]
+
+
+class PromptTemplate:
+    """A prompt compiled once into literal segments and named slots.
+
+    `constants` are bound at compile time and folded into the literal text,
+    so rendering is a single join over the remaining slots. The token cost of
+    the static text is precomputed.
+    """
+
+    def __init__(self, template: str, constants: Optional[Dict[str, str]] = None):
+        constants = constants or {}
+        self.segments: List[Tuple[str, str]] = []
+        literal: List[str] = []
+        for text, field, _, _ in string.Formatter().parse(template):
+            literal.append(text)
+            if field is None:
+                continue
+            if field in constants:
+                literal.append(str(constants[field]))
+                continue
+            self.segments.append(("".join(literal), field))
+            literal = []
+        self.tail = "".join(literal)
+        self.slots = [field for _, field in self.segments]
+        self.static_tokens = estimate_tokens("".join(text for text, _ in self.segments) + self.tail)
+        self.renders = 0
+        self.trimmed_renders = 0
+        self.tokens_total = 0
+
+    def render(self, values: Dict[str, Any], optional: Sequence[str] = (), token_budget: Optional[int] = None) -> RenderedPrompt:
+        """Fill the slots; trim `optional` slots, in order, until the prompt fits `token_budget`"""
+        values = {slot: str(values.get(slot, "")) for slot in self.slots}
+        tokens = self.static_tokens + sum(estimate_tokens(values[slot]) for slot in self.slots)
+        trimmed = []
+        if token_budget is not None:
+            for slot in optional:
+                excess = tokens - token_budget
+                if excess <= 0:
+                    break
+                before = estimate_tokens(values[slot])
+                if not before:
+                    continue
+                values[slot] = truncate_to_tokens(values[slot], max(before - excess, 0))
+                tokens -= before - estimate_tokens(values[slot])
+                trimmed.append(slot)
+
+        self.renders += 1
+        self.trimmed_renders += bool(trimmed)
+        self.tokens_total += tokens
+        text = "".join(literal + values[slot] for literal, slot in self.segments) + self.tail
+        return RenderedPrompt(text, tokens, trimmed)
+
+
+class PromptRegistry:
+    """Compiled PromptTemplates for one prompt text, one per set of bound constants"""
+
+    def __init__(self, template: str, max_templates: int = 256):
+        self.template = template
+        self.max_templates = max_templates
+        self._compiled: "OrderedDict[tuple, PromptTemplate]" = OrderedDict()
+
+    def get(self, **constants: str) -> PromptTemplate:
+        key = tuple(sorted(constants.items()))
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = PromptTemplate(self.template, constants)
+            self._compiled[key] = compiled
+            while len(self._compiled) > self.max_templates:
+                self._compiled.popitem(last=False)
+        else:
+            self._compiled.move_to_end(key)
+        return compiled
+
+    def stats(self) -> Dict[str, Any]:
+        renders = sum(t.renders for t in self._compiled.values())
+        return {
+            "compiled_templates": len(self._compiled),
+            "renders": renders,
+            "trimmed_renders": sum(t.trimmed_renders for t in self._compiled.values()),
+            "average_prompt_tokens": sum(t.tokens_total for t in self._compiled.values()) / renders if renders else 0,
+        }
@@ -0,0 +1,218 @@
+"""Outbound email plumbing for campaign sends.
+
+Transports share one interface, `async send(message)`, so the dispatcher does
+not care where mail goes: `SmtpTransport` keeps a pool of persistent SMTP
+connections (point it at a local debugging server such as
+``python -m aiosmtpd -n -l localhost:1025`` during development) and
+`MemoryTransport` keeps messages in memory for offline runs.
+`DomainThrottle` spaces sends per recipient domain so a large campaign does
+not trip provider rate limits.
+"""
+import asyncio
+import logging
+import smtplib
+import time
+from collections import deque
+from email.message import EmailMessage
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def build_message(sender: str, recipient: str, subject: str, body: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+
+def email_domain(address: str) -> str:
+    return address.rsplit("@", 1)[-1].strip().lower()
+
+
+class _SmtpSlot:
+    __slots__ = ("smtp",)
+
+    def __init__(self):
+        self.smtp: Optional[smtplib.SMTP] = None
+
+
+class SmtpTransport:
+    """Sends through a fixed pool of persistent SMTP connections.
+
+    smtplib is blocking, so each send runs in a worker thread on a connection
+    checked out of the pool; at most `pool_size` sends are in flight.
+    Connections are opened lazily and reopened once if the server dropped
+    them while idle.
+    """
+
+    def __init__(self, host: str, port: int, pool_size: int = 10, username: Optional[str] = None,
+                 password: Optional[str] = None, starttls: bool = False, timeout: float = 30.0,
+                 smtp_factory: Callable[..., smtplib.SMTP] = smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+        self._slots: Optional[asyncio.Queue] = None
+        self._all_slots: List[_SmtpSlot] = []
+        self._in_flight: Set[asyncio.Future] = set()
+        self.metrics = {"sent": 0, "failed": 0, "connections_opened": 0}
+
+    def _pool(self) -> asyncio.Queue:
+        if self._slots is None:
+            self._slots = asyncio.Queue()
+            self._all_slots = [_SmtpSlot() for _ in range(self.pool_size)]
+            for slot in self._all_slots:
+                self._slots.put_nowait(slot)
+        return self._slots
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password or "")
+        self.metrics["connections_opened"] += 1
+        return smtp
+
+    def _send_on(self, slot: _SmtpSlot, message: EmailMessage):
+        if slot.smtp is None:
+            slot.smtp = self._connect()
+        try:
+            slot.smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            slot.smtp = self._connect()
+            slot.smtp.send_message(message)
+
+    async def send(self, message: EmailMessage):
+        slot = await self._pool().get()
+        sending = asyncio.ensure_future(asyncio.to_thread(self._send_on, slot, message))
+        self._in_flight.add(sending)
+        sending.add_done_callback(lambda done: self._release(slot, done))
+        # Shielded: if the caller is cancelled the worker thread keeps the
+        # connection, and the slot only returns to the pool once it finishes
+        await asyncio.shield(sending)
+
+    def _release(self, slot: _SmtpSlot, sending: asyncio.Future):
+        self._in_flight.discard(sending)
+        if sending.cancelled():
+            # Event loop shutting down; the thread may still hold the connection
+            return
+        if sending.exception() is None:
+            self.metrics["sent"] += 1
+        else:
+            self.metrics["failed"] += 1
+            # Drop a connection in an unknown state rather than reuse it
+            self._discard(slot)
+        self._pool().put_nowait(slot)
+
+    @staticmethod
+    def _discard(slot: _SmtpSlot):
+        if slot.smtp is not None:
+            try:
+                slot.smtp.close()
+            except Exception:
+                pass
+            slot.smtp = None
+
+    def _quit_all(self):
+        for slot in self._all_slots:
+            if slot.smtp is not None:
+                try:
+                    slot.smtp.quit()
+                except Exception:
+                    pass
+                slot.smtp = None
+
+    async def close(self):
+        # Let sends still running in worker threads finish with their connections
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._all_slots:
+            await asyncio.to_thread(self._quit_all)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "transport": "smtp",
+            "pool_size": self.pool_size,
+            "open_connections": sum(1 for slot in self._all_slots if slot.smtp is not None),
+        }
+
+
+class MemoryTransport:
+    """Keeps the most recent messages in memory instead of sending them"""
+
+    def __init__(self, max_messages: int = 1000):
+        self.messages: Deque[EmailMessage] = deque(maxlen=max_messages)
+        self.sent = 0
+
+    async def send(self, message: EmailMessage):
+        self.messages.append(message)
+        self.sent += 1
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"transport": "memory", "sent": self.sent, "retained": len(self.messages)}
+
+
+class DomainThrottle:
+    """Per-recipient-domain token buckets.
+
+    Each domain may receive `per_minute` messages a minute with bursts of up
+    to `burst`; `acquire` waits until the domain has a token. Buckets that
+    have refilled completely are forgotten once more than `max_domains` are
+    tracked.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None, max_domains: int = 10000,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], Any] = asyncio.sleep):
+        self.rate = per_minute / 60.0
+        self.burst = burst if burst is not None else max(1.0, per_minute / 60.0)
+        self.max_domains = max_domains
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets: Dict[str, List[float]] = {}
+        self.metrics = {"acquired": 0, "throttled": 0, "throttled_seconds": 0.0}
+
+    def _refill(self, bucket: List[float], now: float):
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+
+    def _prune(self, now: float):
+        for domain, bucket in list(self._buckets.items()):
+            self._refill(bucket, now)
+            if bucket[0] >= self.burst:
+                del self._buckets[domain]
+
+    async def acquire(self, domain: str):
+        throttled = False
+        while True:
+            now = self.clock()
+            bucket = self._buckets.get(domain)
+            if bucket is None:
+                if len(self._buckets) >= self.max_domains:
+                    self._prune(now)
+                bucket = self._buckets[domain] = [self.burst, now]
+            self._refill(bucket, now)
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.metrics["acquired"] += 1
+                return
+            wait = (1 - bucket[0]) / self.rate
+            if not throttled:
+                self.metrics["throttled"] += 1
+                throttled = True
+            self.metrics["throttled_seconds"] += wait
+            await self.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.metrics, "domains_tracked": len(self._buckets), "per_minute": self.rate * 60}
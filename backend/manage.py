@@ -0,0 +1,197 @@
+"""Maintenance commands for the NetworkingAI backend.
+
+Run from the backend directory, e.g. ``python manage.py rebuild-analytics``.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from enum import Enum
+
+import typer
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+import server
+from server import (
+    CAMPAIGN_LIST_OMITTED,
+    Campaign,
+    Contact,
+    InteractionLog,
+    app,
+    check_query_plans,
+    client,
+    decay_relationship_strength,
+    ensure_indexes,
+    list_view_response,
+    model_rows,
+    rebuild_analytics_rollup,
+    rebuild_relationship_strength,
+    refresh_campaign_counts,
+    refresh_next_best_keys,
+    refresh_search_keys,
+    rescore_lead_scores,
+    sweep_orphans,
+)
+
+cli = typer.Typer(help="NetworkingAI maintenance commands")
+
+def run(coro):
+    """Run a coroutine against the shared Motor client, then close it"""
+    async def runner():
+        try:
+            return await coro
+        finally:
+            client.close()
+    return asyncio.run(runner())
+
+@cli.command("rebuild-analytics")
+def rebuild_analytics():
+    """Recompute the analytics rollup from scratch and report drift"""
+    rollup, drift = run(rebuild_analytics_rollup())
+    if not drift:
+        typer.echo("Analytics rollup rebuilt, no drift found")
+        return
+    typer.echo(f"Analytics rollup rebuilt, corrected drift on {len(drift)} counters:")
+    for field, values in drift.items():
+        typer.echo(f"  {field}: stored={values['stored']} actual={values['actual']}")
+
+@cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create every index in the registry"""
+    run(ensure_indexes())
+    typer.echo("Indexes ensured")
+
+@cli.command("check-indexes")
+def check_indexes():
+    """Explain every registered query shape and flag collection scans"""
+    plans = run(check_query_plans())
+    for plan in plans:
+        marker = "COLLSCAN" if plan["collscan"] else "ok"
+        typer.echo(f"{marker:>8}  {plan['collection']}: {plan['name']} ({' <- '.join(plan['stages'])})")
+    if any(plan["collscan"] for plan in plans):
+        raise typer.Exit(code=1)
+
+@cli.command("rebuild-relationship-strength")
+def rebuild_relationship_strength_command():
+    """Recompute every contact's interaction counters from the logs"""
+    updated = run(rebuild_relationship_strength())
+    typer.echo(f"Relationship strength rebuilt, {updated} contacts updated")
+
+@cli.command("decay-relationship-strength")
+def decay_relationship_strength_command():
+    """Age interactions out of the recent window now instead of waiting for the job"""
+    updated = run(decay_relationship_strength())
+    typer.echo(f"Relationship strength decayed, {updated} contacts updated")
+
+@cli.command("rebuild-search-keys")
+def rebuild_search_keys():
+    """Backfill the prefix and fuzzy search keys on every contact"""
+    updated = run(refresh_search_keys({}))
+    typer.echo(f"Search keys rebuilt, {updated} contacts updated")
+
+@cli.command("rebuild-next-best")
+def rebuild_next_best():
+    """Backfill the next-best ranking key on every contact"""
+    updated = run(refresh_next_best_keys({}))
+    typer.echo(f"Next-best ranking rebuilt, {updated} contacts updated")
+
+@cli.command("rebuild-campaign-counts")
+def rebuild_campaign_counts():
+    """Backfill contact_count on campaigns created before it was stored"""
+    updated = run(refresh_campaign_counts())
+    typer.echo(f"Campaign counts rebuilt, {updated} campaigns updated")
+
+@cli.command("rescore-leads")
+def rescore_leads(batch_size: int = typer.Option(10000, help="Contacts scored per batch")):
+    """Recompute every contact's lead score now instead of waiting for the nightly job"""
+    stats = run(rescore_lead_scores(batch_size=batch_size))
+    typer.echo(f"Lead scores rescored, {stats['updated']} of {stats['scanned']} contacts changed")
+
+@cli.command("sweep-orphans")
+def sweep_orphans_command():
+    """Delete interaction logs and campaign memberships of contacts that no longer exist"""
+    job = run(sweep_orphans())
+    if job.error:
+        typer.echo(f"Orphan sweep failed: {job.error}")
+        raise typer.Exit(code=1)
+    typer.echo(
+        f"Orphan sweep checked {job.contacts_checked} contact ids, removed "
+        f"{job.interaction_logs_deleted} interaction logs and updated {job.campaigns_updated} campaigns"
+    )
+
+def _stored(model) -> dict:
+    # Enums come back from Mongo as their string values
+    return {key: value.value if isinstance(value, Enum) else value for key, value in model.dict().items()}
+
+def _sample_docs(rows: int):
+    now = datetime.utcnow()
+    contacts = [
+        _stored(Contact(
+            name=f"Contact {i}", email=f"contact{i}@example.com", company="Acme", position="Engineer",
+            industry="Technology", notes="Met at the spring conference. " * 4, tags=["conference", "ai"],
+            last_contacted=now - timedelta(days=i % 30), last_interaction=now - timedelta(days=i % 30),
+        ))
+        for i in range(rows)
+    ]
+    campaigns = [
+        _stored(Campaign(name=f"Campaign {i}", description="Quarterly outreach", contact_count=250, scheduled_at=now))
+        for i in range(rows)
+    ]
+    interactions = [
+        _stored(InteractionLog(contact_id="c1", type="email_sent", subject=f"Hello {i}", content="Following up. " * 20))
+        for i in range(rows)
+    ]
+    # Each path's model and the fields its list omits, as the route passes them to model_rows
+    return {
+        "/api/contacts": (Contact, frozenset(), contacts),
+        "/api/campaigns": (Campaign, CAMPAIGN_LIST_OMITTED, campaigns),
+        "/api/interactions/{contact_id}": (InteractionLog, frozenset(), interactions),
+    }
+
+async def _validated_body(route, model, docs) -> bytes:
+    # What the route does today: validate into models, then FastAPI validates
+    # and serializes again against the response_model
+    content = await serialize_response(
+        field=route.response_field,
+        response_content=[model(**doc) for doc in docs],
+        exclude=route.response_model_exclude,
+    )
+    return JSONResponse(content).body
+
+def _fast_body(model, omitted, docs) -> bytes:
+    return list_view_response(Response(), model_rows(model, docs, omitted)).body
+
+def _best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+@cli.command("bench-serialization")
+def bench_serialization(
+    rows: int = typer.Option(1000, help="Rows per simulated page"),
+    repeat: int = typer.Option(20, help="Timed runs per path; the fastest is reported"),
+):
+    """Compare per-row response serialization cost of the validated and FAST_SERIALIZATION list paths"""
+    routes = {route.path: route for route in app.routes if "GET" in getattr(route, "methods", ())}
+    loop = asyncio.new_event_loop()
+    fast_setting = server.FAST_SERIALIZATION
+    typer.echo(f"{rows} rows per page, best of {repeat}; orjson {'available' if server.ORJSON_AVAILABLE else 'not installed'}")
+    typer.echo(f"{'endpoint':<36}{'validated us/row':>18}{'fast us/row':>14}{'speedup':>9}")
+    try:
+        for path, (model, omitted, docs) in _sample_docs(rows).items():
+            route = routes[path]
+            server.FAST_SERIALIZATION = False
+            validated = _best_of(repeat, lambda: loop.run_until_complete(_validated_body(route, model, docs)))
+            server.FAST_SERIALIZATION = True
+            fast = _best_of(repeat, lambda: _fast_body(model, omitted, docs))
+            typer.echo(f"GET {path:<32}{validated / rows * 1e6:>18.2f}{fast / rows * 1e6:>14.2f}{validated / fast:>8.1f}x")
+    finally:
+        server.FAST_SERIALIZATION = fast_setting
+        loop.close()
+
+if __name__ == "__main__":
+    cli()
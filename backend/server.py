@@ -1,16 +1,47 @@
-from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks, Depends, Query, Response, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from lead_scoring import LEAD_SCORE_FIELDS, rescore_contacts, score_contact
+from mailer import DomainThrottle, MemoryTransport, SmtpTransport, build_message, email_domain
+from templating import CompiledEmailTemplate, EmailTemplateCache, TemplateSyntaxError
+from llm import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    FakeLlmChat,
+    FakeUserMessage,
+    IncrementalEmailParser,
+    LlmClientPool,
+    LlmRateLimiter,
+    LlmResponseCache,
+    PromptRegistry,
+    estimate_tokens,
+    retry_with_backoff,
+    stream_chat,
+)
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Dict, Any, FrozenSet, Tuple
 import uuid
 from datetime import datetime, timedelta
 from enum import Enum
 import asyncio
+import base64
+import csv
+import functools
+import io
+import itertools
+import json
+import math
+import re
+import time
 
 # Try to import emergentintegrations, but handle gracefully if not available
 try:
@@ -20,9 +51,22 @@ except ImportError:
     EMERGENT_AVAILABLE = False
     print("WARNING: emergentintegrations not available. AI email generation will be disabled.")
 
+# orjson is in requirements.txt; without it the fast list path falls back to the stdlib encoder
+try:
+    import orjson  # noqa: F401
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Offline mode: answer every LLM call with FakeLlmChat instead of a provider
+LLM_FAKE = os.environ.get('LLM_FAKE', 'false').lower() == 'true'
+LLM_AVAILABLE = EMERGENT_AVAILABLE or LLM_FAKE
+if LLM_FAKE:
+    UserMessage = FakeUserMessage
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
@@ -67,6 +111,8 @@ class Contact(BaseModel):
     priority: Priority = Priority.MEDIUM
     lead_score: int = Field(default=50, ge=0, le=100)
     relationship_strength: int = Field(default=0, ge=0, le=100)
+    interaction_count: int = 0
+    recent_interaction_count: int = 0
     tags: List[str] = Field(default_factory=list)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -98,6 +144,69 @@ class ContactUpdate(BaseModel):
     priority: Optional[Priority] = None
     tags: Optional[List[str]] = None
 
+class RankedContact(Contact):
+    next_best_score: float
+
+class ContactSummary(BaseModel):
+    # The columns the contact list renders
+    id: str
+    name: str
+    email: str
+    company: Optional[str] = None
+    position: Optional[str] = None
+    industry: Optional[str] = None
+    status: ContactStatus = ContactStatus.NEW
+    priority: Priority = Priority.MEDIUM
+    lead_score: int = 50
+    last_contacted: Optional[datetime] = None
+    created_at: datetime
+
+class BulkRowError(BaseModel):
+    row: int
+    error: str
+
+class BulkImportResponse(BaseModel):
+    total_rows: int
+    inserted: int
+    failed: int
+    errors: List[BulkRowError] = Field(default_factory=list)
+    errors_truncated: bool = False
+    stopped_at_row: Optional[int] = None  # set when the rest of the file could not be parsed
+
+class ContactFilter(BaseModel):
+    status: Optional[ContactStatus] = None
+    priority: Optional[Priority] = None
+    tags: Optional[List[str]] = None
+    tag_match: str = Field(default="any", pattern="^(any|all)$")  # contacts carrying any or all of tags
+    industry: Optional[str] = None
+    company: Optional[str] = None
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class ContactFacets(BaseModel):
+    total: int
+    tags: List[FacetCount] = Field(default_factory=list)
+    industry: List[FacetCount] = Field(default_factory=list)
+    company: List[FacetCount] = Field(default_factory=list)
+
+class ContactBulkSelection(BaseModel):
+    # Exactly one of ids or filter selects the contacts to act on
+    ids: Optional[List[str]] = Field(default=None, max_length=10000)
+    filter: Optional[ContactFilter] = None
+
+class ContactBulkUpdate(ContactBulkSelection):
+    update: ContactUpdate = Field(default_factory=ContactUpdate)
+    add_tags: List[str] = Field(default_factory=list)
+    remove_tags: List[str] = Field(default_factory=list)
+
+class BulkWriteResponse(BaseModel):
+    matched: int
+    modified: int = 0
+    deleted: int = 0
+    cleanup_job_id: Optional[str] = None
+
 class EmailTemplate(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -112,12 +221,29 @@ class EmailTemplateCreate(BaseModel):
     body: str
     type: str
 
+class TemplateRenderRequest(BaseModel):
+    contact_ids: List[str] = Field(..., min_length=1, max_length=10000)
+
+class RenderedEmail(BaseModel):
+    contact_id: str
+    subject: str
+    body: str
+
+class TemplateRenderResponse(BaseModel):
+    template_id: str
+    rendered: List[RenderedEmail]
+    missing_contact_ids: List[str] = Field(default_factory=list)
+
 class Campaign(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     description: Optional[str] = None
     status: CampaignStatus = CampaignStatus.DRAFT
+    # Targets either a static list of contact_ids or a saved contact_filter
     contact_ids: List[str] = Field(default_factory=list)
+    contact_filter: Optional[ContactFilter] = None
+    contact_count: int = 0
+    members_resolved_at: Optional[datetime] = None  # when a contact_filter was snapshotted into campaign_members
     template_id: Optional[str] = None
     scheduled_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -125,11 +251,27 @@ class Campaign(BaseModel):
     sent_count: int = 0
     response_count: int = 0
     conversion_count: int = 0
+    failed_count: int = 0
+    dispatch_state: Optional[str] = None  # "sending", "sent" or "failed" once the scheduler picks it up
+    dispatch_error: Optional[str] = None
+
+class CampaignSummary(BaseModel):
+    # The columns the campaign list renders
+    id: str
+    name: str
+    description: Optional[str] = None
+    status: CampaignStatus = CampaignStatus.DRAFT
+    contact_count: int = 0
+    sent_count: int = 0
+    response_count: int = 0
+    scheduled_at: Optional[datetime] = None
+    created_at: datetime
 
 class CampaignCreate(BaseModel):
     name: str
     description: Optional[str] = None
     contact_ids: List[str] = Field(default_factory=list)
+    contact_filter: Optional[ContactFilter] = None
     template_id: Optional[str] = None
     scheduled_at: Optional[datetime] = None
 
@@ -138,6 +280,7 @@ class CampaignUpdate(BaseModel):
     description: Optional[str] = None
     status: Optional[CampaignStatus] = None
     contact_ids: Optional[List[str]] = None
+    contact_filter: Optional[ContactFilter] = None
     template_id: Optional[str] = None
     scheduled_at: Optional[datetime] = None
 
@@ -176,6 +319,55 @@ class EmailGenerationResponse(BaseModel):
     body: str
     personalization_notes: List[str] = Field(default_factory=list)
 
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class CampaignEmailGenerationRequest(BaseModel):
+    email_type: str  # "introduction", "follow_up", "meeting_request"
+    context: Optional[str] = None
+    tone: str = Field(default="professional")
+    concurrency: Optional[int] = Field(default=None, ge=1, le=50)
+
+class EmailGenerationJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    campaign_id: str
+    status: JobStatus = JobStatus.PENDING
+    email_type: str
+    tone: str
+    context: Optional[str] = None
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    errors: List[Dict[str, str]] = Field(default_factory=list)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+class EmailDraft(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    campaign_id: str
+    job_id: str
+    contact_id: str
+    subject: str
+    body: str
+    personalization_notes: List[str] = Field(default_factory=list)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CleanupJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    kind: str  # "cascade" or "orphan_sweep"
+    status: JobStatus = JobStatus.PENDING
+    contacts_checked: int = 0
+    interaction_logs_deleted: int = 0
+    campaigns_updated: int = 0
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
 class InteractionLog(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     contact_id: str
@@ -183,6 +375,7 @@ class InteractionLog(BaseModel):
     subject: Optional[str] = None
     content: Optional[str] = None
     status: str = Field(default="completed")
+    campaign_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class InteractionLogCreate(BaseModel):
@@ -204,10 +397,33 @@ class AnalyticsResponse(BaseModel):
 
 # API Key placeholder - User will fill this in
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', 'YOUR_OPENAI_API_KEY_HERE')
+LLM_PROVIDER = "openai"
+LLM_MODEL = "gpt-4o"
+
+# Provider quota shared by every LLM call in this process; interactive
+# requests are served ahead of queued bulk (campaign) work
+llm_limiter = LlmRateLimiter(
+    requests_per_minute=float(os.environ.get('LLM_REQUESTS_PER_MINUTE', 500)),
+    tokens_per_minute=float(os.environ.get('LLM_TOKENS_PER_MINUTE', 30000))
+)
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.environ.get('LLM_EXPECTED_COMPLETION_TOKENS', 400))
+
+# Identical prompts are answered from cache instead of re-sent to the provider
+llm_cache = LlmResponseCache(
+    max_entries=int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 1024)),
+    ttl_seconds=int(os.environ.get('LLM_CACHE_TTL_SECONDS', 3600)),
+    collection=db.llm_cache if os.environ.get('LLM_CACHE_PERSIST', 'false').lower() == 'true' else None,
+)
 
 # Helper functions
-async def get_llm_chat(session_id: str, system_message: str):
-    """Create a new LLM chat instance"""
+def _build_llm_chat(session_id: str, system_message: str):
+    if LLM_FAKE:
+        return FakeLlmChat(
+            session_id=session_id,
+            system_message=system_message,
+            latency=float(os.environ.get('LLM_FAKE_LATENCY_SECONDS', 0)),
+            failure_rate=float(os.environ.get('LLM_FAKE_FAILURE_RATE', 0))
+        ).with_model(LLM_PROVIDER, LLM_MODEL)
     if not EMERGENT_AVAILABLE:
         raise Exception("emergentintegrations library not available")
     
@@ -216,331 +432,1089 @@ async def get_llm_chat(session_id: str, system_message: str):
         session_id=session_id,
         system_message=system_message
     )
-    return chat.with_model("openai", "gpt-4o").with_max_tokens(4096)
+    return chat.with_model(LLM_PROVIDER, LLM_MODEL).with_max_tokens(4096)
+
+# Shared keep-alive connections for every LLM call; started with the app
+llm_clients = LlmClientPool(
+    _build_llm_chat,
+    max_connections=int(os.environ.get('LLM_MAX_CONNECTIONS', 20)),
+    max_keepalive_connections=int(os.environ.get('LLM_MAX_KEEPALIVE_CONNECTIONS', 10))
+)
+
+async def get_llm_chat(session_id: str, system_message: str):
+    """Create an LLM chat instance on top of the shared client pool"""
+    return llm_clients.chat(session_id, system_message)
+
+# Networking goals change rarely but are read on every generation request
+NETWORKING_GOALS_CACHE_TTL_SECONDS = float(os.environ.get('NETWORKING_GOALS_CACHE_TTL_SECONDS', 300))
+_networking_goals_cache: Dict[str, tuple] = {}
+
+async def get_cached_networking_goals(user_id: str = "default_user") -> Optional[Dict[str, Any]]:
+    """Return the user's networking goals, from cache when fresh"""
+    cached = _networking_goals_cache.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    goals = await db.networking_goals.find_one({"user_id": user_id}, projection={"_id": 0})
+    _networking_goals_cache[user_id] = (goals, time.monotonic() + NETWORKING_GOALS_CACHE_TTL_SECONDS)
+    return goals
+
+def invalidate_networking_goals(user_id: str):
+    _networking_goals_cache.pop(user_id, None)
 
 async def calculate_lead_score(contact: Contact) -> int:
     """Calculate lead score based on contact information"""
-    score = 50  # Base score
-    
-    if contact.company:
-        score += 10
-    if contact.position:
-        score += 10
-    if contact.linkedin_url:
-        score += 15
-    if contact.industry:
-        score += 10
-    if contact.phone:
-        score += 5
-    
-    # Bonus for recent interactions
-    if contact.last_interaction:
-        days_since = (datetime.utcnow() - contact.last_interaction).days
-        if days_since < 7:
-            score += 20
-        elif days_since < 30:
-            score += 10
-    
-    return min(score, 100)
+    return score_contact(contact.dict())
 
-async def update_relationship_strength(contact_id: str):
-    """Update relationship strength based on interactions"""
-    interactions = await db.interaction_logs.find({"contact_id": contact_id}).to_list(None)
-    
-    base_strength = len(interactions) * 5
-    recent_interactions = [i for i in interactions if (datetime.utcnow() - i["created_at"]).days < 30]
-    recent_bonus = len(recent_interactions) * 10
-    
-    strength = min(base_strength + recent_bonus, 100)
-    
-    await db.contacts.update_one(
-        {"id": contact_id},
-        {"$set": {"relationship_strength": strength, "updated_at": datetime.utcnow()}}
-    )
+# Lead score rescoring
+# Scores age with last_interaction, so the whole collection is rescored on a
+# schedule in vectorized batches; writes that change a scoring input rescore
+# the affected contacts right away.
+LEAD_RESCORE_INTERVAL_SECONDS = float(os.environ.get('LEAD_RESCORE_INTERVAL_SECONDS', 24 * 3600))
+LEAD_RESCORE_BATCH_SIZE = int(os.environ.get('LEAD_RESCORE_BATCH_SIZE', 10000))
 
-# Routes
-@api_router.get("/")
-async def root():
-    return {"message": "NetworkingAI API is running", "emergent_available": EMERGENT_AVAILABLE}
+async def rescore_lead_scores(filter_dict: Optional[Dict[str, Any]] = None, batch_size: int = LEAD_RESCORE_BATCH_SIZE) -> Dict[str, int]:
+    """Rescore matching contacts (all by default) and keep the analytics rollup in step"""
+    stats = await rescore_contacts(db.contacts, filter_dict, batch_size, follow_up_stages=[NEXT_BEST_KEY_STAGE])
+    await apply_analytics_delta({"lead_score_sum": stats["score_delta"]})
+    return stats
 
-@api_router.get("/health")
-async def health_check():
-    """Comprehensive health check endpoint"""
-    try:
-        # Test database connection
-        await db.list_collection_names()
-        db_status = "healthy"
-    except Exception as e:
-        db_status = f"unhealthy: {str(e)}"
-    
-    return {
-        "status": "ok",
-        "database": db_status,
-        "emergent_integrations": EMERGENT_AVAILABLE,
-        "openai_configured": OPENAI_API_KEY != 'YOUR_OPENAI_API_KEY_HERE',
-        "timestamp": datetime.utcnow().isoformat()
-    }
+# Next-best ranking
+# "Who to contact next" ranks by a weighted sum of lead score, relationship
+# strength and priority plus a bonus that grows linearly with idle days. As
+# the idle bonus grows at the same rate for every contact, the ranking is
+# time-invariant: subtracting the bonus accrued since the epoch leaves a
+# `next_best_key` that only changes when its inputs do, so the top K is a
+# walk down one index instead of a scan and sort.
+NEXT_BEST_WEIGHTS = {"lead_score": 1.0, "relationship_strength": 0.5}
+NEXT_BEST_PRIORITY_POINTS = {Priority.HIGH.value: 30, Priority.MEDIUM.value: 15, Priority.LOW.value: 0}
+NEXT_BEST_POINTS_PER_IDLE_DAY = 1.0
+# Inputs of next_best_key; writes touching one must refresh the key
+NEXT_BEST_FIELDS = ("lead_score", "relationship_strength", "priority", "last_contacted", "last_interaction")
+_EPOCH = datetime(1970, 1, 1)
+_MS_PER_DAY = 86400 * 1000
 
-# Networking Goals Routes
-@api_router.post("/networking-goals", response_model=NetworkingGoals)
-async def create_networking_goals(goals: NetworkingGoalsCreate):
-    goals_dict = goals.dict()
-    goals_obj = NetworkingGoals(**goals_dict)
-    await db.networking_goals.insert_one(goals_obj.dict())
-    return goals_obj
+def _epoch_days(moment: datetime) -> float:
+    return (moment - _EPOCH).total_seconds() / 86400
 
-@api_router.get("/networking-goals", response_model=List[NetworkingGoals])
-async def get_networking_goals(user_id: str = "default_user"):
-    goals = await db.networking_goals.find({"user_id": user_id}).to_list(1000)
-    return [NetworkingGoals(**goal) for goal in goals]
+def next_best_key(contact: Dict[str, Any]) -> float:
+    """Time-invariant ranking key; higher keys should be contacted sooner"""
+    touches = [moment for moment in (contact.get("last_contacted"), contact.get("last_interaction")) if moment]
+    idle_since = max(touches) if touches else contact.get("created_at") or datetime.utcnow()
+    return (
+        sum(weight * (contact.get(field) or 0) for field, weight in NEXT_BEST_WEIGHTS.items())
+        + NEXT_BEST_PRIORITY_POINTS.get(_enum_value(contact.get("priority") or Priority.MEDIUM), 0)
+        - NEXT_BEST_POINTS_PER_IDLE_DAY * _epoch_days(idle_since)
+    )
 
-# Contact Routes
-@api_router.post("/contacts", response_model=Contact)
-async def create_contact(contact: ContactCreate):
-    contact_dict = contact.dict()
-    contact_obj = Contact(**contact_dict)
-    
-    # Calculate initial lead score
-    contact_obj.lead_score = await calculate_lead_score(contact_obj)
-    
-    await db.contacts.insert_one(contact_obj.dict())
-    return contact_obj
+def next_best_score(key: float, now: Optional[datetime] = None) -> float:
+    """The ranking score at `now` for a stored next_best_key"""
+    return key + NEXT_BEST_POINTS_PER_IDLE_DAY * _epoch_days(now or datetime.utcnow())
 
-@api_router.get("/contacts", response_model=List[Contact])
-async def get_contacts(
-    status: Optional[ContactStatus] = None,
-    priority: Optional[Priority] = None,
-    limit: int = 100
-):
-    filter_dict = {}
-    if status:
-        filter_dict["status"] = status
-    if priority:
-        filter_dict["priority"] = priority
-    
-    contacts = await db.contacts.find(filter_dict).limit(limit).to_list(limit)
-    return [Contact(**contact) for contact in contacts]
+# Server-side twin of next_best_key(), appended to pipeline updates
+NEXT_BEST_KEY_STAGE = {"$set": {"next_best_key": {"$subtract": [
+    {"$add": [
+        *({"$multiply": [{"$ifNull": [f"${field}", 0]}, weight]} for field, weight in NEXT_BEST_WEIGHTS.items()),
+        {"$switch": {
+            "branches": [
+                {"case": {"$eq": ["$priority", priority]}, "then": points}
+                for priority, points in NEXT_BEST_PRIORITY_POINTS.items()
+            ],
+            "default": NEXT_BEST_PRIORITY_POINTS[Priority.MEDIUM.value],
+        }},
+    ]},
+    {"$multiply": [
+        {"$divide": [
+            {"$subtract": [
+                {"$ifNull": [{"$max": ["$last_contacted", "$last_interaction"]}, "$created_at"]},
+                _EPOCH,
+            ]},
+            _MS_PER_DAY,
+        ]},
+        NEXT_BEST_POINTS_PER_IDLE_DAY,
+    ]},
+]}}}
 
-@api_router.get("/contacts/{contact_id}", response_model=Contact)
-async def get_contact(contact_id: str):
-    contact = await db.contacts.find_one({"id": contact_id})
-    if not contact:
-        raise HTTPException(status_code=404, detail="Contact not found")
-    return Contact(**contact)
+async def refresh_next_best_keys(filter_dict: Dict[str, Any]) -> int:
+    """Recompute next_best_key server-side for every matching contact"""
+    result = await db.contacts.update_many(filter_dict, [NEXT_BEST_KEY_STAGE])
+    return result.modified_count
 
-@api_router.put("/contacts/{contact_id}", response_model=Contact)
-async def update_contact(contact_id: str, contact_update: ContactUpdate):
-    contact = await db.contacts.find_one({"id": contact_id})
-    if not contact:
-        raise HTTPException(status_code=404, detail="Contact not found")
+# Relationship strength
+# Strength is derived from two counters kept on the contact document: all
+# interactions ever logged, and those inside the recent window. Logging an
+# interaction bumps both in a single update; a periodic decay job walks the
+# recent counters down as interactions age out of the window.
+RECENT_INTERACTION_DAYS = 30
+# Failed interactions (a campaign send that bounced) stay in the log but do not count
+COUNTED_INTERACTIONS = {"status": {"$ne": "failed"}}
+RELATIONSHIP_DECAY_INTERVAL_SECONDS = int(os.environ.get('RELATIONSHIP_DECAY_INTERVAL_SECONDS', 3600))
+
+def relationship_strength(interaction_count: int, recent_interaction_count: int) -> int:
+    """Relationship strength for the given interaction counters"""
+    return min(interaction_count * 5 + recent_interaction_count * 10, 100)
+
+# Server-side twin of relationship_strength(), for pipeline updates
+RELATIONSHIP_STRENGTH_EXPR = {"$min": [
+    {"$add": [
+        {"$multiply": [{"$ifNull": ["$interaction_count", 0]}, 5]},
+        {"$multiply": [{"$ifNull": ["$recent_interaction_count", 0]}, 10]},
+    ]},
+    100,
+]}
+
+async def record_interactions(contact_id: str, count: int = 1, at: Optional[datetime] = None):
+    """Apply `count` newly logged interactions to the contact's counters in one update"""
+    now = datetime.utcnow()
+    before = await db.contacts.find_one_and_update(
+        {"id": contact_id},
+        [
+            {"$set": {
+                "interaction_count": {"$add": [{"$ifNull": ["$interaction_count", 0]}, count]},
+                "recent_interaction_count": {"$add": [{"$ifNull": ["$recent_interaction_count", 0]}, count]},
+                "last_interaction": at or now,
+                "updated_at": now,
+            }},
+            {"$set": {"relationship_strength": RELATIONSHIP_STRENGTH_EXPR}},
+            NEXT_BEST_KEY_STAGE,
+        ],
+        projection={
+            "relationship_strength": 1, "interaction_count": 1, "recent_interaction_count": 1, "lead_score": 1,
+            **{field: 1 for field in LEAD_SCORE_FIELDS},
+        },
+        return_document=ReturnDocument.BEFORE
+    )
+    if not before:
+        return
     
-    update_dict = contact_update.dict(exclude_unset=True)
-    update_dict["updated_at"] = datetime.utcnow()
+    # A fresh interaction can lift the recency part of the lead score
+    lead_score = score_contact({**before, "last_interaction": at or now})
+    if lead_score != before.get("lead_score"):
+        await db.contacts.update_one({"id": contact_id}, [{"$set": {"lead_score": lead_score}}, NEXT_BEST_KEY_STAGE])
+        await apply_analytics_delta({"lead_score_sum": lead_score - (before.get("lead_score") or 0)})
     
-    await db.contacts.update_one({"id": contact_id}, {"$set": update_dict})
+    # Account for the bump first so a backfill below starts from the bumped strength
+    strength = relationship_strength(before.get("interaction_count", 0) + count, before.get("recent_interaction_count", 0) + count)
+    await apply_analytics_delta({"relationship_strength_sum": strength - before.get("relationship_strength", 0)})
     
-    updated_contact = await db.contacts.find_one({"id": contact_id})
-    return Contact(**updated_contact)
+    if "interaction_count" not in before:
+        # Contact predates the counters: backfill them from its logs once
+        await update_relationship_strength(contact_id)
 
-@api_router.delete("/contacts/{contact_id}")
-async def delete_contact(contact_id: str):
-    result = await db.contacts.delete_one({"id": contact_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Contact not found")
-    return {"message": "Contact deleted successfully"}
+async def update_relationship_strength(contact_id: str):
+    """Recompute a contact's interaction counters and relationship strength from its logs"""
+    cutoff = datetime.utcnow() - timedelta(days=RECENT_INTERACTION_DAYS)
+    pipeline = [
+        {"$match": {"contact_id": contact_id, **COUNTED_INTERACTIONS}},
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "recent": {"$sum": {"$cond": [{"$gt": ["$created_at", cutoff]}, 1, 0]}},
+        }},
+    ]
+    counts = await db.interaction_logs.aggregate(pipeline).to_list(1)
+    total = counts[0]["total"] if counts else 0
+    recent = counts[0]["recent"] if counts else 0
+    strength = relationship_strength(total, recent)
+    
+    before = await db.contacts.find_one_and_update(
+        {"id": contact_id},
+        [
+            {"$set": {
+                "interaction_count": total,
+                "recent_interaction_count": recent,
+                "relationship_strength": strength,
+                "updated_at": datetime.utcnow()
+            }},
+            NEXT_BEST_KEY_STAGE,
+        ],
+        projection={"relationship_strength": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before:
+        await apply_analytics_delta({"relationship_strength_sum": strength - before.get("relationship_strength", 0)})
 
-# AI Email Generation Routes
-@api_router.post("/generate-email", response_model=EmailGenerationResponse)
-async def generate_email(request: EmailGenerationRequest):
-    # Check if emergent integrations is available
-    if not EMERGENT_AVAILABLE:
-        return EmailGenerationResponse(
-            subject=f"Re: {request.email_type.replace('_', ' ').title()}",
-            body=f"Hello,\n\nI hope this email finds you well.\n\n[AI email generation unavailable - emergentintegrations library not installed]\n\nBest regards",
-            personalization_notes=["emergentintegrations library not available"]
-        )
+async def decay_relationship_strength(batch_size: int = 1000) -> int:
+    """Walk recent-interaction counters down as interactions leave the window.
     
-    if OPENAI_API_KEY == 'YOUR_OPENAI_API_KEY_HERE':
-        raise HTTPException(status_code=400, detail="OpenAI API key not configured. Please add your API key to the .env file.")
+    Only interactions inside the window are aggregated, and only contacts
+    with a non-zero recent counter are visited. Counters are adjusted by
+    relative amounts so interactions logged concurrently are not lost.
+    Returns the number of contacts updated.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=RECENT_INTERACTION_DAYS)
+    pipeline = [
+        {"$match": {"created_at": {"$gt": cutoff}, **COUNTED_INTERACTIONS}},
+        {"$group": {"_id": "$contact_id", "recent": {"$sum": 1}}},
+    ]
+    recent_counts = {row["_id"]: row["recent"] async for row in db.interaction_logs.aggregate(pipeline)}
     
-    # Get contact information
-    contact = await db.contacts.find_one({"id": request.contact_id})
-    if not contact:
-        raise HTTPException(status_code=404, detail="Contact not found")
+    updated = 0
+    strength_delta = 0
+    batch = []
+    cursor = db.contacts.find(
+        {"recent_interaction_count": {"$gt": 0}},
+        projection={"_id": 0, "id": 1, "interaction_count": 1, "recent_interaction_count": 1, "relationship_strength": 1}
+    )
+    async for contact in cursor:
+        decay = contact["recent_interaction_count"] - recent_counts.get(contact["id"], 0)
+        if decay <= 0:
+            continue
+        strength = relationship_strength(contact.get("interaction_count", 0), contact["recent_interaction_count"] - decay)
+        strength_delta += strength - contact.get("relationship_strength", 0)
+        batch.append(UpdateOne({"id": contact["id"]}, [
+            {"$set": {"recent_interaction_count": {"$max": [{"$subtract": ["$recent_interaction_count", decay]}, 0]}}},
+            {"$set": {"relationship_strength": RELATIONSHIP_STRENGTH_EXPR}},
+            NEXT_BEST_KEY_STAGE,
+        ]))
+        if len(batch) >= batch_size:
+            await db.contacts.bulk_write(batch, ordered=False)
+            updated += len(batch)
+            batch = []
+    if batch:
+        await db.contacts.bulk_write(batch, ordered=False)
+        updated += len(batch)
     
-    contact_obj = Contact(**contact)
+    await apply_analytics_delta({"relationship_strength_sum": strength_delta})
+    return updated
+
+async def rebuild_relationship_strength(batch_size: int = 1000) -> int:
+    """Recompute every contact's interaction counters from the logs.
     
-    # Get networking goals for context
-    goals = await db.networking_goals.find_one({"user_id": "default_user"})
+    Used to backfill the counters once and to repair them after manual edits
+    to interaction_logs. Rebuilds the analytics rollup afterwards since
+    strength sums change wholesale. Returns the number of contacts updated.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=RECENT_INTERACTION_DAYS)
+    pipeline = [
+        {"$match": COUNTED_INTERACTIONS},
+        {"$group": {
+            "_id": "$contact_id",
+            "total": {"$sum": 1},
+            "recent": {"$sum": {"$cond": [{"$gt": ["$created_at", cutoff]}, 1, 0]}},
+        }},
+    ]
+    counts = {row["_id"]: (row["total"], row["recent"]) async for row in db.interaction_logs.aggregate(pipeline, allowDiskUse=True)}
     
-    # Create system message for AI
-    system_message = f"""You are an expert networking assistant that generates personalized outreach emails. 
-    Your task is to create professional, engaging emails that help build meaningful business relationships.
+    updated = 0
+    batch = []
+    cursor = db.contacts.find(
+        {},
+        projection={"_id": 0, "id": 1, "interaction_count": 1, "recent_interaction_count": 1, "relationship_strength": 1}
+    )
+    async for contact in cursor:
+        total, recent = counts.get(contact["id"], (0, 0))
+        strength = relationship_strength(total, recent)
+        current = (contact.get("interaction_count"), contact.get("recent_interaction_count"), contact.get("relationship_strength"))
+        if current == (total, recent, strength):
+            continue
+        batch.append(UpdateOne({"id": contact["id"]}, [
+            {"$set": {
+                "interaction_count": total,
+                "recent_interaction_count": recent,
+                "relationship_strength": strength,
+            }},
+            NEXT_BEST_KEY_STAGE,
+        ]))
+        if len(batch) >= batch_size:
+            await db.contacts.bulk_write(batch, ordered=False)
+            updated += len(batch)
+            batch = []
+    if batch:
+        await db.contacts.bulk_write(batch, ordered=False)
+        updated += len(batch)
     
-    Always respond in the following JSON format:
-    {{
-        "subject": "Email subject line",
-        "body": "Email body content",
-        "personalization_notes": ["note1", "note2"]
-    }}
+    await rebuild_analytics_rollup()
+    return updated
+
+# Background work queues
+class CoalescingWorkQueue:
+    """Bounded in-process work queue that merges pending work for the same key.
+    
+    Work for a key that is already waiting is folded into the pending entry
+    with `merge`, so a burst for one key costs one handler call. When the
+    queue is full, `put` waits for room (backpressure) and the wait is
+    recorded in `metrics`. Before `start()` is called (CLI, scripts) work is
+    run inline instead.
     """
     
-    # Create prompt for email generation
-    prompt = f"""Generate a {request.email_type} email for the following contact:
+    def __init__(self, name: str, handler, merge, maxsize: int = 10000, workers: int = 4):
+        self.name = name
+        self.handler = handler
+        self.merge = merge
+        self.maxsize = maxsize
+        self.worker_count = workers
+        self._pending: Dict[str, Any] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._background_puts: set = set()
+        self.metrics = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "processed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "high_water_mark": 0,
+            "backpressure_waits": 0,
+            "backpressure_wait_seconds": 0.0,
+        }
     
-    Contact Information:
-    - Name: {contact_obj.name}
-    - Company: {contact_obj.company or 'Not specified'}
-    - Position: {contact_obj.position or 'Not specified'}
-    - Industry: {contact_obj.industry or 'Not specified'}
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"{self.name}_worker_{i}")
+            for i in range(self.worker_count)
+        ]
     
-    Email Type: {request.email_type}
-    Tone: {request.tone}
-    Additional Context: {request.context or 'None'}
+    async def put(self, key: str, payload: Any):
+        if self._queue is None:
+            await self.handler(key, payload)
+            return
+        if key in self._pending:
+            self._pending[key] = self.merge(self._pending[key], payload)
+            self.metrics["coalesced"] += 1
+            return
+        
+        # Register before waiting so concurrent puts for this key coalesce
+        self._pending[key] = payload
+        if self._queue.full():
+            self.metrics["backpressure_waits"] += 1
+            started = time.monotonic()
+            queued = asyncio.ensure_future(self._queue.put(key))
+            try:
+                await asyncio.shield(queued)
+            except asyncio.CancelledError:
+                # Other puts may already have merged into the pending entry:
+                # let the put land in the background so the work still reaches
+                # a worker instead of being dropped with the caller
+                self._background_puts.add(queued)
+                queued.add_done_callback(self._background_puts.discard)
+                self.metrics["enqueued"] += 1
+                self.metrics["cancelled"] += 1
+                raise
+            finally:
+                self.metrics["backpressure_wait_seconds"] += time.monotonic() - started
+        else:
+            self._queue.put_nowait(key)
+        self.metrics["enqueued"] += 1
+        self.metrics["high_water_mark"] = max(self.metrics["high_water_mark"], self._queue.qsize())
     
-    {"Networking Goals: " + str(goals.get('networking_objectives', [])) if goals else ""}
+    async def _work(self):
+        while True:
+            key = await self._queue.get()
+            payload = self._pending.pop(key)
+            try:
+                await self.handler(key, payload)
+                self.metrics["processed"] += 1
+            except Exception as e:
+                self.metrics["failed"] += 1
+                logger.error(f"❌ {self.name} failed for {key}: {e}")
+            finally:
+                self._queue.task_done()
     
-    Please generate a personalized email that:
-    1. Is appropriate for the {request.email_type} purpose
-    2. Matches the {request.tone} tone
-    3. Includes relevant personalization based on their company/position
-    4. Is concise and actionable
-    5. Follows professional email best practices
-    """
+    async def drain(self):
+        """Finish all queued work, then stop the workers"""
+        if self._queue is None:
+            return
+        while self._background_puts:
+            await asyncio.gather(*self._background_puts, return_exceptions=True)
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._queue = None
+        self._workers = []
     
-    try:
-        # Generate email using AI
-        chat = await get_llm_chat(f"email_gen_{request.contact_id}", system_message)
-        user_message = UserMessage(text=prompt)
-        
-        response = await chat.send_message(user_message)
-        
-        # Parse the response (assuming it returns JSON format)
-        import json
-        try:
-            email_data = json.loads(response)
-            return EmailGenerationResponse(**email_data)
-        except json.JSONDecodeError:
-            # Fallback if AI doesn't return JSON
-            lines = response.split('\n')
-            subject = lines[0] if lines else f"Re: {request.email_type.replace('_', ' ').title()}"
-            body = '\n'.join(lines[1:]) if len(lines) > 1 else response
-            
-            return EmailGenerationResponse(
-                subject=subject,
-                body=body,
-                personalization_notes=[f"Generated for {contact_obj.name} at {contact_obj.company}"]
-            )
-            
-    except Exception as e:
-        logger.error(f"Error generating email: {str(e)}")
-        # Fallback response
-        return EmailGenerationResponse(
-            subject=f"Re: {request.email_type.replace('_', ' ').title()}",
-            body=f"Hi {contact_obj.name},\n\nI hope this email finds you well.\n\n[AI generation error - please check configuration]\n\nBest regards",
-            personalization_notes=["AI generation failed - using template"]
-        )
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "maxsize": self.maxsize,
+            "running": self._queue is not None,
+        }
 
-# Email Template Routes
-@api_router.post("/email-templates", response_model=EmailTemplate)
-async def create_email_template(template: EmailTemplateCreate):
-    template_dict = template.dict()
-    template_obj = EmailTemplate(**template_dict)
-    await db.email_templates.insert_one(template_obj.dict())
-    return template_obj
+async def _record_interaction_batch(contact_id: str, payload):
+    count, at = payload
+    await record_interactions(contact_id, count=count, at=at)
 
-@api_router.get("/email-templates", response_model=List[EmailTemplate])
-async def get_email_templates():
-    templates = await db.email_templates.find().to_list(1000)
-    return [EmailTemplate(**template) for template in templates]
+def _merge_interaction_batches(pending, new):
+    return pending[0] + new[0], max(pending[1], new[1])
 
-# Campaign Routes
-@api_router.post("/campaigns", response_model=Campaign)
-async def create_campaign(campaign: CampaignCreate):
-    campaign_dict = campaign.dict()
-    campaign_obj = Campaign(**campaign_dict)
-    await db.campaigns.insert_one(campaign_obj.dict())
-    return campaign_obj
+# Contact counters for logged interactions, keyed by contact_id
+interaction_queue = CoalescingWorkQueue(
+    "interaction_counters",
+    _record_interaction_batch,
+    _merge_interaction_batches,
+    maxsize=int(os.environ.get('INTERACTION_QUEUE_MAXSIZE', 10000)),
+    workers=int(os.environ.get('INTERACTION_QUEUE_WORKERS', 4)),
+)
 
-@api_router.get("/campaigns", response_model=List[Campaign])
-async def get_campaigns():
-    campaigns = await db.campaigns.find().to_list(1000)
-    return [Campaign(**campaign) for campaign in campaigns]
+# Periodic jobs
+# Lightweight in-process scheduler: each job runs on a fixed interval for the
+# lifetime of the app and is cancelled on shutdown.
+periodic_tasks: List[asyncio.Task] = []
 
-@api_router.get("/campaigns/{campaign_id}", response_model=Campaign)
-async def get_campaign(campaign_id: str):
-    campaign = await db.campaigns.find_one({"id": campaign_id})
-    if not campaign:
-        raise HTTPException(status_code=404, detail="Campaign not found")
-    return Campaign(**campaign)
+def start_periodic_job(name: str, job, interval_seconds: float):
+    """Run `job()` every `interval_seconds` until shutdown"""
+    async def loop():
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"❌ Periodic job {name} failed: {e}")
+    periodic_tasks.append(asyncio.create_task(loop(), name=name))
 
-@api_router.put("/campaigns/{campaign_id}", response_model=Campaign)
-async def update_campaign(campaign_id: str, campaign_update: CampaignUpdate):
-    campaign = await db.campaigns.find_one({"id": campaign_id})
-    if not campaign:
-        raise HTTPException(status_code=404, detail="Campaign not found")
-    
-    update_dict = campaign_update.dict(exclude_unset=True)
-    update_dict["updated_at"] = datetime.utcnow()
-    
-    await db.campaigns.update_one({"id": campaign_id}, {"$set": update_dict})
-    
-    updated_campaign = await db.campaigns.find_one({"id": campaign_id})
-    return Campaign(**updated_campaign)
+async def stop_periodic_jobs():
+    for task in periodic_tasks:
+        task.cancel()
+    await asyncio.gather(*periodic_tasks, return_exceptions=True)
+    periodic_tasks.clear()
 
-# Interaction Logging Routes
-@api_router.post("/interactions", response_model=InteractionLog)
-async def create_interaction_log(interaction: InteractionLogCreate):
-    interaction_dict = interaction.dict()
-    interaction_obj = InteractionLog(**interaction_dict)
-    
-    await db.interaction_logs.insert_one(interaction_obj.dict())
-    
-    # Update contact's last interaction and relationship strength
-    await db.contacts.update_one(
-        {"id": interaction.contact_id},
-        {"$set": {"last_interaction": datetime.utcnow()}}
-    )
-    
-    # Update relationship strength in background
-    await update_relationship_strength(interaction.contact_id)
+# Strong references to running one-off jobs so they are not garbage collected
+background_jobs: set = set()
+
+def spawn_background_job(coro) -> asyncio.Task:
+    """Run a one-off job in the background; it is cancelled on shutdown"""
+    task = asyncio.create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
+
+async def cancel_background_jobs():
+    for task in background_jobs:
+        task.cancel()
+    await asyncio.gather(*background_jobs, return_exceptions=True)
+
+# Keyset pagination
+# List endpoints walk collections in (created_at, id) order. The position of
+# the last row served is handed back as an opaque cursor in the
+# X-Next-Cursor response header, so every page is an index range scan
+# regardless of how deep into the collection the client is.
+PAGE_SORT = [("created_at", 1), ("id", 1)]
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    payload = json.dumps({"created_at": doc["created_at"].isoformat(), "id": doc["id"]})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {"created_at": datetime.fromisoformat(payload["created_at"]), "id": str(payload["id"])}
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def paginate(
+    collection,
+    filter_dict: Dict[str, Any],
+    limit: int,
+    cursor: Optional[str],
+    response: Response,
+    projection: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """Fetch one page of `collection` after `cursor`, setting the next cursor header"""
+    # Larger limits are served a full page rather than rejected; the cursor
+    # leads on to the rest
+    limit = min(limit, MAX_PAGE_SIZE)
+    query = filter_dict
+    if cursor:
+        after = decode_cursor(cursor)
+        query = {"$and": [filter_dict, {"$or": [
+            {"created_at": {"$gt": after["created_at"]}},
+            {"created_at": after["created_at"], "id": {"$gt": after["id"]}},
+        ]}]}
     
-    return interaction_obj
+    # Read one extra row to learn whether another page exists
+    docs = await collection.find(query, projection=projection).sort(PAGE_SORT).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1])
+    return docs
 
-@api_router.get("/interactions/{contact_id}", response_model=List[InteractionLog])
-async def get_contact_interactions(contact_id: str):
-    interactions = await db.interaction_logs.find({"contact_id": contact_id}).to_list(1000)
-    return [InteractionLog(**interaction) for interaction in interactions]
+# List views
+# List endpoints serve the full model by default. `view=summary` narrows the
+# query and the response to a compact model of the columns the UI lists, and
+# `fields=` to an explicit comma-separated set of model fields; id and
+# created_at always come back since the page cursor is built from them.
+#
+# Rows come from our own collections, so with FAST_SERIALIZATION on they are
+# trusted: model_construct fills in defaults without validating, and the list
+# is encoded once with orjson instead of being validated again against the
+# response_model and run through jsonable_encoder.
+LIST_VIEWS = "^(full|summary)$"
+FAST_SERIALIZATION = os.environ.get('FAST_SERIALIZATION', 'false').lower() == 'true'
 
-# Analytics Routes
-@api_router.get("/analytics", response_model=AnalyticsResponse)
-async def get_analytics():
-    # Get contact statistics
-    total_contacts = await db.contacts.count_documents({})
+def requested_fields(fields: Optional[str], model, omitted: FrozenSet[str] = frozenset()) -> Optional[List[str]]:
+    """Parse a fields= parameter, rejecting names the model does not have or the list omits"""
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in model.model_fields or name in omitted]
+    if not names:
+        raise HTTPException(status_code=400, detail="fields must name at least one field")
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+def fields_projection(names) -> Dict[str, int]:
+    return {"_id": 0, "id": 1, "created_at": 1, **{name: 1 for name in names}}
+
+@functools.lru_cache(maxsize=None)
+def _row_template(model, omitted: FrozenSet[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # What model_construct fills in for a missing field, worked out once per
+    # model rather than per row: static defaults are stored in the template,
+    # while default factories (ids, timestamps, fresh lists) are returned
+    # apart so each row gets its own value
+    template, factories = {}, {}
+    for name, field in model.model_fields.items():
+        if name in omitted:
+            continue
+        template[name] = None if field.is_required() or field.default_factory else field.get_default()
+        if field.default_factory:
+            factories[name] = field.default_factory
+    return template, factories
+
+def _model_row(template: Dict[str, Any], factories: Dict[str, Any], doc: Dict[str, Any]) -> Dict[str, Any]:
+    row = {**template, **{key: value for key, value in doc.items() if key in template}}
+    for name, factory in factories.items():
+        if name not in doc:
+            row[name] = factory()
+    return row
+
+def model_rows(model, docs: List[Dict[str, Any]], omitted: FrozenSet[str] = frozenset()) -> List[Dict[str, Any]]:
+    """Rows of `model` built from stored documents; validated unless FAST_SERIALIZATION is on.
     
-    contacts_by_status = {}
-    for status in ContactStatus:
-        count = await db.contacts.count_documents({"status": status.value})
-        contacts_by_status[status.value] = count
+    Fields named in `omitted` are left out of every row. The fast path does
+    what model_construct does, without building model instances: model fields
+    only, in model order, defaults for missing ones.
+    """
+    if FAST_SERIALIZATION:
+        template, factories = _row_template(model, omitted)
+        return [_model_row(template, factories, doc) for doc in docs]
+    return [model(**doc).dict(exclude=set(omitted)) for doc in docs]
+
+def list_view_response(response: Response, rows: List[Dict[str, Any]]) -> JSONResponse:
+    """Serve rows outside the route's response_model, carrying over the page cursor"""
+    if FAST_SERIALIZATION and ORJSON_AVAILABLE:
+        list_response = ORJSONResponse(rows)
+    else:
+        list_response = JSONResponse(jsonable_encoder(rows))
+    if NEXT_CURSOR_HEADER in response.headers:
+        list_response.headers[NEXT_CURSOR_HEADER] = response.headers[NEXT_CURSOR_HEADER]
+    return list_response
+
+# Contact search
+# Three tiers, cheapest first. The weighted text index ranks whole-word matches
+# over every descriptive field; anchored regexes over the lower-cased
+# `search_terms` array give typeahead prefix matches as index range scans; and
+# only when both come back empty does the `search_trigrams` array look for
+# near misses, so typos still find someone. Both arrays are derived from
+# SEARCH_KEY_FIELDS and stored on the contact.
+SEARCH_TEXT_WEIGHTS = {"name": 10, "email": 8, "company": 5, "position": 3, "tags": 3, "industry": 2, "notes": 1}
+SEARCH_KEY_FIELDS = ("name", "email", "company")
+SEARCH_TRIGRAM_MIN_SIMILARITY = 0.3
+SEARCH_TRIGRAM_MAX_CANDIDATES = 5000
+SEARCH_PREFIX_MAX_CANDIDATES = 2000
+# Contact reads leave the derived search and ranking fields in the database
+CONTACT_PROJECTION = {"_id": 0, "search_terms": 0, "search_trigrams": 0, "next_best_key": 0}
+_SEARCH_TOKEN = re.compile(r"[^\W_]+")
+
+def search_tokens(text: Optional[str]) -> List[str]:
+    return _SEARCH_TOKEN.findall(text.lower()) if text else []
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def contact_search_keys(contact: Dict[str, Any]) -> Dict[str, List[str]]:
+    """The derived fields prefix and fuzzy search run against"""
+    terms = sorted({token for field in SEARCH_KEY_FIELDS for token in search_tokens(contact.get(field))})
+    return {
+        "search_terms": terms,
+        "search_trigrams": sorted({gram for term in terms for gram in trigrams(term)}),
+    }
+
+async def refresh_search_keys(filter_dict: Dict[str, Any], batch_size: int = 1000) -> int:
+    """Recompute the search keys of every matching contact; returns how many changed"""
+    updated = 0
+    batch = []
+    projection = {"_id": 0, "id": 1, "search_terms": 1, **{field: 1 for field in SEARCH_KEY_FIELDS}}
+    async for contact in db.contacts.find(filter_dict, projection=projection, batch_size=batch_size):
+        keys = contact_search_keys(contact)
+        if contact.get("search_terms") != keys["search_terms"]:
+            batch.append(UpdateOne({"id": contact["id"]}, {"$set": keys}))
+        if len(batch) >= batch_size:
+            updated += (await db.contacts.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.contacts.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+async def _text_search(q: str, limit: int) -> List[Dict[str, Any]]:
+    cursor = db.contacts.find(
+        {"$text": {"$search": q}},
+        projection={**CONTACT_PROJECTION, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit)
+    return await cursor.to_list(limit)
+
+async def _prefix_search(q: str, tokens: List[str], limit: int) -> List[Dict[str, Any]]:
+    # The first clause bounds the index scan; the rest only filter its hits
+    filter_dict = {"$and": [{"search_terms": {"$regex": f"^{re.escape(token)}"}} for token in tokens]}
+    # Rank a bounded candidate set by name before cutting it to `limit`, so the
+    # best name matches are not lost to whichever hits the scan returned first
+    cursor = db.contacts.find(filter_dict, projection={"_id": 0, "id": 1, "name": 1}).limit(SEARCH_PREFIX_MAX_CANDIDATES)
+    candidates = await cursor.to_list(SEARCH_PREFIX_MAX_CANDIDATES)
+    q = q.strip().lower()
+    candidates.sort(key=lambda contact: (not contact["name"].lower().startswith(q), contact["name"].lower()))
+    order = {contact["id"]: rank for rank, contact in enumerate(candidates[:limit])}
+    contacts = await db.contacts.find({"id": {"$in": list(order)}}, projection=CONTACT_PROJECTION).to_list(limit)
+    return sorted(contacts, key=lambda contact: order[contact["id"]])
+
+async def _trigram_search(tokens: List[str], limit: int) -> List[Dict[str, Any]]:
+    grams = sorted({gram for token in tokens for gram in trigrams(token)})
+    pipeline = [
+        {"$match": {"search_trigrams": {"$in": grams}}},
+        {"$limit": SEARCH_TRIGRAM_MAX_CANDIDATES},
+        {"$addFields": {"similarity": {"$size": {"$setIntersection": ["$search_trigrams", grams]}}}},
+        {"$match": {"similarity": {"$gte": max(1, math.ceil(len(grams) * SEARCH_TRIGRAM_MIN_SIMILARITY))}}},
+        {"$sort": {"similarity": -1}},
+        {"$limit": limit},
+        {"$project": {**CONTACT_PROJECTION, "similarity": 0}},
+    ]
+    return await db.contacts.aggregate(pipeline).to_list(limit)
+
+async def search_contacts_ranked(q: str, limit: int) -> List[Dict[str, Any]]:
+    """Text matches by relevance, then prefix matches, else fuzzy matches"""
+    tokens = search_tokens(q)
+    if not tokens:
+        return []
+    text_hits, prefix_hits = await asyncio.gather(_text_search(q, limit), _prefix_search(q, tokens, limit))
+    results, seen = [], set()
+    for contact in text_hits + prefix_hits:
+        if contact["id"] not in seen:
+            seen.add(contact["id"])
+            results.append(contact)
+    if not results:
+        results = await _trigram_search(tokens, limit)
+    return results[:limit]
+
+# Index management
+# Every index the API relies on is declared here and created at startup, next
+# to the query shapes it exists for. /api/health/indexes explains each shape
+# against the live database and flags any that fall back to a COLLSCAN.
+# Finished cleanup jobs are kept this long for progress polling, then expire
+CLEANUP_JOB_TTL_SECONDS = int(os.environ.get('CLEANUP_JOB_TTL_SECONDS', 7 * 24 * 3600))
+
+INDEX_REGISTRY: Dict[str, List[Dict[str, Any]]] = {
+    "contacts": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": PAGE_SORT},
+        {"keys": [("status", 1)] + PAGE_SORT},
+        {"keys": [("priority", 1)] + PAGE_SORT},
+        {"keys": [("status", 1), ("priority", 1)] + PAGE_SORT},
+        {"keys": [("tags", 1)] + PAGE_SORT},
+        {"keys": [("industry", 1)] + PAGE_SORT},
+        {"keys": [("company", 1)] + PAGE_SORT},
+        {"keys": [("recent_interaction_count", 1)]},
+        {"keys": [(field, "text") for field in SEARCH_TEXT_WEIGHTS], "weights": SEARCH_TEXT_WEIGHTS, "name": "contact_search"},
+        {"keys": [("search_terms", 1)]},
+        {"keys": [("search_trigrams", 1)]},
+        {"keys": [("next_best_key", -1)]},
+    ],
+    "campaigns": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": PAGE_SORT},
+        {"keys": [("contact_ids", 1)]},
+        {"keys": [("status", 1), ("scheduled_at", 1)]},
+    ],
+    "campaign_members": [
+        {"keys": [("campaign_id", 1), ("contact_id", 1)], "unique": True},
+        {"keys": [("contact_id", 1)]},
+    ],
+    "email_templates": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": PAGE_SORT},
+    ],
+    "interaction_logs": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("contact_id", 1)] + PAGE_SORT},
+        {"keys": PAGE_SORT},
+        {"keys": [("campaign_id", 1), ("type", 1), ("contact_id", 1)], "partialFilterExpression": {"campaign_id": {"$type": "string"}}},
+    ],
+    "networking_goals": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("user_id", 1), ("created_at", 1)]},
+    ],
+    "email_generation_jobs": [
+        {"keys": [("id", 1)], "unique": True},
+    ],
+    "cleanup_jobs": [
+        {"keys": [("id", 1)], "unique": True},
+        # Unfinished jobs have finished_at null, which the TTL monitor skips
+        {"keys": [("finished_at", 1)], "expireAfterSeconds": CLEANUP_JOB_TTL_SECONDS},
+    ],
+    "email_drafts": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("campaign_id", 1)] + PAGE_SORT},
+    ],
+    "llm_cache": [
+        {"keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+}
+
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"name": "contact by id", "collection": "contacts", "filter": {"id": ""}},
+    {"name": "contacts page", "collection": "contacts", "filter": {}, "sort": PAGE_SORT},
+    {"name": "contacts by status", "collection": "contacts", "filter": {"status": ContactStatus.NEW.value}, "sort": PAGE_SORT},
+    {"name": "contacts by priority", "collection": "contacts", "filter": {"priority": Priority.HIGH.value}, "sort": PAGE_SORT},
+    {"name": "contacts by status and priority", "collection": "contacts",
+     "filter": {"status": ContactStatus.NEW.value, "priority": Priority.HIGH.value}, "sort": PAGE_SORT},
+    {"name": "contacts with any tag", "collection": "contacts", "filter": {"tags": {"$in": ["a", "b"]}}, "sort": PAGE_SORT},
+    {"name": "contacts with all tags", "collection": "contacts", "filter": {"tags": {"$all": ["a", "b"]}}, "sort": PAGE_SORT},
+    {"name": "contacts by industry", "collection": "contacts", "filter": {"industry": ""}, "sort": PAGE_SORT},
+    {"name": "contacts by company", "collection": "contacts", "filter": {"company": ""}, "sort": PAGE_SORT},
+    {"name": "contacts created since", "collection": "contacts", "filter": {"created_at": {"$gte": datetime(2000, 1, 1)}}},
+    {"name": "campaign by id", "collection": "campaigns", "filter": {"id": ""}},
+    {"name": "campaigns page", "collection": "campaigns", "filter": {}, "sort": PAGE_SORT},
+    {"name": "campaigns with contact", "collection": "campaigns", "filter": {"contact_ids": {"$in": [""]}}},
+    {"name": "campaigns due for dispatch", "collection": "campaigns",
+     "filter": {"status": CampaignStatus.ACTIVE.value, "scheduled_at": {"$lte": datetime(2000, 1, 1)}}},
+    {"name": "campaigns created since", "collection": "campaigns", "filter": {"created_at": {"$gte": datetime(2000, 1, 1)}}},
+    {"name": "members of campaign", "collection": "campaign_members", "filter": {"campaign_id": ""}, "sort": [("contact_id", 1)]},
+    {"name": "campaign memberships of contacts", "collection": "campaign_members", "filter": {"contact_id": {"$in": [""]}}},
+    {"name": "email templates page", "collection": "email_templates", "filter": {}, "sort": PAGE_SORT},
+    {"name": "interactions for contact", "collection": "interaction_logs", "filter": {"contact_id": ""}, "sort": PAGE_SORT},
+    {"name": "interactions export", "collection": "interaction_logs", "filter": {}, "sort": PAGE_SORT},
+    {"name": "campaign sends", "collection": "interaction_logs", "filter": {"campaign_id": "", "type": "email_sent", **COUNTED_INTERACTIONS}},
+    {"name": "interactions in recent window", "collection": "interaction_logs", "filter": {"created_at": {"$gt": datetime(2000, 1, 1)}}},
+    {"name": "contacts matching search text", "collection": "contacts", "filter": {"$text": {"$search": "acme"}}},
+    {"name": "contacts matching search prefix", "collection": "contacts", "filter": {"search_terms": {"$regex": "^ac"}}},
+    {"name": "contacts sharing search trigrams", "collection": "contacts", "filter": {"search_trigrams": {"$in": ["acm", "cme"]}}},
+    {"name": "next best contacts", "collection": "contacts", "filter": {"next_best_key": {"$ne": None}}, "sort": [("next_best_key", -1)]},
+    {"name": "contacts with recent interactions", "collection": "contacts", "filter": {"recent_interaction_count": {"$gt": 0}}},
+    {"name": "email generation job by id", "collection": "email_generation_jobs", "filter": {"id": ""}},
+    {"name": "cleanup job by id", "collection": "cleanup_jobs", "filter": {"id": ""}},
+    {"name": "drafts for campaign", "collection": "email_drafts", "filter": {"campaign_id": ""}, "sort": PAGE_SORT},
+    {"name": "networking goals for user", "collection": "networking_goals", "filter": {"user_id": "default_user"}},
+]
+
+async def ensure_indexes():
+    """Create every registered index; failures are logged, not fatal"""
+    specs = [
+        (collection, spec)
+        for collection, collection_specs in INDEX_REGISTRY.items()
+        for spec in collection_specs
+    ]
+    results = await asyncio.gather(
+        *(
+            db[collection].create_index(spec["keys"], **{option: value for option, value in spec.items() if option != "keys"})
+            for collection, spec in specs
+        ),
+        return_exceptions=True
+    )
+    for (collection, spec), result in zip(specs, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ Failed to create index {spec['keys']} on {collection}: {result}")
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of an explain() plan tree"""
+    stages = [plan["stage"]] if "stage" in plan else []
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+async def check_query_plans() -> List[Dict[str, Any]]:
+    """Explain every registered query shape and report the winning plan's stages"""
+    async def explain(shape):
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        plan = await cursor.limit(1).explain()
+        stages = _plan_stages(plan.get("queryPlanner", {}).get("winningPlan", {}))
+        return {
+            "name": shape["name"],
+            "collection": shape["collection"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        }
+    return await asyncio.gather(*(explain(shape) for shape in QUERY_SHAPES))
+
+# Streaming export
+# Rows are read from a Motor cursor in batches and encoded one batch at a
+# time, so an export never holds more than `batch_size` documents.
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _export_json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+def _export_csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return ";".join(str(item) for item in value)
+    return value
+
+async def _export_rows(cursor, fields: List[str], export_format: str, batch_size: int):
+    def encode(batch: List[Dict[str, Any]]) -> str:
+        if export_format == "ndjson":
+            return "".join(json.dumps(doc, default=_export_json_default) + "\n" for doc in batch)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([_export_csv_value(doc.get(field)) for field in fields] for doc in batch)
+        return buffer.getvalue()
     
-    contacts_by_priority = {}
-    for priority in Priority:
-        count = await db.contacts.count_documents({"priority": priority.value})
-        contacts_by_priority[priority.value] = count
+    if export_format == "csv":
+        yield ",".join(fields) + "\r\n"
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield encode(batch)
+            batch = []
+    if batch:
+        yield encode(batch)
+
+def export_response(collection, filter_dict: Dict[str, Any], model, export_format: str, batch_size: int, filename: str) -> StreamingResponse:
+    """Stream every matching document of `collection` as NDJSON or CSV"""
+    fields = list(model.model_fields)
+    projection = {"_id": 0, **{field: 1 for field in fields}}
+    cursor = collection.find(filter_dict, projection=projection, batch_size=batch_size).sort(PAGE_SORT)
+    return StreamingResponse(
+        _export_rows(cursor, fields, export_format, batch_size),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
+
+# Analytics rollup
+# The dashboard reads a single pre-aggregated document that every write path
+# keeps current with atomic $inc deltas. Monthly growth is kept as per-day
+# buckets so the rolling 30-day window can be summed at read time.
+ANALYTICS_ROLLUP_ID = "global"
+ANALYTICS_WINDOW_DAYS = 30
+
+def _day_bucket(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d")
+
+def _enum_value(value) -> str:
+    return value.value if isinstance(value, Enum) else value
+
+async def apply_analytics_delta(inc: Dict[str, Any]):
+    """Atomically apply counter deltas to the analytics rollup"""
+    inc = {field: delta for field, delta in inc.items() if delta}
+    if not inc:
+        return
+    # No upsert: until the rollup has been built, the first read rebuilds it
+    # from scratch, so dropping deltas here cannot lose anything
+    await db.analytics_rollups.update_one(
+        {"_id": ANALYTICS_ROLLUP_ID},
+        {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+def contact_rollup_delta(contact: Dict[str, Any], sign: int = 1) -> Dict[str, int]:
+    """Counter deltas for adding (sign=1) or removing (sign=-1) a contact"""
+    delta = {
+        "total_contacts": sign,
+        f"contacts_by_status.{_enum_value(contact.get('status', ContactStatus.NEW))}": sign,
+        f"contacts_by_priority.{_enum_value(contact.get('priority', Priority.MEDIUM))}": sign,
+        "lead_score_sum": sign * (contact.get("lead_score") or 0),
+        "relationship_strength_sum": sign * (contact.get("relationship_strength") or 0),
+    }
+    created_at = contact.get("created_at")
+    if created_at and created_at >= datetime.utcnow() - timedelta(days=ANALYTICS_WINDOW_DAYS + 1):
+        delta[f"contacts_created_by_day.{_day_bucket(created_at)}"] = sign
+    return delta
+
+def campaign_rollup_delta(campaign: Dict[str, Any], sign: int = 1) -> Dict[str, int]:
+    """Counter deltas for adding (sign=1) or removing (sign=-1) a campaign"""
+    delta = {
+        "total_campaigns": sign,
+        f"campaigns_by_status.{_enum_value(campaign.get('status', CampaignStatus.DRAFT))}": sign,
+        "total_sent": sign * (campaign.get("sent_count") or 0),
+        "total_responses": sign * (campaign.get("response_count") or 0),
+        "total_conversions": sign * (campaign.get("conversion_count") or 0),
+    }
+    created_at = campaign.get("created_at")
+    if created_at and created_at >= datetime.utcnow() - timedelta(days=ANALYTICS_WINDOW_DAYS + 1):
+        delta[f"campaigns_created_by_day.{_day_bucket(created_at)}"] = sign
+    return delta
+
+def transition_rollup_delta(before: Dict[str, Any], after: Dict[str, Any], rollup_delta) -> Dict[str, int]:
+    """Net counter deltas for a document changing from `before` to `after`"""
+    delta = dict(rollup_delta(after, 1))
+    for field, value in rollup_delta(before, -1).items():
+        delta[field] = delta.get(field, 0) + value
+    return delta
+
+async def contact_rollup_groups(filter_dict: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Group the contacts matching filter_dict by every field the rollup buckets on.
+
+    Bulk writes use this instead of reading each pre-image: one aggregation
+    yields everything needed to turn the write into rollup deltas.
+    """
+    since = datetime.utcnow() - timedelta(days=ANALYTICS_WINDOW_DAYS + 1)
+    pipeline = [
+        {"$match": filter_dict},
+        {"$group": {
+            "_id": {
+                "status": "$status",
+                "priority": "$priority",
+                "day": {"$cond": [
+                    {"$gte": ["$created_at", since]},
+                    {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                    None,
+                ]},
+            },
+            "count": {"$sum": 1},
+            "lead_score_sum": {"$sum": {"$ifNull": ["$lead_score", 0]}},
+            "relationship_strength_sum": {"$sum": {"$ifNull": ["$relationship_strength", 0]}},
+        }},
+    ]
+    return await db.contacts.aggregate(pipeline).to_list(None)
+
+def contact_group_rollup_delta(group: Dict[str, Any], sign: int = 1, **overrides) -> Dict[str, int]:
+    """contact_rollup_delta for a whole group, optionally with status/priority replaced"""
+    key = {field: _enum_value(value) for field, value in {**group["_id"], **overrides}.items()}
+    count = sign * group["count"]
+    delta = {
+        "total_contacts": count,
+        f"contacts_by_status.{key.get('status') or ContactStatus.NEW.value}": count,
+        f"contacts_by_priority.{key.get('priority') or Priority.MEDIUM.value}": count,
+        "lead_score_sum": sign * group["lead_score_sum"],
+        "relationship_strength_sum": sign * group["relationship_strength_sum"],
+    }
+    if key.get("day"):
+        delta[f"contacts_created_by_day.{key['day']}"] = count
+    return delta
+
+def merge_rollup_deltas(deltas) -> Dict[str, int]:
+    merged: Dict[str, int] = {}
+    for delta in deltas:
+        for field, value in delta.items():
+            merged[field] = merged.get(field, 0) + value
+    return merged
+
+async def _contact_analytics_facets(since: datetime) -> Dict[str, Any]:
+    """Compute every contact statistic for the rollup in one aggregation"""
+    pipeline = [
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "by_priority": [{"$group": {"_id": "$priority", "count": {"$sum": 1}}}],
+            "scores": [{"$group": {
+                "_id": None,
+                "lead_score_sum": {"$sum": {"$ifNull": ["$lead_score", 0]}},
+                "relationship_strength_sum": {"$sum": {"$ifNull": ["$relationship_strength", 0]}},
+            }}],
+            "created_by_day": [
+                {"$match": {"created_at": {"$gte": since}}},
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}, "count": {"$sum": 1}}},
+            ],
+        }}
+    ]
+    results = await db.contacts.aggregate(pipeline).to_list(1)
+    return results[0]
+
+async def _campaign_analytics_facets(since: datetime) -> Dict[str, Any]:
+    """Compute every campaign statistic for the rollup in one aggregation"""
+    pipeline = [
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "performance": [{"$group": {
+                "_id": None,
+                "total_sent": {"$sum": {"$ifNull": ["$sent_count", 0]}},
+                "total_responses": {"$sum": {"$ifNull": ["$response_count", 0]}},
+                "total_conversions": {"$sum": {"$ifNull": ["$conversion_count", 0]}},
+            }}],
+            "created_by_day": [
+                {"$match": {"created_at": {"$gte": since}}},
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}, "count": {"$sum": 1}}},
+            ],
+        }}
+    ]
+    results = await db.campaigns.aggregate(pipeline).to_list(1)
+    return results[0]
+
+def _facet_total(rows: List[Dict[str, Any]]) -> int:
+    """Read a {"$count": "count"} facet result"""
+    return rows[0]["count"] if rows else 0
+
+def _facet_breakdown(rows: List[Dict[str, Any]], enum_cls) -> Dict[str, int]:
+    """Turn a $group-by-field facet result into a dict covering every enum value"""
+    counts = {member.value: 0 for member in enum_cls}
+    for row in rows:
+        if row["_id"] in counts:
+            counts[row["_id"]] = row["count"]
+    return counts
+
+def _flatten_counters(doc: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in doc.items():
+        if isinstance(value, dict):
+            flat.update(_flatten_counters(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+async def rebuild_analytics_rollup():
+    """Recompute the analytics rollup from scratch.
+    
+    Returns the new rollup and the drift between it and the stored one,
+    as {field: {"stored": ..., "actual": ...}} for every counter that differed.
+    """
+    since = datetime.utcnow() - timedelta(days=ANALYTICS_WINDOW_DAYS + 1)
+    (contact_stats, campaign_stats), stored = await asyncio.gather(
+        asyncio.gather(_contact_analytics_facets(since), _campaign_analytics_facets(since)),
+        db.analytics_rollups.find_one({"_id": ANALYTICS_ROLLUP_ID}),
+    )
     
-    # Get campaign statistics
-    total_campaigns = await db.campaigns.count_documents({})
+    scores = contact_stats["scores"][0] if contact_stats["scores"] else {}
+    performance = campaign_stats["performance"][0] if campaign_stats["performance"] else {}
+    counters = {
+        "total_contacts": _facet_total(contact_stats["total"]),
+        "contacts_by_status": _facet_breakdown(contact_stats["by_status"], ContactStatus),
+        "contacts_by_priority": _facet_breakdown(contact_stats["by_priority"], Priority),
+        "lead_score_sum": scores.get("lead_score_sum", 0),
+        "relationship_strength_sum": scores.get("relationship_strength_sum", 0),
+        "contacts_created_by_day": {row["_id"]: row["count"] for row in contact_stats["created_by_day"]},
+        "total_campaigns": _facet_total(campaign_stats["total"]),
+        "campaigns_by_status": _facet_breakdown(campaign_stats["by_status"], CampaignStatus),
+        "total_sent": performance.get("total_sent", 0),
+        "total_responses": performance.get("total_responses", 0),
+        "total_conversions": performance.get("total_conversions", 0),
+        "campaigns_created_by_day": {row["_id"]: row["count"] for row in campaign_stats["created_by_day"]},
+    }
     
-    campaigns_by_status = {}
-    for status in CampaignStatus:
-        count = await db.campaigns.count_documents({"status": status.value})
-        campaigns_by_status[status.value] = count
+    drift = {}
+    if stored:
+        oldest_bucket = _day_bucket(since)
+        actual = _flatten_counters(counters)
+        previous = _flatten_counters({key: stored.get(key, {}) for key in counters})
+        for field in sorted(set(actual) | set(previous)):
+            if "_by_day." in field and field.split(".", 1)[1] < oldest_bucket:
+                continue  # Buckets outside the window are pruned, not drift
+            if actual.get(field, 0) != previous.get(field, 0):
+                drift[field] = {"stored": previous.get(field, 0), "actual": actual.get(field, 0)}
     
-    # Calculate email performance
-    campaigns = await db.campaigns.find().to_list(1000)
-    total_sent = sum(c.get("sent_count", 0) for c in campaigns)
-    total_responses = sum(c.get("response_count", 0) for c in campaigns)
-    total_conversions = sum(c.get("conversion_count", 0) for c in campaigns)
+    rollup = {"_id": ANALYTICS_ROLLUP_ID, **counters, "updated_at": datetime.utcnow(), "rebuilt_at": datetime.utcnow()}
+    await db.analytics_rollups.replace_one({"_id": ANALYTICS_ROLLUP_ID}, rollup, upsert=True)
+    if drift:
+        logger.warning(f"Analytics rollup drift corrected on {len(drift)} counters")
+    return rollup, drift
+
+def analytics_from_rollup(rollup: Dict[str, Any]) -> AnalyticsResponse:
+    """Build the dashboard response from the rollup document"""
+    total_contacts = rollup.get("total_contacts", 0)
+    total_sent = rollup.get("total_sent", 0)
+    total_responses = rollup.get("total_responses", 0)
+    total_conversions = rollup.get("total_conversions", 0)
     
     email_performance = {
         "total_sent": total_sent,
@@ -550,36 +1524,1530 @@ async def get_analytics():
         "conversion_rate": (total_conversions / total_sent * 100) if total_sent > 0 else 0
     }
     
-    # Calculate relationship scores
-    contacts = await db.contacts.find().to_list(1000)
-    avg_lead_score = sum(c.get("lead_score", 0) for c in contacts) / len(contacts) if contacts else 0
-    avg_relationship_strength = sum(c.get("relationship_strength", 0) for c in contacts) / len(contacts) if contacts else 0
-    
     relationship_scores = {
-        "average_lead_score": avg_lead_score,
-        "average_relationship_strength": avg_relationship_strength
+        "average_lead_score": rollup.get("lead_score_sum", 0) / total_contacts if total_contacts else 0,
+        "average_relationship_strength": rollup.get("relationship_strength_sum", 0) / total_contacts if total_contacts else 0
     }
     
-    # Monthly growth (simplified)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    new_contacts_this_month = await db.contacts.count_documents({"created_at": {"$gte": thirty_days_ago}})
-    
+    # Sum the per-day buckets that fall inside the rolling window
+    oldest_bucket = _day_bucket(datetime.utcnow() - timedelta(days=ANALYTICS_WINDOW_DAYS))
     monthly_growth = {
-        "new_contacts": new_contacts_this_month,
-        "new_campaigns": await db.campaigns.count_documents({"created_at": {"$gte": thirty_days_ago}})
+        "new_contacts": sum(n for day, n in rollup.get("contacts_created_by_day", {}).items() if day >= oldest_bucket),
+        "new_campaigns": sum(n for day, n in rollup.get("campaigns_created_by_day", {}).items() if day >= oldest_bucket)
     }
     
     return AnalyticsResponse(
         total_contacts=total_contacts,
-        contacts_by_status=contacts_by_status,
-        contacts_by_priority=contacts_by_priority,
-        total_campaigns=total_campaigns,
-        campaigns_by_status=campaigns_by_status,
+        contacts_by_status=_facet_breakdown([], ContactStatus) | rollup.get("contacts_by_status", {}),
+        contacts_by_priority=_facet_breakdown([], Priority) | rollup.get("contacts_by_priority", {}),
+        total_campaigns=rollup.get("total_campaigns", 0),
+        campaigns_by_status=_facet_breakdown([], CampaignStatus) | rollup.get("campaigns_by_status", {}),
         email_performance=email_performance,
         relationship_scores=relationship_scores,
         monthly_growth=monthly_growth
     )
 
+# Deletion cleanup
+# Deleting contacts leaves their interaction logs and campaign memberships
+# behind. A cleanup job removes them in bounded batches after the delete
+# returns, and a periodic orphan sweep catches anything a cascade missed (a
+# restart mid-job, an interaction logged while its contact was being deleted).
+CLEANUP_BATCH_SIZE = int(os.environ.get('CLEANUP_BATCH_SIZE', 1000))
+# Deleted id batches a bulk delete may queue ahead of its cascade job
+CASCADE_QUEUED_BATCHES = int(os.environ.get('CASCADE_QUEUED_BATCHES', 2))
+ORPHAN_SWEEP_INTERVAL_SECONDS = float(os.environ.get('ORPHAN_SWEEP_INTERVAL_SECONDS', 24 * 3600))
+
+async def create_cleanup_job(kind: str) -> CleanupJob:
+    job = CleanupJob(kind=kind)
+    await db.cleanup_jobs.insert_one(job.dict())
+    return job
+
+async def purge_contact_references(contact_ids: List[str], batch_size: int = CLEANUP_BATCH_SIZE):
+    """Remove interaction logs and campaign memberships of deleted contacts.
+    
+    Logs are deleted batch_size at a time so no single write holds the
+    collection for long. Returns (logs deleted, campaigns modified).
+    """
+    logs_deleted = 0
+    while True:
+        batch = await db.interaction_logs.find(
+            {"contact_id": {"$in": contact_ids}}, projection={"_id": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        result = await db.interaction_logs.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        logs_deleted += result.deleted_count
+    
+    listed_in = await db.campaigns.find(
+        {"contact_ids": {"$in": contact_ids}}, projection={"_id": 0, "id": 1}
+    ).to_list(None)
+    campaign_ids = [campaign["id"] for campaign in listed_in]
+    if campaign_ids:
+        await db.campaigns.update_many(
+            {"id": {"$in": campaign_ids}},
+            {"$pull": {"contact_ids": {"$in": contact_ids}}}
+        )
+        await db.campaigns.update_many(
+            {"id": {"$in": campaign_ids}},
+            [{"$set": {"contact_count": {"$size": "$contact_ids"}}}]
+        )
+    
+    # Filter-targeted campaigns keep their snapshot in campaign_members
+    snapshot_counts = await db.campaign_members.aggregate([
+        {"$match": {"contact_id": {"$in": contact_ids}}},
+        {"$group": {"_id": "$campaign_id", "removed": {"$sum": 1}}},
+    ]).to_list(None)
+    if snapshot_counts:
+        await db.campaign_members.delete_many({"contact_id": {"$in": contact_ids}})
+        await db.campaigns.bulk_write(
+            [UpdateOne({"id": row["_id"]}, {"$inc": {"contact_count": -row["removed"]}}) for row in snapshot_counts],
+            ordered=False
+        )
+    return logs_deleted, len(set(campaign_ids) | {row["_id"] for row in snapshot_counts})
+
+async def _id_batches(contact_ids: List[str], batch_size: int):
+    for start in range(0, len(contact_ids), batch_size):
+        batch = contact_ids[start:start + batch_size]
+        yield len(batch), batch
+
+async def _orphaned_id_batches(batch_size: int):
+    """Yield (ids checked, orphaned ids) for every contact id referenced by a log or campaign"""
+    async def missing(ids: List[str]) -> List[str]:
+        existing = await db.contacts.find({"id": {"$in": ids}}, projection={"_id": 0, "id": 1}).to_list(None)
+        return sorted(set(ids) - {contact["id"] for contact in existing})
+    
+    referenced = [
+        # Sorting first lets the server walk the contact_id index distinctly
+        db.interaction_logs.aggregate([{"$sort": {"contact_id": 1}}, {"$group": {"_id": "$contact_id"}}], allowDiskUse=True),
+        db.campaigns.aggregate([{"$unwind": "$contact_ids"}, {"$group": {"_id": "$contact_ids"}}], allowDiskUse=True),
+        db.campaign_members.aggregate([{"$sort": {"contact_id": 1}}, {"$group": {"_id": "$contact_id"}}], allowDiskUse=True),
+    ]
+    for cursor in referenced:
+        batch = []
+        async for row in cursor:
+            batch.append(row["_id"])
+            if len(batch) >= batch_size:
+                yield len(batch), await missing(batch)
+                batch = []
+        if batch:
+            yield len(batch), await missing(batch)
+
+async def run_cleanup_job(job: CleanupJob, batches, batch_size: int = CLEANUP_BATCH_SIZE) -> CleanupJob:
+    """Purge references for each (ids checked, ids to purge) batch, recording progress on the job"""
+    await db.cleanup_jobs.update_one(
+        {"id": job.id},
+        {"$set": {"status": JobStatus.RUNNING, "updated_at": datetime.utcnow()}}
+    )
+    status, error = JobStatus.COMPLETED, None
+    try:
+        async for checked, contact_ids in batches:
+            logs_deleted, campaigns_updated = await purge_contact_references(contact_ids, batch_size) if contact_ids else (0, 0)
+            await db.cleanup_jobs.update_one(
+                {"id": job.id},
+                {
+                    "$inc": {
+                        "contacts_checked": checked,
+                        "interaction_logs_deleted": logs_deleted,
+                        "campaigns_updated": campaigns_updated,
+                    },
+                    "$set": {"updated_at": datetime.utcnow()},
+                }
+            )
+    except asyncio.CancelledError:
+        await _finish_cleanup_job(job.id, JobStatus.FAILED, "interrupted by shutdown")
+        raise
+    except Exception as e:
+        logger.error(f"Cleanup job {job.id} failed: {e}")
+        status, error = JobStatus.FAILED, str(e)
+    
+    return await _finish_cleanup_job(job.id, status, error)
+
+async def _finish_cleanup_job(job_id: str, status: JobStatus, error: Optional[str]) -> CleanupJob:
+    return CleanupJob(**await db.cleanup_jobs.find_one_and_update(
+        {"id": job_id},
+        {"$set": {"status": status, "error": error, "updated_at": datetime.utcnow(), "finished_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    ))
+
+async def cascade_contact_deletion(contact_ids: List[str]) -> CleanupJob:
+    """Start purging the references of deleted contacts in the background"""
+    job = await create_cleanup_job("cascade")
+    spawn_background_job(run_cleanup_job(job, _id_batches(contact_ids, CLEANUP_BATCH_SIZE)))
+    return job
+
+async def _queued_id_batches(queue: asyncio.Queue):
+    while (contact_ids := await queue.get()) is not None:
+        yield len(contact_ids), contact_ids
+
+async def _run_queued_cascade(job: CleanupJob, queue: asyncio.Queue) -> CleanupJob:
+    try:
+        return await run_cleanup_job(job, _queued_id_batches(queue))
+    finally:
+        # A stopped cascade takes no more batches: free a feeder waiting on a full queue
+        while not queue.empty():
+            queue.get_nowait()
+
+class CascadeFeed:
+    """One cascade job fed with the ids of each batch as it is deleted.
+    
+    At most CASCADE_QUEUED_BATCHES batches wait for the job, so a large
+    bulk delete never holds every deleted id at once.
+    """
+    
+    def __init__(self):
+        self.job: Optional[CleanupJob] = None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=CASCADE_QUEUED_BATCHES)
+        self._task: Optional[asyncio.Task] = None
+    
+    async def put(self, contact_ids: List[str]):
+        if self._task is None:
+            self.job = await create_cleanup_job("cascade")
+            self._task = spawn_background_job(_run_queued_cascade(self.job, self._queue))
+        if not self._task.done():
+            await self._queue.put(contact_ids)
+    
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            await self._queue.put(None)
+
+async def sweep_orphans(job: Optional[CleanupJob] = None, batch_size: int = CLEANUP_BATCH_SIZE) -> CleanupJob:
+    """Purge logs and campaign memberships that point at contacts which no longer exist"""
+    job = job or await create_cleanup_job("orphan_sweep")
+    job = await run_cleanup_job(job, _orphaned_id_batches(batch_size), batch_size)
+    if job.interaction_logs_deleted or job.campaigns_updated:
+        logger.info(
+            f"Orphan sweep removed {job.interaction_logs_deleted} interaction logs "
+            f"and updated {job.campaigns_updated} campaigns"
+        )
+    return job
+
+# Routes
+@api_router.get("/")
+async def root():
+    return {"message": "NetworkingAI API is running", "emergent_available": EMERGENT_AVAILABLE}
+
+@api_router.get("/health")
+async def health_check():
+    """Comprehensive health check endpoint"""
+    try:
+        # Test database connection
+        await db.list_collection_names()
+        db_status = "healthy"
+    except Exception as e:
+        db_status = f"unhealthy: {str(e)}"
+    
+    return {
+        "status": "ok",
+        "database": db_status,
+        "emergent_integrations": EMERGENT_AVAILABLE,
+        "openai_configured": OPENAI_API_KEY != 'YOUR_OPENAI_API_KEY_HERE',
+        "work_queues": {interaction_queue.name: interaction_queue.stats()},
+        "llm_cache": llm_cache.stats(),
+        "llm_clients": llm_clients.stats(),
+        "llm_rate_limiter": llm_limiter.stats(),
+        "email_prompts": email_prompts.stats(),
+        "mail_transport": mail_transport.stats(),
+        "mail_domain_throttle": mail_throttle.stats(),
+        "email_templates": email_template_cache.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@api_router.get("/health/indexes")
+async def index_health_check():
+    """Explain every registered query shape and flag collection scans"""
+    plans = await check_query_plans()
+    collscans = [plan["name"] for plan in plans if plan["collscan"]]
+    return {
+        "status": "degraded" if collscans else "ok",
+        "collscans": collscans,
+        "query_shapes": plans,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+# Networking Goals Routes
+@api_router.post("/networking-goals", response_model=NetworkingGoals)
+async def create_networking_goals(goals: NetworkingGoalsCreate):
+    goals_dict = goals.dict()
+    goals_obj = NetworkingGoals(**goals_dict)
+    await db.networking_goals.insert_one(goals_obj.dict())
+    invalidate_networking_goals(goals_obj.user_id)
+    return goals_obj
+
+@api_router.get("/networking-goals", response_model=List[NetworkingGoals])
+async def get_networking_goals(user_id: str = "default_user"):
+    goals = await db.networking_goals.find({"user_id": user_id}).to_list(1000)
+    return [NetworkingGoals(**goal) for goal in goals]
+
+# Contact Routes
+def contact_filter_params(
+    status: Optional[ContactStatus] = None,
+    priority: Optional[Priority] = None,
+    tags: Optional[List[str]] = Query(None),
+    tag_match: str = Query("any", pattern="^(any|all)$"),
+    industry: Optional[str] = None,
+    company: Optional[str] = None
+) -> ContactFilter:
+    """Contact filter query parameters shared by list, export and facets"""
+    return ContactFilter(status=status, priority=priority, tags=tags, tag_match=tag_match, industry=industry, company=company)
+
+def contact_storage_doc(contact_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """A new contact as stored, with its derived search and ranking fields"""
+    return {**contact_doc, **contact_search_keys(contact_doc), "next_best_key": next_best_key(contact_doc)}
+
+def contact_filter_query(contact_filter: ContactFilter) -> Dict[str, Any]:
+    filter_dict = {}
+    if contact_filter.status:
+        filter_dict["status"] = contact_filter.status
+    if contact_filter.priority:
+        filter_dict["priority"] = contact_filter.priority
+    if contact_filter.tags:
+        filter_dict["tags"] = {"$all" if contact_filter.tag_match == "all" else "$in": contact_filter.tags}
+    if contact_filter.industry:
+        filter_dict["industry"] = contact_filter.industry
+    if contact_filter.company:
+        filter_dict["company"] = contact_filter.company
+    return filter_dict
+
+@api_router.post("/contacts", response_model=Contact)
+async def create_contact(contact: ContactCreate):
+    contact_dict = contact.dict()
+    contact_obj = Contact(**contact_dict)
+    
+    # Calculate initial lead score
+    contact_obj.lead_score = await calculate_lead_score(contact_obj)
+    
+    contact_doc = contact_obj.dict()
+    await db.contacts.insert_one(contact_storage_doc(contact_doc))
+    await apply_analytics_delta(contact_rollup_delta(contact_doc))
+    return contact_obj
+
+# Bulk import
+# Uploads are spooled to disk by python-multipart and parsed lazily; only one
+# chunk of rows is ever held in memory, and parsing runs in the threadpool so
+# large files never block the event loop.
+BULK_IMPORT_FORMATS = ("csv", "ndjson")
+BULK_IMPORT_MAX_ERRORS = 1000
+
+def _import_format(upload: UploadFile, requested: Optional[str]) -> str:
+    if requested:
+        return requested
+    filename = (upload.filename or "").lower()
+    if filename.endswith((".ndjson", ".jsonl")) or "ndjson" in (upload.content_type or ""):
+        return "ndjson"
+    return "csv"
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+
+def _read_import_records(upload: UploadFile, import_format: str):
+    """Lazily yield (row_number, record) pairs; record is an Exception for unparseable rows"""
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    if import_format == "csv":
+        for row_number, row in enumerate(csv.DictReader(text), start=1):
+            record = {
+                key.strip(): value.strip()
+                for key, value in row.items()
+                if key and isinstance(value, str) and value.strip()
+            }
+            if "tags" in record:
+                record["tags"] = [tag.strip() for tag in record["tags"].split(";") if tag.strip()]
+            yield row_number, record
+    else:
+        for row_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = ValueError(f"invalid JSON: {e}")
+            if not isinstance(record, (dict, Exception)):
+                record = ValueError("expected a JSON object")
+            yield row_number, record
+
+async def _insert_contact_chunk(docs: List[Dict[str, Any]], row_numbers: List[int]):
+    """Insert one chunk unordered; returns (inserted docs, per-row errors)"""
+    if not docs:
+        return [], []
+    try:
+        await db.contacts.insert_many(docs, ordered=False)
+        return docs, []
+    except BulkWriteError as e:
+        failed = {err["index"]: err.get("errmsg", "write failed") for err in e.details.get("writeErrors", [])}
+        inserted = [doc for i, doc in enumerate(docs) if i not in failed]
+        return inserted, [BulkRowError(row=row_numbers[i], error=msg) for i, msg in failed.items()]
+
+@api_router.post("/contacts/bulk", response_model=BulkImportResponse)
+async def bulk_import_contacts(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    chunk_size: int = Query(1000, ge=1, le=10000)
+):
+    """Import contacts from a CSV or NDJSON upload in unordered batches.
+    
+    CSV files need a header row using ContactCreate field names; separate
+    multiple tags with ';'. Invalid rows are reported and skipped. If the
+    file stops parsing partway, the rows before it stay imported and
+    stopped_at_row names the row that could not be read.
+    """
+    records = _read_import_records(file, _import_format(file, format))
+    result = BulkImportResponse(total_rows=0, inserted=0, failed=0)
+    
+    def add_errors(errors: List[BulkRowError]):
+        result.failed += len(errors)
+        room = BULK_IMPORT_MAX_ERRORS - len(result.errors)
+        result.errors.extend(errors[:room])
+        result.errors_truncated = result.errors_truncated or len(errors) > room
+    
+    def read_chunk():
+        """Up to chunk_size records, and the parse error that cut them short"""
+        chunk = []
+        try:
+            for record in itertools.islice(records, chunk_size):
+                chunk.append(record)
+        except (UnicodeDecodeError, csv.Error) as e:
+            return chunk, e
+        return chunk, None
+    
+    last_row = 0
+    while True:
+        chunk, parse_error = await run_in_threadpool(read_chunk)
+        if parse_error and not last_row and not chunk:
+            raise HTTPException(status_code=400, detail=f"Could not parse upload: {parse_error}")
+        if not chunk and not parse_error:
+            break
+        result.total_rows += len(chunk)
+        last_row = chunk[-1][0] if chunk else last_row
+        
+        docs, row_numbers, errors = [], [], []
+        for row_number, record in chunk:
+            if isinstance(record, Exception):
+                errors.append(BulkRowError(row=row_number, error=str(record)))
+                continue
+            try:
+                contact_obj = Contact(**ContactCreate(**record).dict())
+            except ValidationError as e:
+                errors.append(BulkRowError(row=row_number, error=_format_validation_error(e)))
+                continue
+            contact_obj.lead_score = await calculate_lead_score(contact_obj)
+            contact_doc = contact_obj.dict()
+            docs.append(contact_storage_doc(contact_doc))
+            row_numbers.append(row_number)
+        
+        inserted, write_errors = await _insert_contact_chunk(docs, row_numbers)
+        result.inserted += len(inserted)
+        add_errors(errors + write_errors)
+        
+        await apply_analytics_delta(merge_rollup_deltas(contact_rollup_delta(doc) for doc in inserted))
+        
+        if parse_error:
+            # Earlier chunks are committed: report how far the import got
+            result.total_rows += 1
+            result.stopped_at_row = last_row + 1
+            add_errors([BulkRowError(row=result.stopped_at_row, error=f"Could not parse upload: {parse_error}")])
+            break
+    
+    return result
+
+# Bulk update and delete
+# A selection is either an explicit id list or a filter; an empty selection is
+# rejected so a missing body can never touch every contact. The selection is
+# written BULK_WRITE_BATCH_SIZE contacts at a time, each batch pinned to its
+# ids, so no command carries an unbounded id list however many contacts a
+# filter matches. Rollup deltas come from one grouped aggregation over each
+# batch taken just before its write; a contact changed concurrently in
+# between is reconciled by the next rebuild.
+BULK_WRITE_BATCH_SIZE = int(os.environ.get('BULK_WRITE_BATCH_SIZE', 1000))
+
+def _bulk_selection_filter(selection: ContactBulkSelection) -> Dict[str, Any]:
+    if (selection.ids is None) == (selection.filter is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of ids or filter")
+    if selection.ids is not None:
+        if not selection.ids:
+            raise HTTPException(status_code=400, detail="ids must not be empty")
+        return {"id": {"$in": selection.ids}}
+    
+    filter_dict = contact_filter_query(selection.filter)
+    if not filter_dict:
+        raise HTTPException(status_code=400, detail="filter must set at least one field")
+    return filter_dict
+
+async def _bulk_id_batches(selection: ContactBulkSelection, filter_dict: Dict[str, Any]):
+    """Yield the ids of the selected contacts, BULK_WRITE_BATCH_SIZE at a time.
+    
+    A filter is paged in id order and each page is read after the previous
+    one was written, so a write that moves contacts out of the filter neither
+    skips nor revisits any.
+    """
+    batch_size = BULK_WRITE_BATCH_SIZE
+    if selection.ids is not None:
+        ids = list(dict.fromkeys(selection.ids))
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size]
+        return
+    
+    last_id = None
+    while True:
+        page_filter = filter_dict if last_id is None else {"$and": [filter_dict, {"id": {"$gt": last_id}}]}
+        page = await db.contacts.find(
+            page_filter, projection={"_id": 0, "id": 1}
+        ).sort("id", 1).limit(batch_size).to_list(batch_size)
+        if not page:
+            return
+        yield [contact["id"] for contact in page]
+        last_id = page[-1]["id"]
+
+@api_router.patch("/contacts/bulk", response_model=BulkWriteResponse)
+async def bulk_update_contacts(request: ContactBulkUpdate):
+    filter_dict = _bulk_selection_filter(request)
+    update_dict = request.update.dict(exclude_unset=True)
+    if not update_dict and not request.add_tags and not request.remove_tags:
+        raise HTTPException(status_code=400, detail="No changes given")
+    if "tags" in update_dict and (request.add_tags or request.remove_tags):
+        raise HTTPException(status_code=400, detail="Use either update.tags or add_tags/remove_tags")
+    update_dict["updated_at"] = datetime.utcnow()
+    
+    if request.add_tags or request.remove_tags:
+        # A pipeline update applies both tag edits in the same single write;
+        # existing tags keep their order and new ones are appended
+        add_tags = list(dict.fromkeys(request.add_tags))
+        kept = {"$filter": {"input": {"$ifNull": ["$tags", []]}, "cond": {"$not": [{"$in": ["$$this", add_tags]}]}}}
+        stage = {field: {"$literal": value} for field, value in update_dict.items()}
+        stage["tags"] = {"$filter": {
+            "input": {"$concatArrays": [kept, add_tags]},
+            "cond": {"$not": [{"$in": ["$$this", request.remove_tags]}]},
+        }}
+        update = [{"$set": stage}]
+    else:
+        update = {"$set": update_dict}
+    if any(field in update_dict for field in NEXT_BEST_FIELDS):
+        # Derive the ranking key in the same write, from the updated fields
+        if isinstance(update, dict):
+            update = [{"$set": {field: {"$literal": value} for field, value in update_dict.items()}}]
+        update.append(NEXT_BEST_KEY_STAGE)
+    
+    moves = {field: update_dict[field] for field in ("status", "priority") if field in update_dict}
+    matched = modified = 0
+    async for ids in _bulk_id_batches(request, filter_dict):
+        # Pinned to ids: the update may change the very fields the filter
+        # selects on, and the follow-up refreshes must still find them
+        batch_filter = {"id": {"$in": ids}}
+        groups = await contact_rollup_groups(batch_filter) if moves else []
+        result = await db.contacts.update_many(batch_filter, update)
+        matched += result.matched_count
+        modified += result.modified_count
+        if any(field in update_dict for field in SEARCH_KEY_FIELDS):
+            await refresh_search_keys(batch_filter)
+        if any(field in update_dict for field in LEAD_SCORE_FIELDS):
+            await rescore_lead_scores(batch_filter)
+        await apply_analytics_delta(merge_rollup_deltas(
+            delta
+            for group in groups
+            for delta in (contact_group_rollup_delta(group, 1, **moves), contact_group_rollup_delta(group, -1))
+        ))
+    return BulkWriteResponse(matched=matched, modified=modified)
+
+@api_router.delete("/contacts/bulk", response_model=BulkWriteResponse)
+async def bulk_delete_contacts(selection: ContactBulkSelection):
+    filter_dict = _bulk_selection_filter(selection)
+    # The cascade purges exactly the ids deleted, each batch as soon as it is gone
+    cascade = CascadeFeed()
+    matched = deleted = 0
+    try:
+        async for ids in _bulk_id_batches(selection, filter_dict):
+            batch_filter = {"id": {"$in": ids}}
+            groups = await contact_rollup_groups(batch_filter)
+            result = await db.contacts.delete_many(batch_filter)
+            await apply_analytics_delta(merge_rollup_deltas(contact_group_rollup_delta(group, -1) for group in groups))
+            matched += sum(group["count"] for group in groups)
+            deleted += result.deleted_count
+            await cascade.put(ids)
+    finally:
+        await cascade.close()
+    
+    return BulkWriteResponse(matched=matched, deleted=deleted, cleanup_job_id=cascade.job.id if cascade.job else None)
+
+@api_router.get("/contacts/next-best", response_model=List[RankedContact])
+async def get_next_best_contacts(limit: int = Query(50, ge=1, le=200)):
+    """Contacts to reach out to next, best first"""
+    projection = {field: value for field, value in CONTACT_PROJECTION.items() if field != "next_best_key"}
+    cursor = db.contacts.find({"next_best_key": {"$ne": None}}, projection=projection).sort("next_best_key", -1).limit(limit)
+    now = datetime.utcnow()
+    ranked = []
+    async for contact in cursor:
+        score = next_best_score(contact.pop("next_best_key"), now)
+        ranked.append(RankedContact(**contact, next_best_score=round(score, 2)))
+    return ranked
+
+@api_router.get("/contacts/search", response_model=List[Contact])
+async def search_contacts(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Find contacts by name, email, company and other details, best matches first"""
+    contacts = await search_contacts_ranked(q, limit)
+    return [Contact(**contact) for contact in contacts]
+
+@api_router.get("/contacts/export")
+async def export_contacts(
+    contact_filter: ContactFilter = Depends(contact_filter_params),
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$"),
+    batch_size: int = Query(1000, ge=1, le=10000)
+):
+    return export_response(db.contacts, contact_filter_query(contact_filter), Contact, format, batch_size, "contacts")
+
+@api_router.get("/contacts/facets", response_model=ContactFacets)
+async def get_contact_facets(
+    contact_filter: ContactFilter = Depends(contact_filter_params),
+    facet_limit: int = Query(20, ge=1, le=100)
+):
+    """Count matching contacts per tag, industry and company, most common first"""
+    def top(field: str):
+        return [
+            {"$match": {field: {"$nin": [None, ""]}}},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": facet_limit},
+        ]
+    
+    pipeline = [
+        {"$match": contact_filter_query(contact_filter)},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "tags": [{"$unwind": "$tags"}] + top("tags"),
+            "industry": top("industry"),
+            "company": top("company"),
+        }},
+    ]
+    facets = (await db.contacts.aggregate(pipeline).to_list(1))[0]
+    return ContactFacets(
+        total=_facet_total(facets["total"]),
+        **{
+            field: [FacetCount(value=row["_id"], count=row["count"]) for row in facets[field]]
+            for field in ("tags", "industry", "company")
+        }
+    )
+
+@api_router.get("/contacts", response_model=List[Contact])
+async def get_contacts(
+    response: Response,
+    contact_filter: ContactFilter = Depends(contact_filter_params),
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern=LIST_VIEWS),
+    fields: Optional[str] = Query(None, description="Comma-separated Contact fields to return")
+):
+    """List contacts; `view=summary` returns ContactSummary rows, `fields=` only the named fields"""
+    filter_dict = contact_filter_query(contact_filter)
+    names = requested_fields(fields, Contact)
+    if names:
+        contacts = await paginate(db.contacts, filter_dict, limit, cursor, response, fields_projection(names))
+        return list_view_response(response, contacts)
+    if view == "summary":
+        contacts = await paginate(db.contacts, filter_dict, limit, cursor, response, fields_projection(ContactSummary.model_fields))
+        return list_view_response(response, model_rows(ContactSummary, contacts))
+    contacts = await paginate(db.contacts, filter_dict, limit, cursor, response, CONTACT_PROJECTION)
+    if FAST_SERIALIZATION:
+        return list_view_response(response, model_rows(Contact, contacts))
+    return [Contact(**contact) for contact in contacts]
+
+@api_router.get("/contacts/{contact_id}", response_model=Contact)
+async def get_contact(contact_id: str):
+    contact = await db.contacts.find_one({"id": contact_id}, projection=CONTACT_PROJECTION)
+    if not contact:
+        raise HTTPException(status_code=404, detail="Contact not found")
+    return Contact(**contact)
+
+@api_router.put("/contacts/{contact_id}", response_model=Contact)
+async def update_contact(contact_id: str, contact_update: ContactUpdate):
+    update_dict = contact_update.dict(exclude_unset=True)
+    update_dict["updated_at"] = datetime.utcnow()
+    
+    update = [{"$set": {field: {"$literal": value} for field, value in update_dict.items()}}]
+    if any(field in update_dict for field in NEXT_BEST_FIELDS):
+        # Derive the ranking key in the same write, from the stored document
+        update.append(NEXT_BEST_KEY_STAGE)
+    # Read the pre-image atomically so rollup transitions are exact
+    contact = await db.contacts.find_one_and_update(
+        {"id": contact_id},
+        update,
+        return_document=ReturnDocument.BEFORE
+    )
+    if not contact:
+        raise HTTPException(status_code=404, detail="Contact not found")
+    
+    updated_contact = {**contact, **update_dict}
+    # Fields derived from the merged document need a second, rarer write
+    derived = {}
+    if any(field in update_dict for field in SEARCH_KEY_FIELDS):
+        derived.update(contact_search_keys(updated_contact))
+    if any(field in update_dict for field in LEAD_SCORE_FIELDS):
+        lead_score = score_contact(updated_contact)
+        if lead_score != contact.get("lead_score"):
+            derived["lead_score"] = lead_score
+    if derived:
+        derived_update = [{"$set": {field: {"$literal": value} for field, value in derived.items()}}]
+        if "lead_score" in derived:
+            derived_update.append(NEXT_BEST_KEY_STAGE)
+        await db.contacts.update_one({"id": contact_id}, derived_update)
+        updated_contact.update(derived)
+    await apply_analytics_delta(transition_rollup_delta(contact, updated_contact, contact_rollup_delta))
+    return Contact(**updated_contact)
+
+@api_router.delete("/contacts/{contact_id}")
+async def delete_contact(contact_id: str):
+    contact = await db.contacts.find_one_and_delete({"id": contact_id})
+    if not contact:
+        raise HTTPException(status_code=404, detail="Contact not found")
+    await apply_analytics_delta(contact_rollup_delta(contact, -1))
+    job = await cascade_contact_deletion([contact_id])
+    return {"message": "Contact deleted successfully", "cleanup_job_id": job.id}
+
+# AI Email Generation Routes
+# Email prompts
+# The system message is static and the user prompt is compiled once per
+# (email_type, tone) pair; each request only fills the contact slots. Optional
+# context is trimmed so a prompt never exceeds LLM_PROMPT_TOKEN_BUDGET.
+EMAIL_SYSTEM_MESSAGE = """You are an expert networking assistant that generates personalized outreach emails. 
+    Your task is to create professional, engaging emails that help build meaningful business relationships.
+    
+    Always respond in the following JSON format:
+    {
+        "subject": "Email subject line",
+        "body": "Email body content",
+        "personalization_notes": ["note1", "note2"]
+    }
+    """
+
+email_prompts = PromptRegistry("""Generate a {email_type} email for the following contact:
+    
+    Contact Information:
+    - Name: {name}
+    - Company: {company}
+    - Position: {position}
+    - Industry: {industry}
+    
+    Email Type: {email_type}
+    Tone: {tone}
+    Additional Context: {context}
+    
+    {goals}
+    
+    Please generate a personalized email that:
+    1. Is appropriate for the {email_type} purpose
+    2. Matches the {tone} tone
+    3. Includes relevant personalization based on their company/position
+    4. Is concise and actionable
+    5. Follows professional email best practices
+    """)
+LLM_PROMPT_TOKEN_BUDGET = int(os.environ.get('LLM_PROMPT_TOKEN_BUDGET', 1000))
+
+def build_email_prompts(contact_obj: Contact, email_type: str, tone: str, context: Optional[str], goals: Optional[Dict[str, Any]]):
+    """Return the (system_message, prompt) pair for an email generation request"""
+    objectives = goals.get('networking_objectives', []) if goals else []
+    rendered = email_prompts.get(email_type=email_type, tone=tone).render(
+        {
+            "name": contact_obj.name,
+            "company": contact_obj.company or 'Not specified',
+            "position": contact_obj.position or 'Not specified',
+            "industry": contact_obj.industry or 'Not specified',
+            "context": context or 'None',
+            "goals": "Networking Goals: " + "; ".join(objectives) if goals else "",
+        },
+        optional=("context", "goals"),
+        token_budget=LLM_PROMPT_TOKEN_BUDGET
+    )
+    return EMAIL_SYSTEM_MESSAGE, rendered.text
+
+async def acquire_llm_budget(system_message: str, prompt: str, priority: int) -> int:
+    """Wait for rate-limiter budget for one call; returns the tokens reserved"""
+    estimated = estimate_tokens(system_message) + estimate_tokens(prompt) + LLM_EXPECTED_COMPLETION_TOKENS
+    await llm_limiter.acquire(estimated, priority)
+    return estimated
+
+def settle_llm_budget(reserved: int, system_message: str, prompt: str, response: str):
+    llm_limiter.settle(reserved, estimate_tokens(system_message) + estimate_tokens(prompt) + estimate_tokens(response))
+
+async def complete_email(contact_id: str, system_message: str, prompt: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+    """Send a prompt to the LLM, reusing any identical earlier completion"""
+    async def complete():
+        reserved = await acquire_llm_budget(system_message, prompt, priority)
+        chat = await get_llm_chat(f"email_gen_{contact_id}", system_message)
+        response = await chat.send_message(UserMessage(text=prompt))
+        settle_llm_budget(reserved, system_message, prompt, response)
+        return response
+    
+    cache_key = llm_cache.key(LLM_MODEL, system_message, prompt)
+    return await llm_cache.get_or_generate(cache_key, LLM_MODEL, complete)
+
+def parse_email_response(response: str, email_type: str, contact_obj: Contact, parser: Optional[IncrementalEmailParser] = None) -> EmailGenerationResponse:
+    """Parse an LLM completion into an email, tolerating fenced, truncated or non-JSON answers"""
+    if parser is None:
+        parser = IncrementalEmailParser()
+        parser.feed(response)
+    
+    fields = parser.result()
+    if fields and ("subject" in fields or "body" in fields):
+        notes = fields.get("personalization_notes")
+        return EmailGenerationResponse(
+            subject=fields.get("subject") or f"Re: {email_type.replace('_', ' ').title()}",
+            body=fields.get("body", ""),
+            personalization_notes=notes if isinstance(notes, list) else []
+        )
+    
+    # Fallback if AI doesn't return JSON at all
+    lines = response.split('\n')
+    subject = lines[0] if lines else f"Re: {email_type.replace('_', ' ').title()}"
+    body = '\n'.join(lines[1:]) if len(lines) > 1 else response
+    
+    return EmailGenerationResponse(
+        subject=subject,
+        body=body,
+        personalization_notes=[f"Generated for {contact_obj.name} at {contact_obj.company}"]
+    )
+
+def unavailable_email_response(email_type: str) -> EmailGenerationResponse:
+    return EmailGenerationResponse(
+        subject=f"Re: {email_type.replace('_', ' ').title()}",
+        body=f"Hello,\n\nI hope this email finds you well.\n\n[AI email generation unavailable - emergentintegrations library not installed]\n\nBest regards",
+        personalization_notes=["emergentintegrations library not available"]
+    )
+
+def failed_email_response(email_type: str, contact_obj: Contact) -> EmailGenerationResponse:
+    return EmailGenerationResponse(
+        subject=f"Re: {email_type.replace('_', ' ').title()}",
+        body=f"Hi {contact_obj.name},\n\nI hope this email finds you well.\n\n[AI generation error - please check configuration]\n\nBest regards",
+        personalization_notes=["AI generation failed - using template"]
+    )
+
+async def _load_generation_inputs(request: EmailGenerationRequest):
+    """Validate configuration and fetch the contact and goals for a generation request"""
+    if OPENAI_API_KEY == 'YOUR_OPENAI_API_KEY_HERE' and not LLM_FAKE:
+        raise HTTPException(status_code=400, detail="OpenAI API key not configured. Please add your API key to the .env file.")
+    
+    # Get contact information and networking goals for context concurrently
+    contact, goals = await asyncio.gather(
+        db.contacts.find_one({"id": request.contact_id}),
+        get_cached_networking_goals("default_user")
+    )
+    if not contact:
+        raise HTTPException(status_code=404, detail="Contact not found")
+    return Contact(**contact), goals
+
+@api_router.post("/generate-email", response_model=EmailGenerationResponse)
+async def generate_email(request: EmailGenerationRequest, http_response: Response):
+    # Check if an LLM client is available
+    if not LLM_AVAILABLE:
+        return unavailable_email_response(request.email_type)
+    
+    started = time.perf_counter()
+    contact_obj, goals = await _load_generation_inputs(request)
+    system_message, prompt = build_email_prompts(contact_obj, request.email_type, request.tone, request.context, goals)
+    prepared = time.perf_counter()
+    
+    try:
+        # Generate email using AI
+        response = await complete_email(request.contact_id, system_message, prompt)
+        completed = time.perf_counter()
+        email = parse_email_response(response, request.email_type, contact_obj)
+        
+        # Report where the time went; everything but "llm" is our overhead
+        http_response.headers["Server-Timing"] = (
+            f"prepare;dur={(prepared - started) * 1000:.2f}, "
+            f"llm;dur={(completed - prepared) * 1000:.2f}, "
+            f"parse;dur={(time.perf_counter() - completed) * 1000:.2f}"
+        )
+        return email
+            
+    except Exception as e:
+        logger.error(f"Error generating email: {str(e)}")
+        # Fallback response
+        return failed_email_response(request.email_type, contact_obj)
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _replay(text: str):
+    yield text
+
+async def _stream_email_events(request: EmailGenerationRequest, contact_obj: Contact, system_message: str, prompt: str, started: float):
+    """Server-Sent Events: `delta` per parsed text fragment, then `metrics` and `done`"""
+    cache_key = llm_cache.key(LLM_MODEL, system_message, prompt)
+    parser = IncrementalEmailParser()
+    first_token_at = None
+    generation = None
+    reserved = None
+    try:
+        cached = await llm_cache.lookup(cache_key)
+        if cached is None and (pending := llm_cache.inflight(cache_key)) is not None:
+            # An identical request is already streaming: replay its result
+            cached = await pending
+        if cached is not None:
+            chunks = _replay(cached)
+        else:
+            generation = llm_cache.begin(cache_key)
+            reserved = await acquire_llm_budget(system_message, prompt, PRIORITY_INTERACTIVE)
+            chat = await get_llm_chat(f"email_gen_{request.contact_id}", system_message)
+            chunks = stream_chat(chat, UserMessage(text=prompt), litellm_params={
+                "model": f"{LLM_PROVIDER}/{LLM_MODEL}",
+                "messages": [{"role": "system", "content": system_message}, {"role": "user", "content": prompt}],
+                "api_key": OPENAI_API_KEY,
+                "max_tokens": 4096,
+            })
+        
+        async for chunk in chunks:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            for field, text in parser.feed(chunk).items():
+                yield _sse("delta", {"field": field, "text": text})
+        
+        response = parser.full_text()
+        if cached is None:
+            await llm_cache.store(cache_key, LLM_MODEL, response)
+            generation.set_result(response)
+        email = parse_email_response(response, request.email_type, contact_obj, parser)
+    except Exception as e:
+        logger.error(f"Error streaming email: {str(e)}")
+        if generation is not None and not generation.done():
+            generation.set_exception(e)
+        yield _sse("error", {"detail": "AI generation failed - using template"})
+        email = failed_email_response(request.email_type, contact_obj)
+    finally:
+        if reserved is not None:
+            # Charge what was streamed, also when the provider failed or the client left
+            settle_llm_budget(reserved, system_message, prompt, parser.full_text())
+        if generation is not None and not generation.done():
+            # The client went away mid-stream; release anyone waiting on it
+            generation.set_exception(ConnectionAbortedError("streaming request was abandoned"))
+    
+    finished = time.perf_counter()
+    yield _sse("metrics", {
+        "time_to_first_token_ms": round((first_token_at - started) * 1000, 2) if first_token_at else None,
+        "total_ms": round((finished - started) * 1000, 2),
+    })
+    yield _sse("done", email.dict())
+
+@api_router.post("/generate-email/stream")
+async def generate_email_stream(request: EmailGenerationRequest):
+    """Stream the generated email as Server-Sent Events while the LLM writes it"""
+    started = time.perf_counter()
+    if not LLM_AVAILABLE:
+        async def unavailable():
+            yield _sse("done", unavailable_email_response(request.email_type).dict())
+        events = unavailable()
+    else:
+        contact_obj, goals = await _load_generation_inputs(request)
+        system_message, prompt = build_email_prompts(contact_obj, request.email_type, request.tone, request.context, goals)
+        events = _stream_email_events(request, contact_obj, system_message, prompt, started)
+    
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Email Template Routes
+# Templates are compiled once per (id, created_at) and the compiled form is
+# reused for every contact, so rendering a batch is a walk over prebuilt
+# closures rather than a re-parse of the source per recipient.
+TEMPLATE_RENDER_CHUNK_SIZE = 1000
+
+email_template_cache = EmailTemplateCache(int(os.environ.get('EMAIL_TEMPLATE_CACHE_SIZE', 512)))
+
+def template_context(contact: Dict[str, Any]) -> Dict[str, Any]:
+    """Values a template can reference: the contact's fields plus first_name"""
+    name = (contact.get("name") or "").strip()
+    return {**contact, "first_name": name.split()[0] if name else ""}
+
+def template_contact_projection(fields) -> Dict[str, int]:
+    projection = {"_id": 0, "id": 1, **{field: 1 for field in fields if field in Contact.model_fields}}
+    if "first_name" in fields:
+        projection["name"] = 1
+    return projection
+
+@api_router.post("/email-templates", response_model=EmailTemplate)
+async def create_email_template(template: EmailTemplateCreate):
+    template_dict = template.dict()
+    template_obj = EmailTemplate(**template_dict)
+    try:
+        CompiledEmailTemplate(template_obj.subject, template_obj.body)
+    except TemplateSyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid template: {e}")
+    await db.email_templates.insert_one(template_obj.dict())
+    return template_obj
+
+@api_router.get("/email-templates", response_model=List[EmailTemplate])
+async def get_email_templates(
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = None
+):
+    templates = await paginate(db.email_templates, {}, limit, cursor, response, {"_id": 0})
+    return [EmailTemplate(**template) for template in templates]
+
+@api_router.post("/email-templates/{template_id}/render", response_model=TemplateRenderResponse)
+async def render_email_template(template_id: str, request: TemplateRenderRequest):
+    """Personalize a template for a batch of contacts"""
+    template = await db.email_templates.find_one({"id": template_id}, projection={"_id": 0})
+    if not template:
+        raise HTTPException(status_code=404, detail="Email template not found")
+    try:
+        compiled = email_template_cache.get(template)
+    except TemplateSyntaxError as e:
+        raise HTTPException(status_code=422, detail=f"Stored template is invalid: {e}")
+    
+    contact_ids = list(dict.fromkeys(request.contact_ids))
+    contacts = await db.contacts.find(
+        {"id": {"$in": contact_ids}},
+        projection=template_contact_projection(compiled.fields)
+    ).to_list(len(contact_ids))
+    
+    def render_chunk(chunk: List[Dict[str, Any]]) -> List[RenderedEmail]:
+        rendered = []
+        for contact in chunk:
+            subject, body = compiled.render(template_context(contact))
+            rendered.append(RenderedEmail(contact_id=contact["id"], subject=subject, body=body))
+        return rendered
+    
+    rendered: List[RenderedEmail] = []
+    for start in range(0, len(contacts), TEMPLATE_RENDER_CHUNK_SIZE):
+        rendered.extend(await run_in_threadpool(render_chunk, contacts[start:start + TEMPLATE_RENDER_CHUNK_SIZE]))
+    
+    found = {contact["id"] for contact in contacts}
+    return TemplateRenderResponse(
+        template_id=template_id,
+        rendered=rendered,
+        missing_contact_ids=[contact_id for contact_id in contact_ids if contact_id not in found]
+    )
+
+# Campaign membership
+# A campaign targets either a static list of contact_ids or a saved
+# contact_filter. A filter is resolved the first time the campaign is sent or
+# drafted: matching contacts are streamed off a cursor into campaign_members,
+# one document per member, so the campaign document never grows with its
+# audience. Later sends and drafts walk that snapshot; editing the targeting
+# discards it.
+CAMPAIGN_MEMBER_BATCH_SIZE = int(os.environ.get('CAMPAIGN_MEMBER_BATCH_SIZE', 1000))
+# Campaign lists leave member arrays in the database
+CAMPAIGN_LIST_OMITTED = frozenset({"contact_ids"})
+CAMPAIGN_LIST_PROJECTION = {"_id": 0, **{field: 0 for field in CAMPAIGN_LIST_OMITTED}}
+
+async def campaign_targeting(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize the contact_ids/contact_filter being set on a campaign.
+    
+    Setting one clears the other and any membership snapshot. contact_count
+    is the list length, or for a filter the number of contacts matching now.
+    """
+    contact_ids = list(dict.fromkeys(fields.get("contact_ids") or []))
+    contact_filter = fields.get("contact_filter")
+    if contact_ids and contact_filter:
+        raise HTTPException(status_code=400, detail="Target either contact_ids or contact_filter, not both")
+    targeting = {"contact_ids": contact_ids, "contact_filter": contact_filter, "contact_count": len(contact_ids), "members_resolved_at": None}
+    if contact_filter:
+        filter_dict = contact_filter_query(ContactFilter(**contact_filter))
+        if not filter_dict:
+            raise HTTPException(status_code=400, detail="contact_filter must set at least one field")
+        targeting["contact_count"] = await db.contacts.count_documents(filter_dict)
+    return targeting
+
+async def refresh_campaign_counts() -> int:
+    """Set contact_count on campaigns stored before it existed, from their contact_ids"""
+    result = await db.campaigns.update_many(
+        {"contact_count": {"$exists": False}},
+        [{"$set": {"contact_count": {"$size": {"$ifNull": ["$contact_ids", []]}}}}]
+    )
+    return result.modified_count
+
+async def _insert_campaign_members(members: List[Dict[str, Any]]):
+    try:
+        await db.campaign_members.insert_many(members, ordered=False)
+    except BulkWriteError as e:
+        # Members already snapshotted by an earlier, interrupted resolution
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+async def resolve_campaign_members(campaign: Dict[str, Any]) -> int:
+    """Snapshot the contacts matching a campaign's filter; returns the member count"""
+    if not campaign.get("contact_filter") or campaign.get("members_resolved_at"):
+        return campaign.get("contact_count", 0)
+    
+    now = datetime.utcnow()
+    filter_dict = contact_filter_query(ContactFilter(**campaign["contact_filter"]))
+    members = []
+    async for contact in db.contacts.find(filter_dict, projection={"_id": 0, "id": 1}, batch_size=CAMPAIGN_MEMBER_BATCH_SIZE):
+        members.append({"campaign_id": campaign["id"], "contact_id": contact["id"], "added_at": now})
+        if len(members) >= CAMPAIGN_MEMBER_BATCH_SIZE:
+            await _insert_campaign_members(members)
+            members = []
+    if members:
+        await _insert_campaign_members(members)
+    
+    count = await db.campaign_members.count_documents({"campaign_id": campaign["id"]})
+    await db.campaigns.update_one(
+        {"id": campaign["id"], "members_resolved_at": None},
+        {"$set": {"members_resolved_at": now, "contact_count": count}}
+    )
+    campaign.update(members_resolved_at=now, contact_count=count)
+    return count
+
+async def iter_campaign_contacts(campaign: Dict[str, Any], projection: Dict[str, Any]):
+    """Yield every contact a campaign targets, resolving its filter first if needed"""
+    if not campaign.get("contact_filter"):
+        async for contact in db.contacts.find({"id": {"$in": campaign.get("contact_ids", [])}}, projection=projection):
+            yield contact
+        return
+    
+    await resolve_campaign_members(campaign)
+    members = db.campaign_members.find(
+        {"campaign_id": campaign["id"]}, projection={"_id": 0, "contact_id": 1}, batch_size=CAMPAIGN_MEMBER_BATCH_SIZE
+    ).sort("contact_id", 1)
+    batch = []
+    async for member in members:
+        batch.append(member["contact_id"])
+        if len(batch) >= CAMPAIGN_MEMBER_BATCH_SIZE:
+            async for contact in db.contacts.find({"id": {"$in": batch}}, projection=projection):
+                yield contact
+            batch = []
+    if batch:
+        async for contact in db.contacts.find({"id": {"$in": batch}}, projection=projection):
+            yield contact
+
+# Campaign Routes
+@api_router.post("/campaigns", response_model=Campaign)
+async def create_campaign(campaign: CampaignCreate):
+    campaign_dict = campaign.dict()
+    campaign_dict.update(await campaign_targeting(campaign_dict))
+    campaign_obj = Campaign(**campaign_dict)
+    campaign_doc = campaign_obj.dict()
+    await db.campaigns.insert_one(campaign_doc)
+    await apply_analytics_delta(campaign_rollup_delta(campaign_doc))
+    return campaign_obj
+
+@api_router.get("/campaigns", response_model=List[Campaign], response_model_exclude={"__all__": set(CAMPAIGN_LIST_OMITTED)})
+async def get_campaigns(
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern=LIST_VIEWS),
+    fields: Optional[str] = Query(None, description="Comma-separated Campaign fields to return")
+):
+    """List campaigns without their contact_ids; contact_count gives the audience size.
+    
+    `view=summary` returns CampaignSummary rows, `fields=` only the named fields.
+    """
+    names = requested_fields(fields, Campaign, omitted=CAMPAIGN_LIST_OMITTED)
+    if names:
+        campaigns = await paginate(db.campaigns, {}, limit, cursor, response, fields_projection(names))
+        return list_view_response(response, campaigns)
+    if view == "summary":
+        campaigns = await paginate(db.campaigns, {}, limit, cursor, response, fields_projection(CampaignSummary.model_fields))
+        return list_view_response(response, model_rows(CampaignSummary, campaigns))
+    campaigns = await paginate(db.campaigns, {}, limit, cursor, response, projection=CAMPAIGN_LIST_PROJECTION)
+    if FAST_SERIALIZATION:
+        return list_view_response(response, model_rows(Campaign, campaigns, CAMPAIGN_LIST_OMITTED))
+    return [Campaign(**campaign) for campaign in campaigns]
+
+@api_router.get("/campaigns/{campaign_id}", response_model=Campaign)
+async def get_campaign(campaign_id: str):
+    campaign = await db.campaigns.find_one({"id": campaign_id})
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return Campaign(**campaign)
+
+@api_router.put("/campaigns/{campaign_id}", response_model=Campaign)
+async def update_campaign(campaign_id: str, campaign_update: CampaignUpdate):
+    update_dict = campaign_update.dict(exclude_unset=True)
+    update_dict["updated_at"] = datetime.utcnow()
+    retargeted = "contact_ids" in update_dict or "contact_filter" in update_dict
+    if retargeted:
+        update_dict.update(await campaign_targeting(update_dict))
+    
+    # Read the pre-image atomically so rollup transitions are exact
+    campaign = await db.campaigns.find_one_and_update(
+        {"id": campaign_id},
+        {"$set": update_dict},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    if retargeted and campaign.get("members_resolved_at"):
+        await db.campaign_members.delete_many({"campaign_id": campaign_id})
+    
+    updated_campaign = {**campaign, **update_dict}
+    if update_dict.get("status") == CampaignStatus.ACTIVE or retargeted or "template_id" in update_dict:
+        # Make a finished dispatch claimable again; contacts already sent to
+        # are skipped, so this retries failed sends and reaches new members
+        redispatch = {"dispatch_state": None, "dispatch_error": None}
+        result = await db.campaigns.update_one(
+            {"id": campaign_id, "dispatch_state": {"$in": ["sent", "failed"]}},
+            {"$set": redispatch}
+        )
+        if result.modified_count:
+            updated_campaign.update(redispatch)
+    await apply_analytics_delta(transition_rollup_delta(campaign, updated_campaign, campaign_rollup_delta))
+    return Campaign(**updated_campaign)
+
+# Campaign Email Generation
+# Drafting a whole campaign runs as an in-process background job. Contacts are
+# streamed from one $in query and at most `concurrency` LLM calls are in
+# flight; the job document tracks progress for polling.
+EMAIL_BATCH_CONCURRENCY = int(os.environ.get('EMAIL_BATCH_CONCURRENCY', 5))
+EMAIL_BATCH_MAX_ATTEMPTS = int(os.environ.get('EMAIL_BATCH_MAX_ATTEMPTS', 3))
+EMAIL_JOB_MAX_ERRORS = 100
+
+async def _record_job_progress(job_id: str, completed: int = 0, failed: int = 0, error: Optional[Dict[str, str]] = None):
+    update = {"$inc": {"completed": completed, "failed": failed}, "$set": {"updated_at": datetime.utcnow()}}
+    if error:
+        update["$push"] = {"errors": {"$each": [error], "$slice": EMAIL_JOB_MAX_ERRORS}}
+    await db.email_generation_jobs.update_one({"id": job_id}, update)
+
+async def _stop_tasks(tasks: List[asyncio.Task]):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _finish_email_generation_job(job_id: str, status: JobStatus, error: Optional[Dict[str, str]]):
+    update = {"$set": {"status": status, "updated_at": datetime.utcnow(), "finished_at": datetime.utcnow()}}
+    if error:
+        update["$push"] = {"errors": {"$each": [error], "$slice": EMAIL_JOB_MAX_ERRORS}}
+    await db.email_generation_jobs.update_one({"id": job_id}, update)
+
+async def run_email_generation_job(job: EmailGenerationJob, campaign: Dict[str, Any], concurrency: int):
+    """Generate and persist a draft for every campaign contact"""
+    running = {"status": JobStatus.RUNNING, "updated_at": datetime.utcnow()}
+    if campaign.get("contact_filter"):
+        running["total"] = await resolve_campaign_members(campaign)
+    await db.email_generation_jobs.update_one({"id": job.id}, {"$set": running})
+    goals = await get_cached_networking_goals("default_user")
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def draft_for(contact: Dict[str, Any]):
+        try:
+            contact_obj = Contact(**contact)
+            system_message, prompt = build_email_prompts(contact_obj, job.email_type, job.tone, job.context, goals)
+            response = await retry_with_backoff(
+                lambda: complete_email(contact_obj.id, system_message, prompt, PRIORITY_BULK),
+                attempts=EMAIL_BATCH_MAX_ATTEMPTS
+            )
+            email = parse_email_response(response, job.email_type, contact_obj)
+            draft = EmailDraft(campaign_id=job.campaign_id, job_id=job.id, contact_id=contact_obj.id, **email.dict())
+            await db.email_drafts.insert_one(draft.dict())
+            await _record_job_progress(job.id, completed=1)
+        except Exception as e:
+            # Any failure counts against this contact so completed + failed reaches total
+            await _record_job_progress(job.id, failed=1, error={"contact_id": contact.get("id"), "error": str(e)})
+        finally:
+            semaphore.release()
+    
+    status, error = JobStatus.COMPLETED, None
+    # Only unfinished drafts are held; draft_for records its own failures
+    pending = set()
+    try:
+        async for contact in iter_campaign_contacts(campaign, {"_id": 0}):
+            # Acquire before spawning so only `concurrency` drafts exist at once
+            await semaphore.acquire()
+            task = asyncio.create_task(draft_for(contact))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+    except asyncio.CancelledError:
+        await _stop_tasks(list(pending))
+        await _finish_email_generation_job(job.id, JobStatus.FAILED, {"error": "interrupted by shutdown"})
+        raise
+    except Exception as e:
+        logger.error(f"Email generation job {job.id} failed: {e}")
+        status, error = JobStatus.FAILED, {"error": str(e)}
+        await _stop_tasks(list(pending))
+    
+    await _finish_email_generation_job(job.id, status, error)
+
+@api_router.post("/campaigns/{campaign_id}/generate-emails", response_model=EmailGenerationJob)
+async def generate_campaign_emails(campaign_id: str, request: CampaignEmailGenerationRequest):
+    """Start drafting an email for every campaign contact; poll the returned job for progress"""
+    if not LLM_AVAILABLE:
+        raise HTTPException(status_code=400, detail="AI email generation unavailable - emergentintegrations library not installed")
+    if OPENAI_API_KEY == 'YOUR_OPENAI_API_KEY_HERE' and not LLM_FAKE:
+        raise HTTPException(status_code=400, detail="OpenAI API key not configured. Please add your API key to the .env file.")
+    
+    campaign = await db.campaigns.find_one(
+        {"id": campaign_id},
+        projection={"_id": 0, "id": 1, "contact_ids": 1, "contact_filter": 1, "contact_count": 1, "members_resolved_at": 1}
+    )
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    
+    # A filter is resolved by the job itself, which then sets the exact total
+    job = EmailGenerationJob(
+        campaign_id=campaign_id,
+        email_type=request.email_type,
+        tone=request.tone,
+        context=request.context,
+        total=campaign.get("contact_count", 0) if campaign.get("contact_filter") else await db.contacts.count_documents({"id": {"$in": campaign.get("contact_ids", [])}})
+    )
+    await db.email_generation_jobs.insert_one(job.dict())
+    
+    spawn_background_job(run_email_generation_job(job, campaign, request.concurrency or EMAIL_BATCH_CONCURRENCY))
+    return job
+
+@api_router.get("/email-generation-jobs/{job_id}", response_model=EmailGenerationJob)
+async def get_email_generation_job(job_id: str):
+    job = await db.email_generation_jobs.find_one({"id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Email generation job not found")
+    return EmailGenerationJob(**job)
+
+@api_router.get("/campaigns/{campaign_id}/drafts", response_model=List[EmailDraft])
+async def get_campaign_drafts(
+    campaign_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = None
+):
+    drafts = await paginate(db.email_drafts, {"campaign_id": campaign_id}, limit, cursor, response, {"_id": 0})
+    return [EmailDraft(**draft) for draft in drafts]
+
+# Campaign Dispatch
+# A periodic job claims ACTIVE campaigns whose scheduled_at has passed and
+# mails every member through the configured transport. The claim is a lease
+# renewed after each batch, so a send interrupted by a crash is picked up
+# again once the lease lapses; contacts that already have an email_sent log
+# for the campaign are skipped, so a resumed send never mails anyone twice.
+# A send the transport rejects is logged as email_failed instead, so the
+# next dispatch of the campaign retries it: reactivating a campaign, or
+# changing its template or audience, makes a finished dispatch claimable again.
+# Results are written a batch at a time: interaction logs with insert_many,
+# campaign and analytics counters with one $inc each.
+CAMPAIGN_DISPATCH_INTERVAL_SECONDS = float(os.environ.get('CAMPAIGN_DISPATCH_INTERVAL_SECONDS', 30))
+CAMPAIGN_DISPATCH_LEASE_SECONDS = float(os.environ.get('CAMPAIGN_DISPATCH_LEASE_SECONDS', 600))
+CAMPAIGN_SEND_CONCURRENCY = int(os.environ.get('CAMPAIGN_SEND_CONCURRENCY', 20))
+CAMPAIGN_SEND_BATCH_SIZE = int(os.environ.get('CAMPAIGN_SEND_BATCH_SIZE', 500))
+CAMPAIGN_SEND_MAX_WAITING = int(os.environ.get('CAMPAIGN_SEND_MAX_WAITING', 1000))
+MAIL_FROM = os.environ.get('MAIL_FROM', 'networking@localhost')
+
+def build_mail_transport():
+    if os.environ.get('MAIL_TRANSPORT', 'smtp').lower() == 'memory':
+        return MemoryTransport()
+    return SmtpTransport(
+        host=os.environ.get('SMTP_HOST', 'localhost'),
+        port=int(os.environ.get('SMTP_PORT', 1025)),
+        pool_size=int(os.environ.get('SMTP_POOL_SIZE', CAMPAIGN_SEND_CONCURRENCY)),
+        username=os.environ.get('SMTP_USERNAME'),
+        password=os.environ.get('SMTP_PASSWORD'),
+        starttls=os.environ.get('SMTP_STARTTLS', '').lower() in ('1', 'true', 'yes'),
+    )
+
+mail_transport = build_mail_transport()
+mail_throttle = DomainThrottle(float(os.environ.get('MAIL_DOMAIN_RATE_PER_MINUTE', 600)))
+
+async def claim_due_campaign() -> Optional[Dict[str, Any]]:
+    now = datetime.utcnow()
+    return await db.campaigns.find_one_and_update(
+        {
+            "status": CampaignStatus.ACTIVE,
+            "scheduled_at": {"$lte": now},
+            "$or": [
+                {"dispatch_state": None},
+                {"dispatch_state": "sending", "dispatch_heartbeat": {"$lt": now - timedelta(seconds=CAMPAIGN_DISPATCH_LEASE_SECONDS)}},
+            ],
+        },
+        {"$set": {"dispatch_state": "sending", "dispatch_heartbeat": now, "dispatch_error": None}},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def _record_campaign_sends(campaign_id: str, logs: List[InteractionLog]):
+    """Persist one batch of send results and bump every counter they affect"""
+    if not logs:
+        return
+    now = datetime.utcnow()
+    await db.interaction_logs.insert_many([log.dict() for log in logs], ordered=False)
+    sent_ids = [log.contact_id for log in logs if log.status == "completed"]
+    await db.campaigns.update_one(
+        {"id": campaign_id},
+        {
+            "$inc": {"sent_count": len(sent_ids), "failed_count": len(logs) - len(sent_ids)},
+            "$set": {"dispatch_heartbeat": now, "updated_at": now},
+        }
+    )
+    if not sent_ids:
+        return
+    await apply_analytics_delta({"total_sent": len(sent_ids)})
+    
+    # First contact moves a contact from new to contacted
+    moved = {"id": {"$in": sent_ids}, "status": ContactStatus.NEW}
+    groups = await contact_rollup_groups(moved)
+    await db.contacts.update_many(moved, {"$set": {"status": ContactStatus.CONTACTED}})
+    await apply_analytics_delta(merge_rollup_deltas(
+        delta
+        for group in groups
+        for delta in (contact_group_rollup_delta(group, 1, status=ContactStatus.CONTACTED), contact_group_rollup_delta(group, -1))
+    ))
+    await db.contacts.update_many({"id": {"$in": sent_ids}}, [{"$set": {"last_contacted": now}}, NEXT_BEST_KEY_STAGE])
+    for contact_id in sent_ids:
+        await interaction_queue.put(contact_id, (1, now))
+
+async def _finish_dispatch(campaign_id: str, state: Optional[str], error: Optional[str] = None):
+    update = {"dispatch_state": state, "dispatch_error": error, "updated_at": datetime.utcnow()}
+    if state != "sent":
+        await db.campaigns.update_one({"id": campaign_id}, {"$set": update})
+        return
+    campaign = await db.campaigns.find_one_and_update(
+        {"id": campaign_id, "status": CampaignStatus.ACTIVE},
+        {"$set": {**update, "status": CampaignStatus.COMPLETED}},
+        return_document=ReturnDocument.BEFORE
+    )
+    if campaign:
+        completed = {**campaign, "status": CampaignStatus.COMPLETED}
+        await apply_analytics_delta(transition_rollup_delta(campaign, completed, campaign_rollup_delta))
+    else:
+        # Paused or edited while the last batch went out
+        await db.campaigns.update_one({"id": campaign_id}, {"$set": update})
+
+async def dispatch_campaign(campaign: Dict[str, Any]):
+    """Mail every campaign contact not yet sent to, recording results in batches"""
+    campaign_id = campaign["id"]
+    template = await db.email_templates.find_one({"id": campaign.get("template_id")}) if campaign.get("template_id") else None
+    if not template:
+        await _finish_dispatch(campaign_id, "failed", "Campaign has no email template")
+        return
+    try:
+        compiled = email_template_cache.get(template)
+    except TemplateSyntaxError as e:
+        await _finish_dispatch(campaign_id, "failed", f"Invalid email template: {e}")
+        return
+    
+    already_sent = {
+        row["_id"]
+        async for row in db.interaction_logs.aggregate([
+            {"$match": {"campaign_id": campaign_id, "type": "email_sent", **COUNTED_INTERACTIONS}},
+            {"$group": {"_id": "$contact_id"}},
+        ])
+    }
+    # Sends wait for their domain's token before taking a transport slot, so
+    # a throttled domain only holds back its own contacts
+    waiting = asyncio.Semaphore(CAMPAIGN_SEND_MAX_WAITING)
+    sending = asyncio.Semaphore(CAMPAIGN_SEND_CONCURRENCY)
+    results: List[InteractionLog] = []
+    
+    async def send_to(contact: Dict[str, Any]):
+        try:
+            subject, body = compiled.render(template_context(contact))
+            log = InteractionLog(contact_id=contact["id"], type="email_sent", subject=subject, content=body, campaign_id=campaign_id)
+            try:
+                await mail_throttle.acquire(email_domain(contact["email"]))
+                async with sending:
+                    await mail_transport.send(build_message(MAIL_FROM, contact["email"], subject, body))
+            except Exception as e:
+                # Logged apart from sends, so a resumed dispatch retries this contact
+                log.type, log.status = "email_failed", "failed"
+                log.content = f"Send failed: {e}"
+            results.append(log)
+        finally:
+            waiting.release()
+    
+    state, error = "sent", None
+    pending = set()
+    try:
+        async for contact in iter_campaign_contacts(campaign, CONTACT_PROJECTION):
+            if contact["id"] in already_sent:
+                continue
+            await waiting.acquire()
+            task = asyncio.create_task(send_to(contact))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            
+            if len(results) >= CAMPAIGN_SEND_BATCH_SIZE:
+                batch = results[:]
+                results.clear()
+                await _record_campaign_sends(campaign_id, batch)
+                current = await db.campaigns.find_one({"id": campaign_id}, projection={"status": 1})
+                if not current or current.get("status") != CampaignStatus.ACTIVE:
+                    state = None  # paused: resume from here when reactivated
+                    break
+        await asyncio.gather(*pending)
+    except asyncio.CancelledError:
+        await _stop_tasks(list(pending))
+        state, error = None, "interrupted by shutdown"
+        raise
+    except Exception as e:
+        logger.error(f"Campaign dispatch {campaign_id} failed: {e}")
+        await asyncio.gather(*pending, return_exceptions=True)
+        state, error = "failed", str(e)
+    finally:
+        await _record_campaign_sends(campaign_id, results)
+        await _finish_dispatch(campaign_id, state, error)
+
+async def dispatch_due_campaigns() -> int:
+    """Send every campaign that is due, one at a time; returns how many were started"""
+    started = 0
+    while (campaign := await claim_due_campaign()) is not None:
+        started += 1
+        await dispatch_campaign(campaign)
+    return started
+
+# Interaction Logging Routes
+@api_router.post("/interactions", response_model=InteractionLog)
+async def create_interaction_log(interaction: InteractionLogCreate):
+    interaction_dict = interaction.dict()
+    interaction_obj = InteractionLog(**interaction_dict)
+    
+    await db.interaction_logs.insert_one(interaction_obj.dict())
+    
+    # Update contact's last interaction and relationship strength in background
+    if interaction_obj.status != "failed":
+        await interaction_queue.put(interaction.contact_id, (1, interaction_obj.created_at))
+    
+    return interaction_obj
+
+@api_router.get("/interactions/export")
+async def export_interactions(
+    contact_id: Optional[str] = None,
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$"),
+    batch_size: int = Query(1000, ge=1, le=10000)
+):
+    filter_dict = {"contact_id": contact_id} if contact_id else {}
+    return export_response(db.interaction_logs, filter_dict, InteractionLog, format, batch_size, "interactions")
+
+@api_router.get("/interactions/{contact_id}", response_model=List[InteractionLog])
+async def get_contact_interactions(
+    contact_id: str,
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = None
+):
+    interactions = await paginate(db.interaction_logs, {"contact_id": contact_id}, limit, cursor, response, {"_id": 0})
+    if FAST_SERIALIZATION:
+        return list_view_response(response, model_rows(InteractionLog, interactions))
+    return [InteractionLog(**interaction) for interaction in interactions]
+
+# Analytics Routes
+@api_router.get("/analytics", response_model=AnalyticsResponse)
+async def get_analytics():
+    rollup = await db.analytics_rollups.find_one({"_id": ANALYTICS_ROLLUP_ID})
+    if not rollup:
+        # First request after deploy (or after the rollup was dropped)
+        rollup, _ = await rebuild_analytics_rollup()
+    return analytics_from_rollup(rollup)
+
+@api_router.post("/analytics/rebuild")
+async def rebuild_analytics():
+    """Recompute the analytics rollup from scratch and report any drift"""
+    _, drift = await rebuild_analytics_rollup()
+    return {"message": "Analytics rollup rebuilt", "drift": drift}
+
+# Maintenance Routes
+@api_router.post("/maintenance/orphan-sweep", response_model=CleanupJob)
+async def start_orphan_sweep():
+    """Start an orphan sweep now; poll the returned job for progress"""
+    job = await create_cleanup_job("orphan_sweep")
+    spawn_background_job(sweep_orphans(job))
+    return job
+
+@api_router.get("/maintenance/cleanup-jobs/{job_id}", response_model=CleanupJob)
+async def get_cleanup_job(job_id: str):
+    job = await db.cleanup_jobs.find_one({"id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Cleanup job not found")
+    return CleanupJob(**job)
+
 # Contact Discovery Route (Simplified)
 @api_router.post("/discover-contacts")
 async def discover_contacts(criteria: Dict[str, Any]):
@@ -621,6 +3089,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "Server-Timing"],
 )
 
 # Configure logging
@@ -632,6 +3101,11 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await stop_periodic_jobs()
+    await cancel_background_jobs()
+    await llm_clients.close()
+    await mail_transport.close()
+    await interaction_queue.drain()
     client.close()
 
 # Add a startup event to check everything is working
@@ -641,12 +3115,28 @@ async def startup_event():
         # Test database connection
         await db.list_collection_names()
         logger.info("✅ Database connection successful")
+        
+        await ensure_indexes()
+        logger.info("✅ Database indexes ensured")
+        
+        backfilled = await refresh_campaign_counts()
+        if backfilled:
+            logger.info(f"✅ contact_count backfilled on {backfilled} campaigns")
     except Exception as e:
         logger.error(f"❌ Database connection failed: {e}")
     
+    interaction_queue.start()
+    llm_clients.start()
+    start_periodic_job("relationship_decay", decay_relationship_strength, RELATIONSHIP_DECAY_INTERVAL_SECONDS)
+    start_periodic_job("orphan_sweep", sweep_orphans, ORPHAN_SWEEP_INTERVAL_SECONDS)
+    start_periodic_job("lead_rescore", rescore_lead_scores, LEAD_RESCORE_INTERVAL_SECONDS)
+    start_periodic_job("campaign_dispatch", dispatch_due_campaigns, CAMPAIGN_DISPATCH_INTERVAL_SECONDS)
+    
     if EMERGENT_AVAILABLE:
         logger.info("✅ emergentintegrations library available")
     else:
         logger.warning("⚠️ emergentintegrations library not available - AI features disabled")
+    if FAST_SERIALIZATION and not ORJSON_AVAILABLE:
+        logger.warning("⚠️ FAST_SERIALIZATION is on but orjson is not installed - using the stdlib JSON encoder")
     
     logger.info("🚀 NetworkingAI API started successfully")
\ No newline at end of file
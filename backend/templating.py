@@ -0,0 +1,158 @@
+"""Compiler for user-authored email templates.
+
+Templates are parsed once into a tree of small render closures; rendering a
+contact only walks that tree, so personalizing a large batch never re-parses
+the source. Syntax:
+
+    {{field}}                  the field's value, empty when missing
+    {{field|fallback}}         the field's value, or `fallback` when empty
+    {{#field}}...{{/field}}    rendered only when field is non-empty
+    {{^field}}...{{/field}}    rendered only when field is empty
+"""
+import re
+from collections import OrderedDict
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple, Union
+
+Renderer = Callable[[Mapping[str, Any]], str]
+
+_TAG = re.compile(r"\{\{\s*([#^/]?)\s*([A-Za-z_]\w*)\s*(?:\|([^}]*))?\}\}")
+
+
+class TemplateSyntaxError(ValueError):
+    pass
+
+
+def is_empty(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, (list, tuple, set, dict)):
+        return not value
+    return False
+
+
+def format_value(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, Enum):
+        return str(value.value)
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, (list, tuple, set)):
+        return ", ".join(format_value(item) for item in value)
+    return str(value)
+
+
+def _join(parts: List[Union[str, Renderer]]) -> Renderer:
+    # Merge neighbouring literals so rendering touches as few parts as possible
+    merged: List[Union[str, Renderer]] = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        elif part != "":
+            merged.append(part)
+
+    if not merged:
+        return lambda values: ""
+    if len(merged) == 1:
+        only = merged[0]
+        return (lambda values: only) if isinstance(only, str) else only
+    return lambda values: "".join([part if part.__class__ is str else part(values) for part in merged])
+
+
+def _variable(name: str, fallback: str) -> Renderer:
+    def render(values: Mapping[str, Any]) -> str:
+        value = values.get(name)
+        return fallback if is_empty(value) else format_value(value)
+    return render
+
+
+def _section(name: str, inverted: bool, inner: Renderer) -> Renderer:
+    def render(values: Mapping[str, Any]) -> str:
+        return inner(values) if is_empty(values.get(name)) == inverted else ""
+    return render
+
+
+def compile_template(source: str) -> Tuple[Renderer, FrozenSet[str]]:
+    """Compile template source into a render function and the fields it reads"""
+    fields = set()
+    # Each frame: (section name, inverted, parts collected so far)
+    stack: List[Tuple[Optional[str], bool, List[Union[str, Renderer]]]] = [(None, False, [])]
+    position = 0
+    for match in _TAG.finditer(source):
+        stack[-1][2].append(source[position:match.start()])
+        position = match.end()
+        kind, name, fallback = match.group(1), match.group(2), match.group(3)
+        fields.add(name)
+        if kind in ("#", "^"):
+            stack.append((name, kind == "^", []))
+        elif kind == "/":
+            opened, inverted, parts = stack.pop() if len(stack) > 1 else (None, False, [])
+            if opened != name:
+                expected = f", expected {{{{/{opened}}}}}" if opened else ""
+                raise TemplateSyntaxError(f"unexpected {{{{/{name}}}}}{expected}")
+            stack[-1][2].append(_section(name, inverted, _join(parts)))
+        else:
+            stack[-1][2].append(_variable(name, (fallback or "").strip()))
+    stack[-1][2].append(source[position:])
+
+    if len(stack) > 1:
+        raise TemplateSyntaxError(f"{{{{#{stack[-1][0]}}}}} is never closed")
+    return _join(stack[0][2]), frozenset(fields)
+
+
+class CompiledEmailTemplate:
+    """Subject and body of one email template, compiled"""
+
+    __slots__ = ("subject", "body", "fields", "renders")
+
+    def __init__(self, subject: str, body: str):
+        self.subject, subject_fields = compile_template(subject)
+        self.body, body_fields = compile_template(body)
+        self.fields = subject_fields | body_fields
+        self.renders = 0
+
+    def render(self, values: Mapping[str, Any]) -> Tuple[str, str]:
+        self.renders += 1
+        return self.subject(values), self.body(values)
+
+
+class EmailTemplateCache:
+    """LRU of compiled email templates keyed by template id and created_at.
+
+    Templates are immutable once stored, so (id, created_at) identifies one
+    version of the source; a template recreated under the same id compiles
+    afresh.
+    """
+
+    def __init__(self, max_templates: int = 512):
+        self.max_templates = max_templates
+        self._compiled: "OrderedDict[tuple, CompiledEmailTemplate]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template: Mapping[str, Any]) -> CompiledEmailTemplate:
+        key = (template["id"], template.get("created_at"))
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self.hits += 1
+            self._compiled.move_to_end(key)
+            return compiled
+
+        self.misses += 1
+        compiled = CompiledEmailTemplate(template["subject"], template["body"])
+        self._compiled[key] = compiled
+        while len(self._compiled) > self.max_templates:
+            self._compiled.popitem(last=False)
+        return compiled
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "compiled_templates": len(self._compiled),
+            "hits": self.hits,
+            "misses": self.misses,
+            "renders": sum(compiled.renders for compiled in self._compiled.values()),
+        }
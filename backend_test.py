@@ -56,6 +56,24 @@ class NetworkingAITester:
             self.log_result("Health Check", False, "Connection failed", str(e))
         return False
     
+    def test_index_health(self):
+        """Test that no registered query shape falls back to a collection scan"""
+        try:
+            response = requests.get(f"{API_BASE}/health/indexes", timeout=15)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('status') == 'ok':
+                    self.log_result("Index Health Check", True, f"{len(data.get('query_shapes', []))} query shapes use indexes")
+                    return True
+                else:
+                    self.log_result("Index Health Check", False, "Query shapes doing COLLSCAN", data.get('collscans'))
+            else:
+                self.log_result("Index Health Check", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Index Health Check", False, "Request failed", str(e))
+        
+        return False
+    
     def test_contact_crud(self):
         """Test Contact CRUD operations"""
         # Test Create Contact
@@ -287,6 +305,24 @@ class NetworkingAITester:
         
         return False
     
+    def test_analytics_rollup(self):
+        """Test that the incrementally maintained analytics rollup has not drifted"""
+        try:
+            response = requests.post(f"{API_BASE}/analytics/rebuild", timeout=30)
+            if response.status_code == 200:
+                drift = response.json().get('drift')
+                if drift == {}:
+                    self.log_result("Analytics Rollup Consistency", True, "Rollup matches a full recomputation")
+                    return True
+                else:
+                    self.log_result("Analytics Rollup Consistency", False, "Rollup drifted from the collections", drift)
+            else:
+                self.log_result("Analytics Rollup Consistency", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Analytics Rollup Consistency", False, "Request failed", str(e))
+        
+        return False
+    
     def test_networking_goals(self):
         """Test networking goals management"""
         goals_data = {
@@ -472,6 +508,7 @@ class NetworkingAITester:
         # High Priority Tests
         print("\n🔥 HIGH PRIORITY TESTS:")
         health_ok = self.test_health_check()
+        indexes_ok = self.test_index_health()
         contact_crud_ok = self.test_contact_crud()
         contacts_list_ok = self.test_get_all_contacts()
         ai_email_ok = self.test_ai_email_generation()
@@ -484,6 +521,7 @@ class NetworkingAITester:
         goals_ok = self.test_networking_goals()
         interactions_ok = self.test_interaction_logging()
         enums_ok = self.test_enum_values()
+        rollup_ok = self.test_analytics_rollup()
         
         # Cleanup
         print("\n🧹 CLEANUP:")
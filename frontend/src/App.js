@@ -22,7 +22,7 @@ function App() {
 
   const loadContacts = async () => {
     try {
-      const response = await axios.get(`${API}/contacts`);
+      const response = await axios.get(`${API}/contacts`, { params: { view: 'summary' } });
       setContacts(response.data);
     } catch (error) {
       console.error('Error loading contacts:', error);
@@ -31,7 +31,7 @@ function App() {
 
   const loadCampaigns = async () => {
     try {
-      const response = await axios.get(`${API}/campaigns`);
+      const response = await axios.get(`${API}/campaigns`, { params: { view: 'summary' } });
       setCampaigns(response.data);
     } catch (error) {
       console.error('Error loading campaigns:', error);
@@ -195,7 +195,7 @@ const Dashboard = ({ analytics, contacts, campaigns }) => {
                 <div key={campaign.id} className="campaign-item">
                   <div className="campaign-info">
                     <h4 className="campaign-name">{campaign.name}</h4>
-                    <p className="campaign-stats">{campaign.contact_ids.length} contacts • {campaign.sent_count} sent</p>
+                    <p className="campaign-stats">{campaign.contact_count} contacts • {campaign.sent_count} sent</p>
                   </div>
                   <div className="campaign-status active">Active</div>
                 </div>
@@ -213,6 +213,8 @@ const Dashboard = ({ analytics, contacts, campaigns }) => {
 // Contacts View Component
 const ContactsView = ({ contacts, loadContacts }) => {
   const [showForm, setShowForm] = useState(false);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
   const [formData, setFormData] = useState({
     name: '', email: '', company: '', position: '', industry: '', 
     linkedin_url: '', phone: '', notes: '', priority: 'medium', tags: []
@@ -238,6 +240,26 @@ const ContactsView = ({ contacts, loadContacts }) => {
     setFormData(prev => ({ ...prev, [name]: value }));
   };
 
+  // Search as you type, waiting for a short pause between keystrokes
+  useEffect(() => {
+    const query = searchQuery.trim();
+    if (!query) {
+      setSearchResults(null);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/contacts/search`, { params: { q: query } });
+        setSearchResults(response.data);
+      } catch (error) {
+        console.error('Error searching contacts:', error);
+      }
+    }, 200);
+    return () => clearTimeout(timer);
+  }, [searchQuery]);
+
+  const visibleContacts = searchResults || contacts;
+
   return (
     <div className="contacts-view">
       <div className="view-header">
@@ -250,6 +272,14 @@ const ContactsView = ({ contacts, loadContacts }) => {
         </button>
       </div>
 
+      <input
+        type="search"
+        placeholder="Search contacts by name, email, company..."
+        value={searchQuery}
+        onChange={(e) => setSearchQuery(e.target.value)}
+        className="form-input contact-search"
+      />
+
       {showForm && (
         <div className="modal">
           <div className="modal-content">
@@ -350,7 +380,7 @@ const ContactsView = ({ contacts, loadContacts }) => {
       )}
 
       <div className="contacts-grid">
-        {contacts.map(contact => (
+        {visibleContacts.map(contact => (
           <div key={contact.id} className="contact-card">
             <div className="contact-card-header">
               <div className="contact-avatar">{contact.name.charAt(0)}</div>
@@ -378,7 +408,13 @@ const ContactsView = ({ contacts, loadContacts }) => {
         ))}
       </div>
       
-      {contacts.length === 0 && (
+      {searchResults && searchResults.length === 0 && (
+        <div className="empty-state">
+          <h3>No matching contacts</h3>
+        </div>
+      )}
+
+      {contacts.length === 0 && !searchResults && (
         <div className="empty-state">
           <h3>No contacts yet</h3>
           <p>Start building your network by adding your first contact</p>
@@ -519,14 +555,34 @@ const EmailGeneratorView = ({ contacts }) => {
     if (!selectedContact) return;
 
     setLoading(true);
+    setGeneratedEmail({ subject: '', body: '', personalization_notes: [] });
     try {
-      const response = await axios.post(`${API}/generate-email`, {
-        contact_id: selectedContact,
-        email_type: emailType,
-        context: context,
-        tone: tone
+      const response = await fetch(`${API}/generate-email/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          contact_id: selectedContact,
+          email_type: emailType,
+          context: context,
+          tone: tone
+        })
       });
-      setGeneratedEmail(response.data);
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+
+      // Render the subject and body progressively as Server-Sent Events arrive
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        events.forEach(handleStreamEvent);
+      }
     } catch (error) {
       console.error('Error generating email:', error);
       setGeneratedEmail({
@@ -539,6 +595,23 @@ const EmailGeneratorView = ({ contacts }) => {
     }
   };
 
+  const handleStreamEvent = (rawEvent) => {
+    let eventName = 'message';
+    let data = '';
+    rawEvent.split('\n').forEach(line => {
+      if (line.startsWith('event: ')) eventName = line.slice(7);
+      if (line.startsWith('data: ')) data += line.slice(6);
+    });
+    if (!data) return;
+
+    const payload = JSON.parse(data);
+    if (eventName === 'delta' && (payload.field === 'subject' || payload.field === 'body')) {
+      setGeneratedEmail(prev => ({ ...prev, [payload.field]: (prev?.[payload.field] || '') + payload.text }));
+    } else if (eventName === 'done') {
+      setGeneratedEmail(payload);
+    }
+  };
+
   const selectedContactData = contacts.find(c => c.id === selectedContact);
 
   return (
@@ -756,7 +829,7 @@ const CampaignsView = ({ campaigns, loadCampaigns, contacts }) => {
               <div className="campaign-stats">
                 <div className="stat">
                   <span className="stat-label">Contacts:</span>
-                  <span className="stat-value">{campaign.contact_ids.length}</span>
+                  <span className="stat-value">{campaign.contact_count}</span>
                 </div>
                 <div className="stat">
                   <span className="stat-label">Sent:</span>
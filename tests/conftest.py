@@ -0,0 +1,22 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# Tests run offline: fake LLM completions, mail kept in memory
+os.environ.setdefault("LLM_FAKE", "true")
+os.environ.setdefault("MAIL_TRANSPORT", "memory")
+
+
+@pytest.fixture
+def server_db(monkeypatch):
+    """server.py wired to a fresh in-memory database"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    db = mongomock_motor.AsyncMongoMockClient()["networkingai_test"]
+    monkeypatch.setattr(server, "db", db)
+    return db
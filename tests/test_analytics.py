@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import server
+from server import (
+    Campaign,
+    CampaignCreate,
+    CampaignStatus,
+    CampaignUpdate,
+    Contact,
+    ContactBulkUpdate,
+    ContactCreate,
+    ContactStatus,
+    ContactUpdate,
+    InteractionLogCreate,
+    Priority,
+)
+
+
+def test_analytics_are_aggregated_from_both_collections(server_db):
+    async def scenario():
+        old = datetime.utcnow() - timedelta(days=90)
+        contacts = [
+            Contact(name="Ada", email="ada@example.com", status=ContactStatus.RESPONDED, priority=Priority.HIGH, lead_score=80, relationship_strength=40),
+            Contact(name="Alan", email="alan@example.com", lead_score=40, relationship_strength=20),
+            Contact(name="Grace", email="grace@example.com", status=ContactStatus.CONTACTED, lead_score=60, created_at=old),
+        ]
+        await server_db.contacts.insert_many([server.contact_storage_doc(contact.dict()) for contact in contacts])
+        await server_db.campaigns.insert_many([
+            Campaign(name="Launch", status=CampaignStatus.ACTIVE, sent_count=10, response_count=4, conversion_count=1).dict(),
+            Campaign(name="Old", status=CampaignStatus.COMPLETED, sent_count=10, response_count=1, created_at=old).dict(),
+        ])
+        return await server.get_analytics()
+
+    analytics = asyncio.run(scenario())
+    assert analytics.total_contacts == 3
+    assert analytics.contacts_by_status == {"new": 1, "contacted": 1, "responded": 1, "converted": 0}
+    assert analytics.contacts_by_priority == {"low": 0, "medium": 2, "high": 1}
+    assert analytics.total_campaigns == 2
+    assert analytics.campaigns_by_status == {"draft": 0, "active": 1, "paused": 0, "completed": 1}
+    assert analytics.email_performance == {
+        "total_sent": 20, "total_responses": 5, "total_conversions": 1, "response_rate": 25.0, "conversion_rate": 5.0,
+    }
+    assert analytics.relationship_scores == {"average_lead_score": 60.0, "average_relationship_strength": 20.0}
+    assert analytics.monthly_growth == {"new_contacts": 2, "new_campaigns": 1}
+
+
+def test_analytics_of_an_empty_database_are_zero(server_db):
+    analytics = asyncio.run(server.get_analytics())
+    assert (analytics.total_contacts, analytics.total_campaigns) == (0, 0)
+    assert set(analytics.contacts_by_status.values()) == {0}
+    assert analytics.email_performance["response_rate"] == 0
+    assert analytics.relationship_scores == {"average_lead_score": 0, "average_relationship_strength": 0}
+
+
+def test_rollup_does_not_drift_across_writes(server_db):
+    async def scenario():
+        await server.rebuild_analytics_rollup()
+        ada, alan, grace = [
+            await server.create_contact(ContactCreate(name=name, email=f"{name.lower()}@example.com", company="Initech"))
+            for name in ("Ada", "Alan", "Grace")
+        ]
+        await server.update_contact(ada.id, ContactUpdate(status=ContactStatus.RESPONDED, priority=Priority.HIGH))
+        await server.create_interaction_log(InteractionLogCreate(contact_id=alan.id, type="email_sent"))
+        await server.bulk_update_contacts(ContactBulkUpdate(ids=[alan.id, grace.id], update=ContactUpdate(status=ContactStatus.CONTACTED)))
+        await server.delete_contact(grace.id)
+        campaign = await server.create_campaign(CampaignCreate(name="Launch", contact_ids=[ada.id, alan.id]))
+        await server.update_campaign(campaign.id, CampaignUpdate(status=CampaignStatus.PAUSED))
+        served = await server.get_analytics()
+        _, drift = await server.rebuild_analytics_rollup()
+        return served, drift
+
+    served, drift = asyncio.run(scenario())
+    assert drift == {}
+    assert served.total_contacts == 2
+    assert served.contacts_by_status["responded"] == 1
+    assert served.contacts_by_status["contacted"] == 1
+    assert served.campaigns_by_status["paused"] == 1
+
+
+def test_rebuild_reports_and_corrects_drift(server_db):
+    async def scenario():
+        await server.create_contact(ContactCreate(name="Ada", email="ada@example.com"))
+        await server.rebuild_analytics_rollup()
+        await server_db.analytics_rollups.update_one({"_id": server.ANALYTICS_ROLLUP_ID}, {"$inc": {"total_contacts": 5}})
+        _, drift = await server.rebuild_analytics_rollup()
+        return drift, await server.get_analytics()
+
+    drift, analytics = asyncio.run(scenario())
+    assert drift == {"total_contacts": {"stored": 6, "actual": 1}}
+    assert analytics.total_contacts == 1
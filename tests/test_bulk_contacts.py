@@ -0,0 +1,241 @@
+import asyncio
+import csv
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import server
+from server import ContactBulkSelection, ContactBulkUpdate, ContactCreate, ContactFilter, ContactUpdate
+
+
+async def _create_contacts(*contacts: ContactCreate):
+    return [await server.create_contact(contact) for contact in contacts]
+
+
+def _bulk_update(**request):
+    return server.bulk_update_contacts(ContactBulkUpdate(**request))
+
+
+def test_bulk_update_refreshes_search_keys_of_contacts_it_moved_out_of_the_filter(server_db):
+    async def scenario():
+        await _create_contacts(
+            ContactCreate(name="Ada Lovelace", email="ada@example.com", company="Initech"),
+            ContactCreate(name="Alan Turing", email="alan@example.com", company="Initech"),
+        )
+        result = await _bulk_update(filter=ContactFilter(company="Initech"), update=ContactUpdate(company="Globex"))
+        return result, await server_db.contacts.find({}, projection={"_id": 0, "search_terms": 1}).to_list(None)
+
+    result, contacts = asyncio.run(scenario())
+    assert result.modified == 2
+    for contact in contacts:
+        assert "globex" in contact["search_terms"]
+        assert "initech" not in contact["search_terms"]
+
+
+def test_bulk_update_rescores_contacts_it_moved_out_of_the_filter(server_db):
+    async def scenario():
+        await _create_contacts(
+            ContactCreate(name="Ada Lovelace", email="ada@example.com"),
+            ContactCreate(name="Alan Turing", email="alan@example.com"),
+        )
+        await server.rebuild_analytics_rollup()
+        await _bulk_update(filter=ContactFilter(status="new"), update=ContactUpdate(status="contacted", position="CTO"))
+        contacts = await server_db.contacts.find({}, projection={"_id": 0}).to_list(None)
+        rollup = await server_db.analytics_rollups.find_one({"_id": server.ANALYTICS_ROLLUP_ID})
+        _, drift = await server.rebuild_analytics_rollup()
+        return contacts, rollup, drift
+
+    contacts, rollup, drift = asyncio.run(scenario())
+    assert [contact["lead_score"] for contact in contacts] == [server.score_contact(contact) for contact in contacts]
+    assert all(contact["lead_score"] == 60 for contact in contacts)
+    assert rollup["lead_score_sum"] == 120
+    assert drift == {}
+
+
+def test_bulk_update_derives_next_best_key_in_the_same_write(server_db):
+    async def scenario():
+        await _create_contacts(
+            ContactCreate(name="Ada Lovelace", email="ada@example.com", priority="low"),
+            ContactCreate(name="Alan Turing", email="alan@example.com", priority="low"),
+        )
+        await _bulk_update(filter=ContactFilter(priority="low"), update=ContactUpdate(priority="high"))
+        return await server_db.contacts.find({}, projection={"_id": 0}).to_list(None)
+
+    contacts = asyncio.run(scenario())
+    for contact in contacts:
+        assert contact["priority"] == "high"
+        assert contact["next_best_key"] == pytest.approx(server.next_best_key(contact))
+
+
+def _numbered_contacts(count: int, **fields):
+    return [ContactCreate(name=f"Contact {i}", email=f"contact{i}@example.com", **fields) for i in range(count)]
+
+
+def test_bulk_update_by_filter_writes_in_batches(server_db, monkeypatch):
+    monkeypatch.setattr(server, "BULK_WRITE_BATCH_SIZE", 2)
+    written = []
+    id_batches = server._bulk_id_batches
+
+    async def recording_id_batches(selection, filter_dict):
+        async for ids in id_batches(selection, filter_dict):
+            written.append(len(ids))
+            yield ids
+
+    monkeypatch.setattr(server, "_bulk_id_batches", recording_id_batches)
+
+    async def scenario():
+        await _create_contacts(*_numbered_contacts(5))
+        await server.rebuild_analytics_rollup()
+        result = await _bulk_update(filter=ContactFilter(status="new"), update=ContactUpdate(status="contacted"))
+        statuses = await server_db.contacts.distinct("status")
+        _, drift = await server.rebuild_analytics_rollup()
+        return result, statuses, drift
+
+    result, statuses, drift = asyncio.run(scenario())
+    assert written == [2, 2, 1]
+    assert (result.matched, result.modified) == (5, 5)
+    assert statuses == ["contacted"]
+    assert drift == {}
+
+
+def test_bulk_update_counts_repeated_ids_once(server_db, monkeypatch):
+    monkeypatch.setattr(server, "BULK_WRITE_BATCH_SIZE", 2)
+
+    async def scenario():
+        contacts = await _create_contacts(*_numbered_contacts(3))
+        await server.rebuild_analytics_rollup()
+        ids = [contact.id for contact in contacts]
+        result = await _bulk_update(ids=ids + ids, update=ContactUpdate(priority="high"))
+        _, drift = await server.rebuild_analytics_rollup()
+        return result, drift
+
+    result, drift = asyncio.run(scenario())
+    assert result.matched == 3
+    assert drift == {}
+
+
+def test_bulk_delete_by_filter_deletes_in_batches_and_cascades_every_id(server_db, monkeypatch):
+    monkeypatch.setattr(server, "BULK_WRITE_BATCH_SIZE", 2)
+
+    async def scenario():
+        contacts = await _create_contacts(*_numbered_contacts(5, company="Initech"), ContactCreate(name="Kept", email="kept@example.com"))
+        for contact in contacts:
+            await server_db.interaction_logs.insert_one(server.InteractionLog(contact_id=contact.id, type="note").dict())
+        await server.rebuild_analytics_rollup()
+        result = await server.bulk_delete_contacts(ContactBulkSelection(filter=ContactFilter(company="Initech")))
+        await asyncio.gather(*server.background_jobs)
+        job = await server_db.cleanup_jobs.find_one({"id": result.cleanup_job_id})
+        remaining = await server_db.contacts.find({}, projection={"_id": 0, "name": 1}).to_list(None)
+        logs = await server_db.interaction_logs.count_documents({})
+        _, drift = await server.rebuild_analytics_rollup()
+        return result, job, remaining, logs, drift
+
+    result, job, remaining, logs, drift = asyncio.run(scenario())
+    assert (result.matched, result.deleted) == (5, 5)
+    assert (job["status"], job["contacts_checked"], job["interaction_logs_deleted"]) == ("completed", 5, 5)
+    assert remaining == [{"name": "Kept"}]
+    assert logs == 1
+    assert drift == {}
+
+
+def test_bulk_delete_finishes_when_its_cascade_fails(server_db, monkeypatch):
+    monkeypatch.setattr(server, "BULK_WRITE_BATCH_SIZE", 1)
+    monkeypatch.setattr(server, "CASCADE_QUEUED_BATCHES", 1)
+
+    async def failing_purge(contact_ids, batch_size):
+        raise RuntimeError("purge failed")
+
+    monkeypatch.setattr(server, "purge_contact_references", failing_purge)
+
+    async def scenario():
+        await _create_contacts(*_numbered_contacts(5, company="Initech"))
+        result = await asyncio.wait_for(server.bulk_delete_contacts(ContactBulkSelection(filter=ContactFilter(company="Initech"))), 5)
+        await asyncio.gather(*server.background_jobs)
+        job = await server_db.cleanup_jobs.find_one({"id": result.cleanup_job_id})
+        return result, job, await server_db.contacts.count_documents({})
+
+    result, job, remaining = asyncio.run(scenario())
+    assert result.deleted == 5
+    assert remaining == 0
+    assert (job["status"], job["error"]) == ("failed", "purge failed")
+
+
+def _import(content: str, filename: str, chunk_size: int = 2):
+    upload = UploadFile(file=io.BytesIO(content.encode()), filename=filename)
+    return server.bulk_import_contacts(file=upload, format=None, chunk_size=chunk_size)
+
+
+def test_csv_import_inserts_valid_rows_and_reports_the_rest(server_db):
+    content = (
+        "name,email,company,tags\n"
+        "Ada Lovelace,ada@example.com,Initech,math; engines\n"
+        "No Email,,Initech,\n"
+        "Alan Turing,alan@example.com,,\n"
+        "Grace Hopper,grace@example.com,Navy,cobol\n"
+    )
+
+    async def scenario():
+        await server.rebuild_analytics_rollup()
+        result = await _import(content, "contacts.csv")
+        contacts = await server_db.contacts.find({}, projection={"_id": 0}).sort("name").to_list(None)
+        _, drift = await server.rebuild_analytics_rollup()
+        return result, contacts, drift
+
+    result, contacts, drift = asyncio.run(scenario())
+    assert (result.total_rows, result.inserted, result.failed) == (4, 3, 1)
+    assert [error.row for error in result.errors] == [2]
+    assert "email" in result.errors[0].error
+    assert [contact["name"] for contact in contacts] == ["Ada Lovelace", "Alan Turing", "Grace Hopper"]
+    assert contacts[0]["tags"] == ["math", "engines"]
+    assert "initech" in contacts[0]["search_terms"]
+    assert drift == {}
+
+
+def test_ndjson_import_reports_unparseable_lines_by_row(server_db):
+    content = "\n".join([
+        '{"name": "Ada Lovelace", "email": "ada@example.com"}',
+        "{not json",
+        "",
+        '["an", "array"]',
+        '{"name": "Alan Turing", "email": "alan@example.com", "priority": "high"}',
+    ])
+
+    async def scenario():
+        result = await _import(content, "contacts.ndjson")
+        return result, await server_db.contacts.count_documents({})
+
+    result, stored = asyncio.run(scenario())
+    assert (result.total_rows, result.inserted, result.failed, stored) == (4, 2, 2, 2)
+    assert [(error.row, error.error.split(":")[0]) for error in result.errors] == [(2, "invalid JSON"), (4, "expected a JSON object")]
+
+
+def test_import_error_list_is_truncated(server_db, monkeypatch):
+    monkeypatch.setattr(server, "BULK_IMPORT_MAX_ERRORS", 2)
+    content = "name,email\n" + "".join(f"Contact {i},\n" for i in range(5))
+    result = asyncio.run(_import(content, "contacts.csv"))
+    assert (result.failed, len(result.errors), result.errors_truncated) == (5, 2, True)
+
+
+def test_import_stopped_by_a_parse_error_reports_the_rows_it_committed(server_db):
+    rows = [f"Contact {i},contact{i}@example.com\n" for i in range(5)]
+    # Longer than the csv module's field size limit
+    rows.insert(3, f"Too Long,{'x' * (csv.field_size_limit() + 1)}\n")
+    content = "name,email\n" + "".join(rows)
+
+    async def scenario():
+        result = await _import(content, "contacts.csv")
+        return result, await server_db.contacts.count_documents({})
+
+    result, stored = asyncio.run(scenario())
+    assert (result.total_rows, result.inserted, result.failed, stored) == (4, 3, 1, 3)
+    assert result.stopped_at_row == 4
+    assert [error.row for error in result.errors] == [4]
+    assert "field larger than field limit" in result.errors[0].error
+
+
+def test_import_that_cannot_be_parsed_at_all_is_rejected(server_db):
+    upload = UploadFile(file=io.BytesIO(b"name,email\n\xff\xfe\n"), filename="contacts.csv")
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.bulk_import_contacts(file=upload, format=None, chunk_size=2))
+    assert raised.value.status_code == 400
@@ -0,0 +1,227 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import server
+from llm import LlmResponseCache
+from mailer import MemoryTransport
+from server import Campaign, CampaignStatus, CampaignUpdate, Contact, EmailGenerationJob, EmailTemplate, JobStatus
+
+
+@pytest.fixture(autouse=True)
+def fresh_llm_cache(monkeypatch):
+    # Seeded contacts repeat across tests, and so do their prompts
+    monkeypatch.setattr(server, "llm_cache", LlmResponseCache())
+
+
+async def _seed_campaign(db, contacts: int):
+    docs = [Contact(name=f"Contact {i}", email=f"contact{i}@example.com").dict() for i in range(contacts)]
+    await db.contacts.insert_many([server.contact_storage_doc(doc) for doc in docs])
+    campaign = Campaign(name="Launch", contact_ids=[doc["id"] for doc in docs]).dict()
+    await db.campaigns.insert_one(dict(campaign))
+    return campaign
+
+
+async def _run_generation_job(db, campaign):
+    job = EmailGenerationJob(campaign_id=campaign["id"], email_type="introduction", tone="professional", total=len(campaign["contact_ids"]))
+    await db.email_generation_jobs.insert_one(job.dict())
+    await server.run_email_generation_job(job, campaign, concurrency=2)
+    drafts = await db.email_drafts.find({"job_id": job.id}).to_list(None)
+    return await db.email_generation_jobs.find_one({"id": job.id}), drafts
+
+
+def test_generation_job_drafts_every_contact_offline(server_db):
+    async def scenario():
+        campaign = await _seed_campaign(server_db, 5)
+        return campaign, *await _run_generation_job(server_db, campaign)
+
+    campaign, job, drafts = asyncio.run(scenario())
+    assert job["status"] == JobStatus.COMPLETED
+    assert (job["completed"], job["failed"]) == (5, 0)
+    assert sorted(draft["contact_id"] for draft in drafts) == sorted(campaign["contact_ids"])
+    assert all(draft["subject"].startswith("Draft ") for draft in drafts)
+
+
+def test_generation_job_records_provider_failures(server_db, monkeypatch):
+    monkeypatch.setenv("LLM_FAKE_FAILURE_RATE", "1")
+    monkeypatch.setattr(server, "EMAIL_BATCH_MAX_ATTEMPTS", 1)
+
+    async def scenario():
+        campaign = await _seed_campaign(server_db, 3)
+        return await _run_generation_job(server_db, campaign)
+
+    job, drafts = asyncio.run(scenario())
+    assert job["status"] == JobStatus.COMPLETED
+    assert (job["completed"], job["failed"]) == (0, 3)
+    assert drafts == []
+    assert all("simulated provider failure" in error["error"] for error in job["errors"])
+
+
+def test_generation_job_counts_failures_outside_the_provider_call(server_db, monkeypatch):
+    def broken_parse(response, email_type, contact):
+        raise ValueError("unparseable draft")
+
+    monkeypatch.setattr(server, "parse_email_response", broken_parse)
+
+    async def scenario():
+        campaign = await _seed_campaign(server_db, 3)
+        return await _run_generation_job(server_db, campaign)
+
+    job, drafts = asyncio.run(scenario())
+    assert job["status"] == JobStatus.COMPLETED
+    assert (job["completed"], job["failed"]) == (0, 3)
+    assert drafts == []
+    assert all(error["error"] == "unparseable draft" for error in job["errors"])
+
+
+def test_cancelled_generation_job_stops_its_drafts_and_is_marked_failed(server_db, monkeypatch):
+    started, stopped = asyncio.Event(), []
+
+    async def hanging_completion(contact_id, system_message, prompt, priority):
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            stopped.append(contact_id)
+
+    monkeypatch.setattr(server, "complete_email", hanging_completion)
+
+    async def scenario():
+        campaign = await _seed_campaign(server_db, 3)
+        job = EmailGenerationJob(campaign_id=campaign["id"], email_type="introduction", tone="professional", total=3)
+        await server_db.email_generation_jobs.insert_one(job.dict())
+        runner = asyncio.create_task(server.run_email_generation_job(job, campaign, concurrency=2))
+        await started.wait()
+        runner.cancel()
+        outcome = (await asyncio.gather(runner, return_exceptions=True))[0]
+        return outcome, list(stopped), await server_db.email_generation_jobs.find_one({"id": job.id})
+
+    outcome, stopped_at_return, job = asyncio.run(scenario())
+    assert isinstance(outcome, asyncio.CancelledError)
+    assert len(stopped_at_return) == 2
+    assert job["status"] == JobStatus.FAILED
+    assert job["errors"][-1]["error"] == "interrupted by shutdown"
+
+
+class FlakyTransport(MemoryTransport):
+    """Memory transport that refuses mail to the addresses in `failing`"""
+
+    def __init__(self, failing):
+        super().__init__()
+        self.failing = set(failing)
+
+    async def send(self, message):
+        if message["To"] in self.failing:
+            raise ConnectionRefusedError(f"recipient {message['To']} refused")
+        await super().send(message)
+
+
+def test_dispatch_logs_refused_sends_as_failed_and_retries_them(server_db, monkeypatch):
+    transport = FlakyTransport({"contact1@example.com"})
+    monkeypatch.setattr(server, "mail_transport", transport)
+
+    async def scenario():
+        campaign = await _seed_campaign(server_db, 3)
+        template = EmailTemplate(name="Hello", subject="Hi {{name}}", body="Hello {{name}}", type="introduction")
+        await server_db.email_templates.insert_one(template.dict())
+        await server.update_campaign(campaign["id"], CampaignUpdate(
+            template_id=template.id, status=CampaignStatus.ACTIVE, scheduled_at=datetime(2020, 1, 1),
+        ))
+        assert await server.dispatch_due_campaigns() == 1
+        first = await server_db.campaigns.find_one({"id": campaign["id"]})
+        failed = await server_db.interaction_logs.find_one({"status": "failed"})
+        await server.rebuild_relationship_strength()
+        refused = await server_db.contacts.find_one({"email": "contact1@example.com"})
+
+        # Reactivate with the transport healthy again: only the refused contact is mailed
+        transport.failing.clear()
+        transport.messages.clear()
+        await server.update_campaign(campaign["id"], CampaignUpdate(status=CampaignStatus.ACTIVE))
+        assert await server.dispatch_due_campaigns() == 1
+        second = await server_db.campaigns.find_one({"id": campaign["id"]})
+        return first, failed, refused, second
+
+    first, failed, refused, second = asyncio.run(scenario())
+    assert (first["sent_count"], first["failed_count"], first["status"]) == (2, 1, CampaignStatus.COMPLETED)
+    assert failed["type"] == "email_failed"
+    assert failed["contact_id"] == refused["id"]
+    assert "refused" in failed["content"]
+    assert (refused["interaction_count"], refused["relationship_strength"]) == (0, 0)
+    assert [message["To"] for message in transport.messages] == ["contact1@example.com"]
+    assert (second["sent_count"], second["status"]) == (3, CampaignStatus.COMPLETED)
+
+
+class StalledDomainThrottle:
+    """Domain throttle that holds every send to `domain` until `release` is set"""
+
+    def __init__(self, domain):
+        self.domain = domain
+        self.release = asyncio.Event()
+
+    async def acquire(self, domain):
+        if domain == self.domain:
+            await self.release.wait()
+
+
+def test_dispatch_keeps_sending_to_other_domains_while_one_is_throttled(server_db, monkeypatch):
+    transport = MemoryTransport()
+    throttle = StalledDomainThrottle("slow.example")
+    monkeypatch.setattr(server, "mail_transport", transport)
+    monkeypatch.setattr(server, "mail_throttle", throttle)
+    monkeypatch.setattr(server, "CAMPAIGN_SEND_CONCURRENCY", 1)
+
+    async def scenario():
+        addresses = [f"slow{i}@slow.example" for i in range(3)] + [f"fast{i}@fast.example" for i in range(2)]
+        docs = [Contact(name=address, email=address).dict() for address in addresses]
+        await server_db.contacts.insert_many([server.contact_storage_doc(doc) for doc in docs])
+        template = EmailTemplate(name="Hello", subject="Hi {{name}}", body="Hello {{name}}", type="introduction")
+        await server_db.email_templates.insert_one(template.dict())
+        campaign = Campaign(name="Launch", contact_ids=[doc["id"] for doc in docs]).dict()
+        await server_db.campaigns.insert_one(dict(campaign))
+        await server.update_campaign(campaign["id"], CampaignUpdate(
+            template_id=template.id, status=CampaignStatus.ACTIVE, scheduled_at=datetime(2020, 1, 1),
+        ))
+
+        dispatch = asyncio.create_task(server.dispatch_due_campaigns())
+        for _ in range(100):
+            if len(transport.messages) == 2:
+                break
+            await asyncio.sleep(0.01)
+        while_stalled = sorted(message["To"] for message in transport.messages)
+        throttle.release.set()
+        await dispatch
+        return while_stalled, await server_db.campaigns.find_one({"id": campaign["id"]})
+
+    while_stalled, campaign = asyncio.run(scenario())
+    assert while_stalled == ["fast0@fast.example", "fast1@fast.example"]
+    assert (campaign["sent_count"], campaign["status"]) == (5, CampaignStatus.COMPLETED)
+
+
+def test_dispatch_that_failed_for_want_of_a_template_runs_once_one_is_set(server_db):
+    async def scenario():
+        campaign = await _seed_campaign(server_db, 2)
+        await server.update_campaign(campaign["id"], CampaignUpdate(status=CampaignStatus.ACTIVE, scheduled_at=datetime(2020, 1, 1)))
+        await server.dispatch_due_campaigns()
+        failed = await server_db.campaigns.find_one({"id": campaign["id"]})
+
+        template = EmailTemplate(name="Hello", subject="Hi {{name}}", body="Hello {{name}}", type="introduction")
+        await server_db.email_templates.insert_one(template.dict())
+        updated = await server.update_campaign(campaign["id"], CampaignUpdate(template_id=template.id))
+        assert await server.dispatch_due_campaigns() == 1
+        return failed, updated, await server_db.campaigns.find_one({"id": campaign["id"]})
+
+    failed, updated, sent = asyncio.run(scenario())
+    assert (failed["dispatch_state"], failed["dispatch_error"]) == ("failed", "Campaign has no email template")
+    assert (updated.dispatch_state, updated.dispatch_error) == (None, None)
+    assert (sent["dispatch_state"], sent["sent_count"], sent["status"]) == ("sent", 2, CampaignStatus.COMPLETED)
+
+
+def test_update_leaves_a_running_dispatch_alone(server_db):
+    async def scenario():
+        campaign = await _seed_campaign(server_db, 1)
+        await server_db.campaigns.update_one({"id": campaign["id"]}, {"$set": {"dispatch_state": "sending"}})
+        await server.update_campaign(campaign["id"], CampaignUpdate(status=CampaignStatus.ACTIVE))
+        return await server_db.campaigns.find_one({"id": campaign["id"]})
+
+    assert asyncio.run(scenario())["dispatch_state"] == "sending"
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from server import CampaignCreate, CampaignUpdate, ContactCreate, ContactFilter
+
+
+async def _contacts(company, count, start=0):
+    return [
+        await server.create_contact(ContactCreate(name=f"{company} {i}", email=f"{company.lower()}{i}@example.com", company=company))
+        for i in range(start, start + count)
+    ]
+
+
+async def _targeted_ids(campaign):
+    return sorted([contact["id"] async for contact in server.iter_campaign_contacts(campaign, {"_id": 0, "id": 1})])
+
+
+def test_filter_campaign_snapshots_its_members_once(server_db, monkeypatch):
+    monkeypatch.setattr(server, "CAMPAIGN_MEMBER_BATCH_SIZE", 2)
+
+    async def scenario():
+        initech = await _contacts("Initech", 3)
+        await _contacts("Globex", 2)
+        created = await server.create_campaign(CampaignCreate(name="Initech", contact_filter=ContactFilter(company="Initech")))
+        campaign = await server_db.campaigns.find_one({"id": created.id}, projection={"_id": 0})
+        targeted = await _targeted_ids(campaign)
+        # Contacts matching after the snapshot are not added to it
+        await _contacts("Initech", 2, start=3)
+        again = await _targeted_ids(await server_db.campaigns.find_one({"id": created.id}, projection={"_id": 0}))
+        stored = await server_db.campaigns.find_one({"id": created.id})
+        return initech, created, targeted, again, stored
+
+    initech, created, targeted, again, stored = asyncio.run(scenario())
+    assert created.contact_count == 3
+    assert created.contact_ids == []
+    assert targeted == again == sorted(contact.id for contact in initech)
+    assert stored["members_resolved_at"] is not None
+    assert stored["contact_count"] == 3
+
+
+def test_retargeting_discards_the_snapshot(server_db):
+    async def scenario():
+        await _contacts("Initech", 2)
+        globex = await _contacts("Globex", 3)
+        created = await server.create_campaign(CampaignCreate(name="Launch", contact_filter=ContactFilter(company="Initech")))
+        await server.resolve_campaign_members(created.dict())
+        updated = await server.update_campaign(created.id, CampaignUpdate(contact_filter=ContactFilter(company="Globex")))
+        members = await server_db.campaign_members.count_documents({"campaign_id": created.id})
+        targeted = await _targeted_ids(await server_db.campaigns.find_one({"id": created.id}, projection={"_id": 0}))
+        return globex, updated, members, targeted
+
+    globex, updated, members, targeted = asyncio.run(scenario())
+    assert (updated.contact_count, updated.members_resolved_at, members) == (3, None, 0)
+    assert targeted == sorted(contact.id for contact in globex)
+
+
+def test_switching_to_a_static_list_clears_the_filter(server_db):
+    async def scenario():
+        ada = (await _contacts("Initech", 1))[0]
+        created = await server.create_campaign(CampaignCreate(name="Launch", contact_filter=ContactFilter(company="Initech")))
+        return ada, await server.update_campaign(created.id, CampaignUpdate(contact_ids=[ada.id, ada.id]))
+
+    ada, updated = asyncio.run(scenario())
+    assert (updated.contact_filter, updated.contact_ids, updated.contact_count) == (None, [ada.id], 1)
+
+
+@pytest.mark.parametrize("targeting", [
+    {"contact_ids": ["a"], "contact_filter": ContactFilter(company="Initech")},
+    {"contact_filter": ContactFilter()},
+])
+def test_invalid_targeting_is_a_400(server_db, targeting):
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.create_campaign(CampaignCreate(name="Launch", **targeting)))
+    assert raised.value.status_code == 400
+
+
+def test_legacy_campaigns_get_contact_count_from_their_ids(server_db):
+    async def scenario():
+        await server_db.campaigns.insert_many([
+            {"id": "legacy", "name": "Legacy", "contact_ids": ["a", "b", "c"]},
+            {"id": "empty", "name": "Empty"},
+            {"id": "current", "name": "Current", "contact_ids": ["a"], "contact_count": 7},
+        ])
+        updated = await server.refresh_campaign_counts()
+        counts = {c["id"]: c["contact_count"] async for c in server_db.campaigns.find({}, projection={"_id": 0, "id": 1, "contact_count": 1})}
+        return updated, counts, await server.refresh_campaign_counts()
+
+    updated, counts, again = asyncio.run(scenario())
+    assert updated == 2
+    assert counts == {"legacy": 3, "empty": 0, "current": 7}
+    assert again == 0
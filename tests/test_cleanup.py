@@ -0,0 +1,105 @@
+import asyncio
+
+import server
+from server import CampaignCreate, ContactCreate, ContactFilter, InteractionLog, JobStatus
+
+
+async def _seed(db):
+    """Three contacts with two logs each, a listed campaign and a filter-targeted one with its snapshot"""
+    contacts = [
+        await server.create_contact(ContactCreate(name=name, email=f"{name.lower()}@example.com", company="Initech"))
+        for name in ("Ada", "Alan", "Grace")
+    ]
+    ids = [contact.id for contact in contacts]
+    await db.interaction_logs.insert_many([
+        InteractionLog(contact_id=contact_id, type="note", content=f"note {n}").dict() for contact_id in ids for n in range(2)
+    ])
+    listed = await server.create_campaign(CampaignCreate(name="Listed", contact_ids=ids))
+    filtered = await server.create_campaign(CampaignCreate(name="Filtered", contact_filter=ContactFilter(company="Initech")))
+    await server.resolve_campaign_members(filtered.dict())
+    return ids, listed.id, filtered.id
+
+
+async def _state(db, listed_id, filtered_id):
+    listed = await db.campaigns.find_one({"id": listed_id})
+    filtered = await db.campaigns.find_one({"id": filtered_id})
+    members = await db.campaign_members.find({"campaign_id": filtered_id}).to_list(None)
+    logs = await db.interaction_logs.find({}).to_list(None)
+    return {
+        "listed": (listed["contact_ids"], listed["contact_count"]),
+        "filtered": (sorted(member["contact_id"] for member in members), filtered["contact_count"]),
+        "log_contacts": sorted(log["contact_id"] for log in logs),
+    }
+
+
+def test_purge_removes_logs_and_memberships_of_deleted_contacts(server_db):
+    async def scenario():
+        ids, listed_id, filtered_id = await _seed(server_db)
+        # A batch size of one makes the log deletion loop go round
+        purged = await server.purge_contact_references([ids[0]], batch_size=1)
+        return ids, purged, await _state(server_db, listed_id, filtered_id)
+
+    (ada, alan, grace), purged, state = asyncio.run(scenario())
+    assert purged == (2, 2)
+    assert state["listed"] == ([alan, grace], 2)
+    assert state["filtered"] == (sorted([alan, grace]), 2)
+    assert state["log_contacts"] == sorted([alan, alan, grace, grace])
+
+
+def test_cascade_job_purges_deleted_contacts_in_batches(server_db, monkeypatch):
+    monkeypatch.setattr(server, "CLEANUP_BATCH_SIZE", 1)
+
+    async def scenario():
+        ids, listed_id, filtered_id = await _seed(server_db)
+        await server_db.contacts.delete_many({"id": {"$in": ids[:2]}})
+        job = await server.cascade_contact_deletion(ids[:2])
+        await asyncio.gather(*server.background_jobs)
+        finished = await server_db.cleanup_jobs.find_one({"id": job.id})
+        return ids, finished, await _state(server_db, listed_id, filtered_id)
+
+    (ada, alan, grace), job, state = asyncio.run(scenario())
+    assert job["status"] == JobStatus.COMPLETED
+    assert (job["contacts_checked"], job["interaction_logs_deleted"], job["campaigns_updated"]) == (2, 4, 4)
+    assert state["listed"] == ([grace], 1)
+    assert state["filtered"] == ([grace], 1)
+    assert state["log_contacts"] == [grace, grace]
+
+
+def test_sweep_purges_orphans_and_leaves_live_contacts_alone(server_db):
+    async def scenario():
+        ids, listed_id, filtered_id = await _seed(server_db)
+        # Deleted without a cascade, as if the process died before it ran
+        await server_db.contacts.delete_one({"id": ids[1]})
+        live_logs = await server_db.interaction_logs.find({"contact_id": {"$ne": ids[1]}}).to_list(None)
+        job = await server.sweep_orphans(batch_size=2)
+        kept_logs = await server_db.interaction_logs.find({}).to_list(None)
+        second = await server.sweep_orphans()
+        return ids, job, second, live_logs, kept_logs, await _state(server_db, listed_id, filtered_id)
+
+    (ada, alan, grace), job, second, live_logs, kept_logs, state = asyncio.run(scenario())
+    assert job.kind == "orphan_sweep" and job.status == JobStatus.COMPLETED
+    assert (job.interaction_logs_deleted, job.campaigns_updated) == (2, 2)
+    assert kept_logs == live_logs
+    assert state["listed"] == ([ada, grace], 2)
+    assert state["filtered"] == (sorted([ada, grace]), 2)
+    assert (second.interaction_logs_deleted, second.campaigns_updated) == (0, 0)
+
+
+def test_cancelled_cleanup_job_is_marked_failed_and_reraises(server_db):
+    async def scenario():
+        job = await server.create_cleanup_job("cascade")
+
+        async def stalled_batches():
+            yield 1, []
+            await asyncio.Event().wait()
+            yield 1, []
+
+        runner = asyncio.create_task(server.run_cleanup_job(job, stalled_batches()))
+        await asyncio.sleep(0.05)
+        runner.cancel()
+        outcome = (await asyncio.gather(runner, return_exceptions=True))[0]
+        return outcome, await server_db.cleanup_jobs.find_one({"id": job.id})
+
+    outcome, job = asyncio.run(scenario())
+    assert isinstance(outcome, asyncio.CancelledError)
+    assert (job["status"], job["error"], job["contacts_checked"]) == (JobStatus.FAILED, "interrupted by shutdown", 1)
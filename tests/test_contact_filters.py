@@ -0,0 +1,61 @@
+import asyncio
+
+from fastapi import Response
+
+import server
+from server import ContactCreate, ContactFilter
+
+
+async def _seed():
+    for name, tags, industry, company in [
+        ("Ada", ["ai", "founder"], "Software", "Initech"),
+        ("Alan", ["ai"], "Software", "Globex"),
+        ("Grace", ["founder", "navy"], "Defense", "Initech"),
+        ("Linus", [], None, None),
+    ]:
+        await server.create_contact(ContactCreate(
+            name=name, email=f"{name.lower()}@example.com", tags=tags, industry=industry, company=company,
+        ))
+
+
+async def _names(**filters):
+    contacts = await server.get_contacts(Response(), ContactFilter(**filters), limit=100, cursor=None, view="full", fields=None)
+    return sorted(contact.name for contact in contacts)
+
+
+def test_tag_match_any_and_all(server_db):
+    async def scenario():
+        await _seed()
+        return (
+            await _names(tags=["ai", "founder"]),
+            await _names(tags=["ai", "founder"], tag_match="all"),
+            await _names(tags=["founder"], company="Initech", industry="Defense"),
+        )
+
+    any_tag, all_tags, combined = asyncio.run(scenario())
+    assert any_tag == ["Ada", "Alan", "Grace"]
+    assert all_tags == ["Ada"]
+    assert combined == ["Grace"]
+
+
+def _counts(facets):
+    return [(row.value, row.count) for row in facets]
+
+
+def test_facets_count_the_filtered_contacts_most_common_first(server_db):
+    async def scenario():
+        await _seed()
+        everyone = await server.get_contact_facets(ContactFilter(), facet_limit=20)
+        founders = await server.get_contact_facets(ContactFilter(tags=["founder"]), facet_limit=20)
+        top_tag = await server.get_contact_facets(ContactFilter(), facet_limit=1)
+        return everyone, founders, top_tag
+
+    everyone, founders, top_tag = asyncio.run(scenario())
+    assert everyone.total == 4
+    assert _counts(everyone.tags) == [("ai", 2), ("founder", 2), ("navy", 1)]
+    assert _counts(everyone.industry) == [("Software", 2), ("Defense", 1)]
+    assert _counts(everyone.company) == [("Initech", 2), ("Globex", 1)]
+    assert founders.total == 2
+    assert _counts(founders.tags) == [("founder", 2), ("ai", 1), ("navy", 1)]
+    assert _counts(founders.company) == [("Initech", 2)]
+    assert _counts(top_tag.tags) == [("ai", 2)]
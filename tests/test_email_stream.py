@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+from llm import FakeLlmChat, LlmResponseCache
+from server import ContactCreate, EmailGenerationRequest
+
+
+class ProviderChats:
+    """Hands the stream slow fake chats and records each one it opens"""
+
+    def __init__(self):
+        self.opened = []
+        self.failure_rate = 0.0
+
+    async def get_llm_chat(self, session_id, system_message):
+        chat = FakeLlmChat(session_id=session_id, system_message=system_message, latency=0.05, failure_rate=self.failure_rate)
+        self.opened.append(chat)
+        return chat
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(server, "llm_cache", LlmResponseCache())
+    chats = ProviderChats()
+    monkeypatch.setattr(server, "get_llm_chat", chats.get_llm_chat)
+    return chats
+
+
+async def _stream(contact_id):
+    response = await server.generate_email_stream(EmailGenerationRequest(contact_id=contact_id, email_type="introduction"))
+    events = []
+    async for message in response.body_iterator:
+        event, data = message.split("\n")[:2]
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def _concurrent_streams(callers: int):
+    async def scenario():
+        contact = await server.create_contact(ContactCreate(name="Ada Lovelace", email="ada@example.com", company="Initech"))
+        return await asyncio.gather(*(_stream(contact.id) for _ in range(callers)))
+    return asyncio.run(scenario())
+
+
+def _done(events):
+    return next(data for event, data in events if event == "done")
+
+
+def test_concurrent_identical_streams_share_one_completion(server_db, provider):
+    first, second, third = _concurrent_streams(3)
+    assert len(provider.opened) == 1
+    assert _done(first) == _done(second) == _done(third)
+    assert _done(first)["subject"].startswith("Draft ")
+    # Waiters replay the finished completion as deltas too
+    assert any(event == "delta" for event, _ in second)
+    assert server.llm_cache.stats()["coalesced"] == 2
+    assert server.llm_cache.stats()["inflight"] == 0
+
+
+def test_waiters_fall_back_when_the_shared_stream_fails(server_db, provider):
+    provider.failure_rate = 1.0
+    first, second = _concurrent_streams(2)
+    assert len(provider.opened) == 1
+    assert [event for event, _ in first if event == "error"] == ["error"]
+    assert [event for event, _ in second if event == "error"] == ["error"]
+    assert server.llm_cache.stats()["inflight"] == 0
+
+
+@pytest.fixture
+def settlements(monkeypatch):
+    settled = []
+    settle = server.settle_llm_budget
+
+    def recording_settle(reserved, system_message, prompt, response):
+        settled.append((reserved, response))
+        settle(reserved, system_message, prompt, response)
+
+    monkeypatch.setattr(server, "settle_llm_budget", recording_settle)
+    return settled
+
+
+def test_failed_stream_settles_its_budget_reservation(server_db, provider, settlements):
+    provider.failure_rate = 1.0
+    _concurrent_streams(1)
+    assert len(settlements) == 1
+    reserved, response = settlements[0]
+    assert reserved > 0 and response == ""
+
+
+def test_abandoned_stream_settles_its_budget_reservation(server_db, provider, settlements):
+    async def scenario():
+        contact = await server.create_contact(ContactCreate(name="Ada Lovelace", email="ada@example.com", company="Initech"))
+        response = await server.generate_email_stream(EmailGenerationRequest(contact_id=contact.id, email_type="introduction"))
+        stream = response.body_iterator
+        async for message in stream:
+            if message.startswith("event: delta"):
+                break
+        await stream.aclose()  # the client disconnects mid-stream
+
+    asyncio.run(scenario())
+    assert len(settlements) == 1
+    assert settlements[0][1] != ""
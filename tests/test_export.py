@@ -0,0 +1,78 @@
+import asyncio
+import io
+import json
+from datetime import datetime, timedelta
+
+from fastapi import UploadFile
+
+import server
+from server import Contact, ContactFilter, ContactStatus, InteractionLog
+
+
+async def _body(response):
+    return [chunk async for chunk in response.body_iterator]
+
+
+async def _seed_contacts(db):
+    # Whole-second timestamps survive the trip through BSON unchanged
+    contacts = [
+        Contact(name=name, email=email, created_at=datetime(2024, 1, day), updated_at=datetime(2024, 1, day), **fields)
+        for day, (name, email, fields) in enumerate([
+            ("Ada Lovelace", "ada@example.com", {"company": "Initech", "tags": ["math", "engines"], "status": ContactStatus.CONTACTED}),
+            ("Alan Turing", "alan@example.com", {"notes": 'Said "hi", then left'}),
+            ("Grace Hopper", "grace@example.com", {"company": "Navy", "status": ContactStatus.CONTACTED}),
+        ], start=1)
+    ]
+    await db.contacts.insert_many([server.contact_storage_doc(contact.dict()) for contact in contacts])
+    return contacts
+
+
+def test_ndjson_contact_export_round_trips_the_model(server_db):
+    async def scenario():
+        contacts = await _seed_contacts(server_db)
+        response = await server.export_contacts(ContactFilter(status=ContactStatus.CONTACTED), format="ndjson", batch_size=1)
+        return contacts, response, await _body(response)
+
+    contacts, response, chunks = asyncio.run(scenario())
+    assert response.media_type == "application/x-ndjson"
+    assert len(chunks) == 2  # one chunk per batch
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert [Contact(**row) for row in rows] == [contacts[0], contacts[2]]
+    assert all("search_terms" not in row for row in rows)
+
+
+def test_csv_contact_export_can_be_imported_again(server_db):
+    async def scenario():
+        contacts = await _seed_contacts(server_db)
+        response = await server.export_contacts(ContactFilter(), format="csv", batch_size=2)
+        exported = "".join(await _body(response))
+        await server_db.contacts.delete_many({})
+        upload = UploadFile(file=io.BytesIO(exported.encode()), filename="contacts.csv")
+        result = await server.bulk_import_contacts(file=upload, format=None, chunk_size=1000)
+        imported = await server_db.contacts.find({}, projection={"_id": 0}).sort("name").to_list(None)
+        return contacts, exported, result, imported
+
+    contacts, exported, result, imported = asyncio.run(scenario())
+    assert exported.splitlines()[0] == ",".join(Contact.model_fields)
+    assert (result.inserted, result.failed) == (3, 0)
+    for original, row in zip(contacts, imported):
+        assert (row["name"], row["email"], row["company"], row["tags"], row["notes"]) == (
+            original.name, original.email, original.company, original.tags, original.notes
+        )
+
+
+def test_interaction_export_filters_by_contact_in_created_order(server_db):
+    async def scenario():
+        start = datetime(2024, 1, 1)
+        logs = [
+            InteractionLog(contact_id=contact_id, type="note", content=f"{contact_id} {n}", created_at=start + timedelta(days=n))
+            for n, contact_id in enumerate(["a", "b", "a", "a"])
+        ]
+        await server_db.interaction_logs.insert_many([log.dict() for log in reversed(logs)])
+        response = await server.export_interactions(contact_id="a", format="ndjson", batch_size=1000)
+        return response, await _body(response)
+
+    response, chunks = asyncio.run(scenario())
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert [row["content"] for row in rows] == ["a 0", "a 2", "a 3"]
+    assert response.headers["content-disposition"] == 'attachment; filename="interactions.ndjson"'
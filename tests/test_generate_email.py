@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from fastapi import Response
+
+import server
+from llm import FakeLlmChat, LlmClientPool, LlmResponseCache
+from server import ContactCreate, EmailGenerationRequest, NetworkingGoalsCreate
+
+
+@pytest.fixture
+def opened_chats(monkeypatch):
+    monkeypatch.setattr(server, "llm_cache", LlmResponseCache())
+    opened = []
+
+    async def get_llm_chat(session_id, system_message):
+        chat = FakeLlmChat(session_id=session_id, system_message=system_message, latency=0.01)
+        opened.append(chat)
+        return chat
+
+    monkeypatch.setattr(server, "get_llm_chat", get_llm_chat)
+    return opened
+
+
+async def _contact(name="Ada Lovelace"):
+    return await server.create_contact(ContactCreate(name=name, email="ada@example.com", company="Initech"))
+
+
+def _generate(contact_id, **request):
+    return server.generate_email(EmailGenerationRequest(contact_id=contact_id, email_type="introduction", **request), Response())
+
+
+def test_repeated_and_concurrent_identical_requests_reach_the_provider_once(server_db, opened_chats):
+    async def scenario():
+        contact = await _contact()
+        concurrent = await asyncio.gather(*(_generate(contact.id) for _ in range(3)))
+        repeated = await _generate(contact.id)
+        different = await _generate(contact.id, context="Met at PyCon")
+        return concurrent, repeated, different
+
+    concurrent, repeated, different = asyncio.run(scenario())
+    assert len(opened_chats) == 2
+    assert concurrent[0] == concurrent[1] == concurrent[2] == repeated
+    assert different.subject.startswith("Draft ")
+    assert server.llm_cache.stats()["hits"] == 1
+    assert server.llm_cache.stats()["coalesced"] == 2
+
+
+def _goals(*objectives):
+    return server.create_networking_goals(NetworkingGoalsCreate(industry="Software", role="CTO", networking_objectives=list(objectives)))
+
+
+@pytest.fixture
+def goals_cache(monkeypatch):
+    cache = {}
+    monkeypatch.setattr(server, "_networking_goals_cache", cache)
+    return cache
+
+
+def test_networking_goals_are_read_once_until_they_change(server_db, goals_cache):
+    async def scenario():
+        await _goals("Meet founders")
+        first = await server.get_cached_networking_goals()
+        # Changes behind the API's back are not seen while the entry is fresh
+        await server_db.networking_goals.delete_many({})
+        cached = await server.get_cached_networking_goals()
+        await _goals("Hire engineers")
+        return first, cached, await server.get_cached_networking_goals()
+
+    first, cached, refreshed = asyncio.run(scenario())
+    assert first["networking_objectives"] == cached["networking_objectives"] == ["Meet founders"]
+    assert refreshed["networking_objectives"] == ["Hire engineers"]
+
+
+def test_networking_goals_cache_entries_expire(server_db, goals_cache, monkeypatch):
+    monkeypatch.setattr(server, "NETWORKING_GOALS_CACHE_TTL_SECONDS", 0)
+
+    async def scenario():
+        await _goals("Meet founders")
+        await server.get_cached_networking_goals()
+        await server_db.networking_goals.delete_many({})
+        return await server.get_cached_networking_goals()
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_generation_builds_chats_through_the_shared_client_pool(server_db, goals_cache, monkeypatch):
+    monkeypatch.setattr(server, "llm_cache", LlmResponseCache())
+    pool = LlmClientPool(lambda session_id, system_message: FakeLlmChat(session_id=session_id, system_message=system_message))
+    monkeypatch.setattr(server, "llm_clients", pool)
+
+    async def scenario():
+        contact = await _contact()
+        await _generate(contact.id)
+        await _generate(contact.id, context="Met at PyCon")
+
+    asyncio.run(scenario())
+    assert pool.stats()["chats_created"] == 2
+
+
+def test_email_prompt_trims_long_context_to_the_token_budget(monkeypatch):
+    monkeypatch.setattr(server, "LLM_PROMPT_TOKEN_BUDGET", 300)
+    contact = server.Contact(name="Ada Lovelace", email="ada@example.com", company="Initech")
+    goals = {"networking_objectives": ["Meet founders"]}
+
+    _, short = server.build_email_prompts(contact, "introduction", "professional", "Met at PyCon", goals)
+    _, long = server.build_email_prompts(contact, "introduction", "professional", "word " * 2000, goals)
+    assert "Met at PyCon" in short and "Networking Goals: Meet founders" in short
+    assert server.estimate_tokens(long) <= 300 + len(server.email_prompts.get(email_type="introduction", tone="professional").slots)
+    assert "Name: Ada Lovelace" in long
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import server
+
+
+def _index_name(keys):
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def test_ensure_indexes_creates_every_registered_index(server_db):
+    async def scenario():
+        await server.ensure_indexes()
+        await server.ensure_indexes()  # startup runs it on every boot
+        return {collection: await server_db[collection].index_information() for collection in server.INDEX_REGISTRY}
+
+    indexes = asyncio.run(scenario())
+    for collection, specs in server.INDEX_REGISTRY.items():
+        expected = {spec.get("name") or _index_name(spec["keys"]) for spec in specs}
+        assert expected <= set(indexes[collection]), collection
+
+
+def test_contact_id_index_is_unique(server_db):
+    async def scenario():
+        await server.ensure_indexes()
+        await server_db.contacts.insert_one({"id": "c1"})
+        await server_db.contacts.insert_one({"id": "c1"})
+
+    with pytest.raises(DuplicateKeyError):
+        asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("shape", server.QUERY_SHAPES, ids=lambda shape: shape["name"])
+def test_every_query_shape_leads_with_an_indexed_field(shape):
+    fields = set(shape["filter"]) | {field for field, _ in shape.get("sort", [])[:1]}
+    leading = {spec["keys"][0][0] for spec in server.INDEX_REGISTRY[shape["collection"]]}
+    if "$text" in fields:
+        assert any(direction == "text" for spec in server.INDEX_REGISTRY[shape["collection"]] for _, direction in spec["keys"])
+    else:
+        assert fields & leading
+
+
+def test_plan_stages_flatten_nested_plans():
+    plan = {"stage": "SORT", "inputStage": {"stage": "OR", "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}]}}
+    assert server._plan_stages(plan) == ["SORT", "OR", "IXSCAN", "COLLSCAN"]
+
+
+class ExplainingCollection:
+    """Answers explain() with a collection scan for unfiltered queries on `scanned`"""
+
+    def __init__(self, name, scanned):
+        self.name = name
+        self.scanned = scanned
+        self.filter = None
+
+    def find(self, filter_dict):
+        self.filter = filter_dict
+        return self
+
+    def sort(self, keys):
+        return self
+
+    def limit(self, n):
+        return self
+
+    async def explain(self):
+        if self.name == self.scanned and not self.filter:
+            plan = {"stage": "COLLSCAN"}
+        else:
+            plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+        return {"queryPlanner": {"winningPlan": plan}}
+
+
+class ExplainingDatabase:
+    def __init__(self, scanned):
+        self.scanned = scanned
+
+    def __getitem__(self, name):
+        return ExplainingCollection(name, self.scanned)
+
+
+def test_index_health_flags_collection_scans(monkeypatch):
+    monkeypatch.setattr(server, "db", ExplainingDatabase(scanned="email_templates"))
+    health = asyncio.run(server.index_health_check())
+    assert health["status"] == "degraded"
+    assert health["collscans"] == ["email templates page"]
+    assert len(health["query_shapes"]) == len(server.QUERY_SHAPES)
+
+
+def test_finished_cleanup_jobs_expire(server_db):
+    async def scenario():
+        await server.ensure_indexes()
+        return await server_db.cleanup_jobs.index_information()
+
+    index = asyncio.run(scenario())["finished_at_1"]
+    assert index["expireAfterSeconds"] == server.CLEANUP_JOB_TTL_SECONDS
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from lead_scoring import MAX_SCORE, score_batch, score_contact
+
+NOW = datetime(2026, 6, 1, 12, 0, 0)
+
+FULL_PROFILE = {
+    "company": "Initech",
+    "position": "CTO",
+    "linkedin_url": "https://linkedin.com/in/ada",
+    "industry": "Fintech",
+    "phone": "555-0100",
+}
+
+CONTACTS = [
+    {},
+    {"company": None, "position": "", "last_interaction": None},
+    {"company": "Initech"},
+    {**FULL_PROFILE},
+    # Every profile point plus the best recency bonus is clamped
+    {**FULL_PROFILE, "last_interaction": NOW - timedelta(hours=1)},
+    {"phone": "555-0100", "last_interaction": NOW - timedelta(days=6, hours=23)},
+    {"phone": "555-0100", "last_interaction": NOW - timedelta(days=7)},
+    {"industry": "Fintech", "last_interaction": NOW - timedelta(days=29, hours=23)},
+    {"industry": "Fintech", "last_interaction": NOW - timedelta(days=30)},
+    {"linkedin_url": "https://linkedin.com/in/alan", "last_interaction": NOW - timedelta(days=400)},
+    # last_contacted is not a scoring input, however old
+    {"company": "Globex", "last_contacted": NOW - timedelta(days=900)},
+    {"position": "CEO", "last_contacted": NOW - timedelta(days=2), "last_interaction": None},
+]
+
+
+def test_batch_scores_match_single_contact_scores():
+    batch = score_batch(CONTACTS, NOW)
+    assert batch.tolist() == [score_contact(contact, NOW) for contact in CONTACTS]
+
+
+@pytest.mark.parametrize("contact, expected", [
+    ({}, 50),
+    ({**FULL_PROFILE}, 100),
+    ({**FULL_PROFILE, "last_interaction": NOW}, MAX_SCORE),
+    ({"phone": "555-0100", "last_interaction": NOW - timedelta(days=6, hours=23)}, 75),
+    ({"phone": "555-0100", "last_interaction": NOW - timedelta(days=7)}, 65),
+    ({"industry": "Fintech", "last_interaction": NOW - timedelta(days=30)}, 60),
+])
+def test_single_contact_scores(contact, expected):
+    assert score_contact(contact, NOW) == expected
+    assert score_batch([contact], NOW).tolist() == [expected]
@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException, Response
+
+import server
+from server import Campaign, Contact
+
+
+def _list_campaigns(**params):
+    return server.get_campaigns(Response(), **{"limit": 100, "cursor": None, "view": "full", "fields": None, **params})
+
+
+@pytest.mark.parametrize("fields", ["contact_ids", "name,contact_ids", "name,no_such_field"])
+def test_campaign_list_rejects_fields_it_does_not_serve(server_db, fields):
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(_list_campaigns(fields=fields))
+    assert raised.value.status_code == 400
+
+
+def test_campaign_list_returns_requested_fields(server_db):
+    campaign = Campaign(name="Launch", contact_ids=["a", "b"], contact_count=2)
+
+    async def scenario():
+        await server_db.campaigns.insert_one(campaign.dict())
+        return await _list_campaigns(fields="name,contact_count")
+
+    rows = json.loads(asyncio.run(scenario()).body)
+    assert [set(row) for row in rows] == [{"id", "created_at", "name", "contact_count"}]
+    assert (rows[0]["name"], rows[0]["contact_count"]) == ("Launch", 2)
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_model_rows_leave_out_omitted_fields(monkeypatch, fast):
+    monkeypatch.setattr(server, "FAST_SERIALIZATION", fast)
+    rows = server.model_rows(Campaign, [Campaign(name="Launch", contact_ids=["a"]).dict()], server.CAMPAIGN_LIST_OMITTED)
+    assert list(rows[0]) == [name for name in Campaign.model_fields if name != "contact_ids"]
+
+
+def test_fast_campaign_list_omits_contact_ids(server_db, monkeypatch):
+    monkeypatch.setattr(server, "FAST_SERIALIZATION", True)
+
+    async def scenario():
+        await server_db.campaigns.insert_one(Campaign(name="Launch", contact_ids=["a", "b"], contact_count=2).dict())
+        return await _list_campaigns()
+
+    rows = json.loads(asyncio.run(scenario()).body)
+    assert [row["name"] for row in rows] == ["Launch"]
+    assert "contact_ids" not in rows[0]
+
+
+def test_fast_rows_call_default_factories_per_row(monkeypatch):
+    monkeypatch.setattr(server, "FAST_SERIALIZATION", True)
+    rows = server.model_rows(Contact, [{"name": "Ada", "email": "ada@example.com"}, {"name": "Alan", "email": "alan@example.com"}])
+    assert rows[0]["id"] != rows[1]["id"]
+    assert rows[0]["tags"] == [] and rows[0]["tags"] is not rows[1]["tags"]
+    assert rows[0]["priority"] == Contact.model_fields["priority"].default
+    assert list(rows[0]) == list(Contact.model_fields)
+    stored = Contact(name="Grace", email="grace@example.com").dict()
+    assert server.model_rows(Contact, [stored]) == [stored]
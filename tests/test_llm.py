@@ -0,0 +1,360 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+from llm import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    FakeLlmChat,
+    FakeUserMessage,
+    IncrementalEmailParser,
+    LlmRateLimiter,
+    LlmResponseCache,
+    PromptRegistry,
+    PromptTemplate,
+    estimate_tokens,
+    truncate_to_tokens,
+)
+
+
+def test_fake_chat_answers_with_email_json():
+    chat = FakeLlmChat(session_id="s1").with_model("openai", "gpt-4o")
+    completion = asyncio.run(chat.send_message(FakeUserMessage("Write to Ada")))
+
+    email = json.loads(completion)
+    assert email["subject"].startswith("Draft ")
+    assert "offline draft" in email["body"]
+    assert completion == asyncio.run(chat.send_message(FakeUserMessage("Write to Ada")))
+
+
+def test_fake_chat_stream_joins_to_the_completion():
+    chat = FakeLlmChat()
+
+    async def collect():
+        return [chunk async for chunk in chat.stream_message(FakeUserMessage("Write to Ada"), chunk_size=5)]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 1
+    assert "".join(chunks) == chat._completion(FakeUserMessage("Write to Ada"))
+
+
+def test_fake_chat_failure_rate():
+    chat = FakeLlmChat(failure_rate=1.0, rng=random.Random(0))
+    with pytest.raises(RuntimeError):
+        asyncio.run(chat.send_message(FakeUserMessage("Write to Ada")))
+
+
+EMAIL_JSON = json.dumps({
+    "subject": "Hello \"Ada\"",
+    "body": "Line one\nTab\there \u00e9 \U0001F600 end",
+    "personalization_notes": ["met at PyCon", "likes \\ backslashes"],
+}, ensure_ascii=True)
+
+
+def _feed_in_chunks(parser, text, size):
+    deltas = {}
+    for start in range(0, len(text), size):
+        for field, delta in parser.feed(text[start:start + size]).items():
+            deltas[field] = deltas.get(field, "") + delta
+    return deltas
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_parser_deltas_add_up_to_the_fields(size):
+    expected = json.loads(EMAIL_JSON)
+    parser = IncrementalEmailParser()
+
+    deltas = _feed_in_chunks(parser, EMAIL_JSON, size)
+
+    assert deltas == {"subject": expected["subject"], "body": expected["body"]}
+    assert parser.result() == expected
+    assert parser.done
+
+
+def test_parser_skips_prose_and_code_fences():
+    parser = IncrementalEmailParser()
+    text = "Here is your email:\n```json\n" + EMAIL_JSON + "\n```\nGood luck!"
+
+    _feed_in_chunks(parser, text, 5)
+
+    assert parser.result() == json.loads(EMAIL_JSON)
+    assert parser.full_text() == text
+
+
+def test_parser_handles_chunk_boundary_inside_escapes():
+    parser = IncrementalEmailParser()
+
+    assert parser.feed('{"subject": "Caf') == {"subject": "Caf"}
+    assert parser.feed("\\") == {}
+    assert parser.feed("u00") == {}
+    assert parser.feed("e9 \\") == {"subject": "\u00e9 "}
+    assert parser.feed('"ok", "body": "a\\') == {"subject": '"ok', "body": "a"}
+    assert parser.feed('nb"}') == {"body": "\nb"}
+    assert parser.result() == {"subject": 'Caf\u00e9 "ok', "body": "a\nb"}
+
+
+def test_parser_joins_surrogate_pairs_split_across_chunks():
+    parser = IncrementalEmailParser()
+
+    parser.feed('{"body": "\\ud83d')
+    assert parser.feed('\\ude00!"}') == {"body": "\U0001F600!"}
+
+
+def test_parser_keeps_a_truncated_document():
+    parser = IncrementalEmailParser()
+
+    parser.feed('{"subject": "Hi", "body": "Half a sen')
+
+    assert not parser.done
+    assert parser.result() == {"subject": "Hi", "body": "Half a sen"}
+
+
+def test_parser_without_json_has_no_result():
+    parser = IncrementalEmailParser()
+    parser.feed("Sorry, I cannot help with that.")
+    assert parser.result() is None
+
+
+class ManualClock:
+    """Simulated clock: sleeping advances it instantly instead of blocking"""
+
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    async def sleep(self, seconds):
+        self.time += max(seconds, 0)
+        await asyncio.sleep(0)
+
+
+def _limiter(requests_per_minute, tokens_per_minute):
+    clock = ManualClock()
+    return clock, LlmRateLimiter(requests_per_minute, tokens_per_minute, clock=clock.now, sleep=clock.sleep)
+
+
+def test_limiter_refills_requests_over_time():
+    clock, limiter = _limiter(requests_per_minute=60, tokens_per_minute=100000)
+
+    async def scenario():
+        for _ in range(60):
+            await limiter.acquire()
+        assert clock.now() == 0
+        await limiter.acquire()
+
+    asyncio.run(scenario())
+    assert clock.now() == pytest.approx(1.0)
+
+
+def test_limiter_waits_for_token_budget():
+    clock, limiter = _limiter(requests_per_minute=1000, tokens_per_minute=600)
+
+    async def scenario():
+        await limiter.acquire(600)
+        await limiter.acquire(300)
+
+    asyncio.run(scenario())
+    assert clock.now() == pytest.approx(30.0)
+
+
+def test_limiter_caps_oversized_requests_at_the_bucket():
+    clock, limiter = _limiter(requests_per_minute=1000, tokens_per_minute=600)
+
+    asyncio.run(limiter.acquire(10000))
+    assert clock.now() == 0
+
+
+def test_interactive_caller_jumps_ahead_of_queued_bulk_callers():
+    clock, limiter = _limiter(requests_per_minute=1, tokens_per_minute=100000)
+    granted = []
+
+    async def caller(name, priority):
+        await limiter.acquire(priority=priority)
+        granted.append((name, clock.now()))
+
+    async def scenario():
+        await limiter.acquire()
+        await asyncio.gather(
+            caller("bulk-1", PRIORITY_BULK),
+            caller("bulk-2", PRIORITY_BULK),
+            caller("interactive", PRIORITY_INTERACTIVE),
+        )
+
+    asyncio.run(scenario())
+    assert [name for name, _ in granted] == ["interactive", "bulk-1", "bulk-2"]
+    assert [at for _, at in granted] == pytest.approx([60.0, 120.0, 180.0])
+    assert limiter.stats()["queue_depth"] == 0
+
+
+def test_cancelled_waiter_releases_its_place():
+    clock, limiter = _limiter(requests_per_minute=1, tokens_per_minute=100000)
+
+    async def scenario():
+        await limiter.acquire()
+        head = asyncio.create_task(limiter.acquire())
+        behind = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 2
+
+        # The head is mid-wait for the bucket; cancelling it hands its turn on
+        head.cancel()
+        await behind
+        with pytest.raises(asyncio.CancelledError):
+            await head
+
+    asyncio.run(scenario())
+    assert clock.now() == pytest.approx(60.0)
+    assert limiter.stats()["queue_depth"] == 0
+    assert limiter.stats()["wait_by_priority"][str(PRIORITY_INTERACTIVE)]["granted"] == 2
+
+
+class CountingCompletion:
+    """generate() for LlmResponseCache that counts its calls"""
+
+    def __init__(self, answer="completion", latency=0.0, error=None):
+        self.answer = answer
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.error:
+            raise self.error
+        return self.answer
+
+
+def test_cache_key_covers_model_system_message_and_prompt():
+    keys = {
+        LlmResponseCache.key("gpt-4o", "system", "prompt"),
+        LlmResponseCache.key("gpt-4o-mini", "system", "prompt"),
+        LlmResponseCache.key("gpt-4o", "system prompt", ""),
+        LlmResponseCache.key("gpt-4o", "system", "prompt!"),
+    }
+    assert len(keys) == 4
+    assert LlmResponseCache.key("gpt-4o", "system", "prompt") in keys
+
+
+def test_cache_hit_skips_the_completion():
+    cache, completion = LlmResponseCache(), CountingCompletion()
+
+    async def scenario():
+        return [await cache.get_or_generate("k", "gpt-4o", completion) for _ in range(3)]
+
+    assert asyncio.run(scenario()) == ["completion"] * 3
+    assert completion.calls == 1
+    assert (cache.stats()["misses"], cache.stats()["hits"]) == (1, 2)
+
+
+def test_concurrent_identical_requests_share_one_completion():
+    cache, completion = LlmResponseCache(), CountingCompletion(latency=0.01)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_generate("k", "gpt-4o", completion) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["completion"] * 5
+    assert completion.calls == 1
+    assert cache.stats()["coalesced"] == 4
+    assert cache.stats()["inflight"] == 0
+
+
+def test_failed_completion_is_not_cached():
+    cache, completion = LlmResponseCache(), CountingCompletion(error=RuntimeError("provider down"))
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await cache.get_or_generate("k", "gpt-4o", completion)
+        completion.error = None
+        return await cache.get_or_generate("k", "gpt-4o", completion)
+
+    assert asyncio.run(scenario()) == "completion"
+    assert completion.calls == 3
+    assert cache.stats()["errors"] == 2
+
+
+def test_cache_entries_expire_and_evict_least_recently_used():
+    clock = ManualClock()
+    cache = LlmResponseCache(max_entries=2, ttl_seconds=60, clock=clock.now)
+
+    async def scenario():
+        for key in ("a", "b"):
+            await cache.store(key, "gpt-4o", key.upper())
+        await cache.lookup("a")  # "b" is now least recently used
+        await cache.store("c", "gpt-4o", "C")
+        evicted = await cache.lookup("b")
+        clock.time += 61
+        return evicted, await cache.lookup("a")
+
+    assert asyncio.run(scenario()) == (None, None)
+    assert cache.stats()["entries"] == 1  # "c" has expired but not yet been read
+
+
+def test_persisted_entries_are_shared_between_caches():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    collection = mongomock_motor.AsyncMongoMockClient()["networkingai_test"]["llm_cache"]
+    completion = CountingCompletion()
+
+    async def scenario():
+        await LlmResponseCache(collection=collection).get_or_generate("k", "gpt-4o", completion)
+        other = LlmResponseCache(collection=collection)
+        return await other.get_or_generate("k", "gpt-4o", completion), other.stats()
+
+    answer, stats = asyncio.run(scenario())
+    assert answer == "completion"
+    assert completion.calls == 1
+    assert stats["persisted_hits"] == 1
+
+
+PROMPT = "Write a {kind} email to {name}.\nContext: {context}\nGoals: {goals}\nKeep the {kind} short."
+
+
+def test_compiled_prompt_matches_str_format():
+    values = {"name": "Ada", "context": "Met at PyCon", "goals": "Hire"}
+    template = PromptTemplate(PROMPT, {"kind": "introduction"})
+    rendered = template.render(values)
+    assert rendered.text == PROMPT.format(kind="introduction", **values)
+    # Slots are estimated one by one, so rounding can differ by a token per slot
+    assert abs(rendered.tokens - estimate_tokens(rendered.text)) <= len(template.slots)
+    assert rendered.trimmed == []
+
+
+def test_bound_constants_are_not_slots():
+    assert PromptTemplate(PROMPT, {"kind": "follow up"}).slots == ["name", "context", "goals"]
+
+
+def test_optional_slots_are_trimmed_in_order_to_fit_the_budget():
+    template = PromptTemplate(PROMPT, {"kind": "introduction"})
+    values = {"name": "Ada " * 50, "context": "word " * 400, "goals": "goal " * 400}
+    full = template.render(values)
+    budget = full.tokens - 600  # more than the whole context slot
+
+    rendered = template.render(values, optional=("context", "goals"), token_budget=budget)
+    assert rendered.trimmed == ["context", "goals"]
+    assert rendered.tokens <= budget
+    assert ("Ada " * 50).strip() in rendered.text  # required slots are never trimmed
+    assert "Context: \nGoals: goal" in rendered.text  # context was emptied before goals was touched
+
+    small = template.render(values, optional=("context", "goals"), token_budget=full.tokens - 10)
+    assert small.trimmed == ["context"]
+
+
+def test_truncate_to_tokens_cuts_at_a_word_boundary():
+    assert truncate_to_tokens("short text", 10) == "short text"
+    assert truncate_to_tokens("alpha beta gamma delta", 3) == "alpha beta…"
+    assert truncate_to_tokens("alpha beta gamma delta", 2) == "alpha…"
+    assert truncate_to_tokens("alpha beta", 0) == ""
+
+
+def test_registry_compiles_each_set_of_constants_once():
+    registry = PromptRegistry(PROMPT, max_templates=2)
+    first = registry.get(kind="introduction")
+    assert registry.get(kind="introduction") is first
+    registry.get(kind="follow up")
+    registry.get(kind="thank you")  # evicts "introduction"
+    assert registry.get(kind="introduction") is not first
+    assert registry.stats()["compiled_templates"] == 2
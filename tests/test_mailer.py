@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+import pytest
+
+from mailer import SmtpTransport, build_message
+
+
+class BlockingSmtp:
+    """Fake SMTP connection whose first send blocks until released"""
+
+    def __init__(self, *args, **kwargs):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.sent = []
+        self.active = 0
+        self.overlapped = False
+
+    def send_message(self, message):
+        self.active += 1
+        self.overlapped = self.overlapped or self.active > 1
+        self.started.set()
+        if not self.sent:
+            self.release.wait(5)
+        self.sent.append(message["To"])
+        self.active -= 1
+
+    def quit(self):
+        self.overlapped = self.overlapped or self.active > 0
+
+    def close(self):
+        pass
+
+
+def _message(recipient):
+    return build_message("me@example.com", recipient, "Hi", "Hello")
+
+
+def test_cancelled_send_keeps_its_connection_until_the_thread_finishes():
+    connections = []
+
+    def factory(*args, **kwargs):
+        connections.append(BlockingSmtp())
+        return connections[-1]
+
+    async def scenario():
+        transport = SmtpTransport("localhost", 1025, pool_size=1, smtp_factory=factory)
+        first = asyncio.create_task(transport.send(_message("a@example.com")))
+        while not (connections and connections[0].started.is_set()):
+            await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # The worker thread still owns the only slot, so the next send waits
+        second = asyncio.create_task(transport.send(_message("b@example.com")))
+        await asyncio.sleep(0.05)
+        waiting = not second.done()
+        connections[0].release.set()
+        await second
+        await transport.close()
+        return transport, waiting
+
+    transport, waiting = asyncio.run(scenario())
+    assert waiting
+    assert len(connections) == 1
+    assert connections[0].sent == ["a@example.com", "b@example.com"]
+    assert not connections[0].overlapped
+    assert transport.metrics["sent"] == 2
+
+
+def test_failed_send_drops_its_connection():
+    class FailingSmtp(BlockingSmtp):
+        def send_message(self, message):
+            raise ValueError("bad message")
+
+    connections = []
+
+    def factory(*args, **kwargs):
+        connections.append(FailingSmtp())
+        return connections[-1]
+
+    async def scenario():
+        transport = SmtpTransport("localhost", 1025, pool_size=1, smtp_factory=factory)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await transport.send(_message("a@example.com"))
+        return transport
+
+    transport = asyncio.run(scenario())
+    assert len(connections) == 2
+    assert transport.metrics["failed"] == 2
+    assert transport.stats()["open_connections"] == 0
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from server import Contact, ContactUpdate, InteractionLogCreate, Priority
+
+
+async def _seed(db):
+    now = datetime.utcnow()
+    contacts = [
+        # Idle for long enough to overtake a better-scored contact reached yesterday
+        Contact(name="Idle", email="idle@example.com", lead_score=50, last_contacted=now - timedelta(days=40)),
+        Contact(name="Hot", email="hot@example.com", lead_score=80, priority=Priority.HIGH, last_contacted=now - timedelta(days=1)),
+        Contact(name="Warm", email="warm@example.com", lead_score=70, relationship_strength=20, last_contacted=now - timedelta(days=1)),
+        Contact(name="Cold", email="cold@example.com", lead_score=20, priority=Priority.LOW, last_contacted=now - timedelta(days=1)),
+    ]
+    await db.contacts.insert_many([server.contact_storage_doc(contact.dict()) for contact in contacts])
+    return {contact.name: contact for contact in contacts}
+
+
+def _expected_score(contact, now):
+    idle_days = (now - contact.last_contacted).total_seconds() / 86400
+    priority_points = server.NEXT_BEST_PRIORITY_POINTS[contact.priority.value]
+    return contact.lead_score + 0.5 * contact.relationship_strength + priority_points + idle_days
+
+
+def test_next_best_ranks_by_score_including_idle_time(server_db):
+    async def scenario():
+        contacts = await _seed(server_db)
+        return contacts, await server.get_next_best_contacts(limit=3), datetime.utcnow()
+
+    contacts, ranked, now = asyncio.run(scenario())
+    assert [contact.name for contact in ranked] == ["Hot", "Idle", "Warm"]
+    for contact in ranked:
+        assert contact.next_best_score == pytest.approx(_expected_score(contacts[contact.name], now), abs=0.1)
+
+
+def test_pipeline_key_matches_the_python_key(server_db):
+    async def scenario():
+        await _seed(server_db)
+        await server_db.contacts.update_many({}, {"$set": {"next_best_key": None}})
+        await server.refresh_next_best_keys({})
+        return await server_db.contacts.find({}, projection={"_id": 0}).to_list(None)
+
+    for contact in asyncio.run(scenario()):
+        assert contact["next_best_key"] == pytest.approx(server.next_best_key(contact))
+
+
+def test_writes_keep_the_ranking_current(server_db):
+    async def scores():
+        return {contact.name: contact.next_best_score for contact in await server.get_next_best_contacts(limit=10)}
+
+    async def scenario():
+        contacts = await _seed(server_db)
+        before = await scores()
+        await server.update_contact(contacts["Cold"].id, ContactUpdate(priority=Priority.HIGH))
+        await server.create_interaction_log(InteractionLogCreate(contact_id=contacts["Idle"].id, type="call"))
+        ranked = await server.get_next_best_contacts(limit=10)
+        stored = await server_db.contacts.find({}, projection={"_id": 0}).to_list(None)
+        return before, ranked, stored
+
+    before, ranked, stored = asyncio.run(scenario())
+    for contact in stored:
+        assert contact["next_best_key"] == pytest.approx(server.next_best_key(contact))
+    after = {contact.name: contact.next_best_score for contact in ranked}
+    assert list(after.values()) == sorted(after.values(), reverse=True)
+    # The call resets Idle's 40-day idle bonus (a fresh interaction also lifts its
+    # lead score, by less); the priority change lifts Cold
+    assert after["Idle"] < before["Idle"]
+    assert after["Cold"] > before["Cold"]
+    assert [contact.name for contact in ranked] == ["Hot", "Warm", "Idle", "Cold"]
+
+
+def test_contact_update_keeps_a_concurrent_strength_change_in_the_key(server_db, monkeypatch):
+    score_contact = server.score_contact
+
+    async def scenario():
+        contacts = await _seed(server_db)
+        cold = contacts["Cold"].id
+
+        def score_during_interaction(contact, *args, **kwargs):
+            # An interaction recorded between the update's writes
+            server_db.contacts._AsyncMongoMockCollection__collection.update_one(
+                {"id": cold}, [{"$set": {"relationship_strength": 60}}, server.NEXT_BEST_KEY_STAGE]
+            )
+            return score_contact(contact, *args, **kwargs)
+
+        monkeypatch.setattr(server, "score_contact", score_during_interaction)
+        await server.update_contact(cold, ContactUpdate(priority=Priority.HIGH, company="Initech"))
+        return await server_db.contacts.find_one({"id": cold}, projection={"_id": 0})
+
+    stored = asyncio.run(scenario())
+    assert stored["relationship_strength"] == 60
+    assert stored["next_best_key"] == pytest.approx(server.next_best_key(stored))
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+import server
+from server import Contact, ContactFilter, ContactStatus
+
+
+async def _seed_contacts(db, count, **fields):
+    docs = [Contact(name=f"Contact {i}", email=f"contact{i}@example.com", **fields).dict() for i in range(count)]
+    await db.contacts.insert_many([server.contact_storage_doc(doc) for doc in docs])
+    return [doc["id"] for doc in docs]
+
+
+async def _list_contacts(cursor=None, limit=2, **filters):
+    response = Response()
+    contacts = await server.get_contacts(response, ContactFilter(**filters), limit=limit, cursor=cursor, view="full", fields=None)
+    return [contact.id for contact in contacts], response.headers.get(server.NEXT_CURSOR_HEADER)
+
+
+def test_cursor_walks_every_contact_once_in_page_order(server_db):
+    async def scenario():
+        # Shared timestamps make the id tie-breaker decide the order
+        ids = await _seed_contacts(server_db, 3, created_at=datetime(2024, 1, 1))
+        ids += await _seed_contacts(server_db, 2, created_at=datetime(2024, 1, 2))
+        pages, cursor = [], None
+        while True:
+            page, cursor = await _list_contacts(cursor)
+            pages.append(page)
+            if cursor is None:
+                return ids, pages
+
+    ids, pages = asyncio.run(scenario())
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [contact_id for page in pages for contact_id in page] == sorted(ids[:3]) + sorted(ids[3:])
+
+
+def test_cursor_pages_respect_the_filter(server_db):
+    async def scenario():
+        await _seed_contacts(server_db, 3)
+        contacted = await _seed_contacts(server_db, 3, status=ContactStatus.CONTACTED)
+        first, cursor = await _list_contacts(status=ContactStatus.CONTACTED)
+        second, last = await _list_contacts(cursor, status=ContactStatus.CONTACTED)
+        return contacted, first + second, last
+
+    contacted, listed, last = asyncio.run(scenario())
+    assert sorted(listed) == sorted(contacted)
+    assert last is None
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "eyJpZCI6ICJ4In0="])
+def test_malformed_cursor_is_a_400(server_db, cursor):
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(_list_contacts(cursor))
+    assert raised.value.status_code == 400
+
+
+def test_limit_above_the_page_maximum_is_clamped_not_rejected(server_db, monkeypatch):
+    monkeypatch.setattr(server, "MAX_PAGE_SIZE", 3)
+
+    async def scenario():
+        await _seed_contacts(server_db, 5)
+        response = Response()
+        page = await server.paginate(server_db.contacts, {}, 5000, None, response)
+        return page, response.headers.get(server.NEXT_CURSOR_HEADER)
+
+    page, next_cursor = asyncio.run(scenario())
+    assert len(page) == 3
+    assert next_cursor is not None
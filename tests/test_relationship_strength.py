@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import server
+from server import ContactCreate, InteractionLog, InteractionLogCreate
+
+
+async def _contact(name="Ada"):
+    return await server.create_contact(ContactCreate(name=name, email=f"{name.lower()}@example.com"))
+
+
+async def _counters(db, contact_id):
+    contact = await db.contacts.find_one({"id": contact_id})
+    return contact["interaction_count"], contact["recent_interaction_count"], contact["relationship_strength"]
+
+
+def test_logged_interactions_bump_the_counters(server_db):
+    async def scenario():
+        await server.rebuild_analytics_rollup()
+        contact = await _contact()
+        for status in ("completed", "completed", "failed"):
+            await server.create_interaction_log(InteractionLogCreate(contact_id=contact.id, type="note", status=status))
+        _, drift = await server.rebuild_analytics_rollup()
+        return await _counters(server_db, contact.id), drift
+
+    counters, drift = asyncio.run(scenario())
+    # Failed interactions are logged but not counted
+    assert counters == (2, 2, server.relationship_strength(2, 2)) == (2, 2, 30)
+    assert drift == {}
+
+
+def test_strength_is_capped_at_100():
+    assert server.relationship_strength(30, 30) == 100
+
+
+def test_decay_walks_recent_counters_down_as_interactions_age(server_db):
+    async def scenario():
+        contact = await _contact()
+        for _ in range(3):
+            await server.create_interaction_log(InteractionLogCreate(contact_id=contact.id, type="note"))
+        await server.rebuild_analytics_rollup()
+        logs = await server_db.interaction_logs.find({"contact_id": contact.id}).to_list(None)
+        aged = datetime.utcnow() - timedelta(days=server.RECENT_INTERACTION_DAYS + 1)
+        await server_db.interaction_logs.update_many({"id": {"$in": [log["id"] for log in logs[:2]]}}, {"$set": {"created_at": aged}})
+
+        decayed = await server.decay_relationship_strength()
+        again = await server.decay_relationship_strength()
+        _, drift = await server.rebuild_analytics_rollup()
+        return decayed, again, await _counters(server_db, contact.id), drift
+
+    decayed, again, counters, drift = asyncio.run(scenario())
+    assert (decayed, again) == (1, 0)
+    assert counters == (3, 1, 25)
+    assert drift == {}
+
+
+def test_contact_without_counters_is_backfilled_from_its_logs(server_db):
+    async def scenario():
+        contact = await _contact()
+        await server_db.contacts.update_one(
+            {"id": contact.id},
+            {"$unset": {"interaction_count": "", "recent_interaction_count": ""}, "$set": {"relationship_strength": 10}}
+        )
+        old = datetime.utcnow() - timedelta(days=90)
+        await server_db.interaction_logs.insert_many([
+            InteractionLog(contact_id=contact.id, type="note", created_at=old).dict() for _ in range(2)
+        ])
+        await server.rebuild_analytics_rollup()
+        await server.create_interaction_log(InteractionLogCreate(contact_id=contact.id, type="note"))
+        _, drift = await server.rebuild_analytics_rollup()
+        return await _counters(server_db, contact.id), drift
+
+    counters, drift = asyncio.run(scenario())
+    assert counters == (3, 1, 25)
+    assert drift == {}
+
+
+def test_rebuild_repairs_counters_from_the_logs(server_db):
+    async def scenario():
+        ada, alan = await _contact("Ada"), await _contact("Alan")
+        await server.create_interaction_log(InteractionLogCreate(contact_id=ada.id, type="note"))
+        await server_db.contacts.update_many({}, {"$set": {"interaction_count": 7, "recent_interaction_count": 7, "relationship_strength": 100}})
+        updated = await server.rebuild_relationship_strength()
+        return updated, await _counters(server_db, ada.id), await _counters(server_db, alan.id)
+
+    updated, ada, alan = asyncio.run(scenario())
+    assert updated == 2
+    assert ada == (1, 1, 15)
+    assert alan == (0, 0, 0)
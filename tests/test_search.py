@@ -0,0 +1,20 @@
+import asyncio
+
+import server
+from server import ContactCreate
+
+
+def test_prefix_search_ranks_name_matches_before_cutting_to_the_limit(server_db, monkeypatch):
+    monkeypatch.setattr(server, "SEARCH_PREFIX_MAX_CANDIDATES", 50)
+
+    async def scenario():
+        # Inserted first, these match "ann" only through their company
+        for i in range(5):
+            await server.create_contact(ContactCreate(name=f"Zed {i}", email=f"zed{i}@example.com", company="Annex Labs"))
+        await server.create_contact(ContactCreate(name="Annabel Lee", email="annabel@example.com", company="Globex"))
+        await server.create_contact(ContactCreate(name="Ann Smith", email="smith@example.com", company="Initech"))
+        return await server._prefix_search("ann", server.search_tokens("ann"), limit=2)
+
+    hits = asyncio.run(scenario())
+    assert [contact["name"] for contact in hits] == ["Ann Smith", "Annabel Lee"]
+    assert all("search_terms" not in contact for contact in hits)
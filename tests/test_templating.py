@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import server
+from server import ContactCreate, EmailTemplate, TemplateRenderRequest
+from templating import CompiledEmailTemplate, EmailTemplateCache, TemplateSyntaxError, compile_template
+
+
+def _render(source, **values):
+    renderer, _ = compile_template(source)
+    return renderer(values)
+
+
+def test_variables_fall_back_when_empty():
+    source = "Hi {{first_name|there}}, how is {{ company | your team }}?"
+    assert _render(source, first_name="Ada", company="Initech") == "Hi Ada, how is Initech?"
+    assert _render(source, first_name="  ", company=None) == "Hi there, how is your team?"
+    assert _render("{{tags}} on {{met}}", tags=["ai", "ml"], met=datetime(2024, 5, 1)) == "ai, ml on 2024-05-01"
+    assert _render("[{{missing}}]") == "[]"
+
+
+def test_sections_and_inverted_sections():
+    source = "{{#company}}at {{company}}{{/company}}{{^company}}independent{{/company}}"
+    assert _render(source, company="Initech") == "at Initech"
+    assert _render(source, company="") == "independent"
+    assert _render(source, company=[]) == "independent"
+    nested = "{{#a}}A{{^b}}-no b{{/b}}{{/a}}"
+    assert [_render(nested, a=1, b=b) for b in (None, 1)] == ["A-no b", "A"]
+    assert _render(nested, a=None) == ""
+
+
+def test_compile_reports_the_fields_it_reads():
+    _, fields = compile_template("{{#company}}{{name}} at {{company}}{{/company}} {{email|-}}")
+    assert fields == {"company", "name", "email"}
+
+
+@pytest.mark.parametrize("source, message", [
+    ("{{#company}}at {{company}}{{/name}}", "unexpected {{/name}}, expected {{/company}}"),
+    ("text{{/company}}", "unexpected {{/company}}"),
+    ("{{#company}}{{^name}}{{/name}}", "{{#company}} is never closed"),
+])
+def test_mismatched_and_unclosed_sections_raise(source, message):
+    with pytest.raises(TemplateSyntaxError, match=message):
+        compile_template(source)
+
+
+def _template(template_id, created_at=datetime(2024, 1, 1)):
+    return {"id": template_id, "created_at": created_at, "subject": "Hi {{name}}", "body": "{{company|-}}"}
+
+
+def test_cache_reuses_compiled_templates_until_recreated():
+    cache = EmailTemplateCache()
+    first = cache.get(_template("t1"))
+    assert cache.get(_template("t1")) is first
+    assert cache.get(_template("t1", created_at=datetime(2024, 2, 1))) is not first
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = EmailTemplateCache(max_templates=2)
+    t1 = cache.get(_template("t1"))
+    cache.get(_template("t2"))
+    assert cache.get(_template("t1")) is t1  # t2 is now the oldest
+    cache.get(_template("t3"))
+    assert cache.stats()["compiled_templates"] == 2
+    assert cache.get(_template("t1")) is t1
+    misses = cache.misses
+    cache.get(_template("t2"))
+    assert cache.misses == misses + 1
+
+
+def test_batch_render_matches_rendering_one_contact_at_a_time(server_db, monkeypatch):
+    monkeypatch.setattr(server, "TEMPLATE_RENDER_CHUNK_SIZE", 2)
+    monkeypatch.setattr(server, "email_template_cache", EmailTemplateCache())
+    template = EmailTemplate(
+        name="Intro",
+        subject="Hi {{first_name|there}}",
+        body="{{#company}}How is {{company}}?{{/company}}{{^company}}What are you working on?{{/company}}",
+        type="introduction",
+    )
+
+    async def scenario():
+        await server_db.email_templates.insert_one(template.dict())
+        contacts = [
+            await server.create_contact(ContactCreate(name=name, email=f"contact{i}@example.com", company=company))
+            for i, (name, company) in enumerate([("Ada Lovelace", "Initech"), ("Alan Turing", None), ("Grace Hopper", "Globex"), ("  ", "")])
+        ]
+        request = TemplateRenderRequest(contact_ids=[contact.id for contact in contacts] + ["unknown"])
+        return contacts, await server.render_email_template(template.id, request)
+
+    contacts, response = asyncio.run(scenario())
+    compiled = CompiledEmailTemplate(template.subject, template.body)
+    expected = {contact.id: compiled.render(server.template_context(contact.dict())) for contact in contacts}
+    assert {email.contact_id: (email.subject, email.body) for email in response.rendered} == expected
+    assert expected[contacts[1].id] == ("Hi Alan", "What are you working on?")
+    assert expected[contacts[3].id] == ("Hi there", "What are you working on?")
+    assert response.missing_contact_ids == ["unknown"]
@@ -0,0 +1,52 @@
+import asyncio
+
+from server import CoalescingWorkQueue
+
+
+def test_cancelled_backpressure_wait_keeps_the_merged_work():
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(key, payload):
+            await release.wait()
+            handled.append((key, payload))
+
+        queue = CoalescingWorkQueue("test", handler, lambda pending, new: pending + new, maxsize=1, workers=1)
+        queue.start()
+        await queue.put("a", 1)
+        await asyncio.sleep(0)  # the worker takes "a" and blocks in the handler
+        await queue.put("b", 1)  # fills the queue
+
+        waiting = asyncio.create_task(queue.put("c", 1))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+        await queue.put("c", 2)  # merges into the entry the cancelled put registered
+        release.set()
+        await queue.drain()
+        return handled, queue.stats()
+
+    handled, stats = asyncio.run(scenario())
+    assert handled == [("a", 1), ("b", 1), ("c", 3)]
+    assert (stats["cancelled"], stats["coalesced"], stats["processed"]) == (1, 1, 3)
+
+
+def test_puts_for_a_pending_key_coalesce():
+    async def scenario():
+        handled = []
+
+        async def handler(key, payload):
+            handled.append((key, payload))
+
+        queue = CoalescingWorkQueue("test", handler, lambda pending, new: pending + new, maxsize=10, workers=1)
+        queue.start()
+        for key, payload in [("a", 1), ("b", 1), ("a", 2), ("a", 3)]:
+            await queue.put(key, payload)
+        await queue.drain()
+        return handled, queue.stats()
+
+    handled, stats = asyncio.run(scenario())
+    assert handled == [("a", 6), ("b", 1)]
+    assert (stats["enqueued"], stats["coalesced"]) == (2, 2)